@@ -1,12 +1,15 @@
+import base64
+import json
 from datetime import datetime, timedelta, UTC
 
 from dateutil.tz import gettz
 from flask_bootstrap import Bootstrap5
 from flask import Flask, flash, request, redirect, render_template, session, url_for
+from markupsafe import escape
 import requests
 import timeago
 
-from src.streeteasymonitor.database import Database
+from src.streeteasymonitor.database import SORT_KEYS, Database
 from src.streeteasymonitor.config import Config
 
 from .forms import SearchForm
@@ -43,20 +46,55 @@ def create_app():
         except (ValueError, TypeError):
             return '0'
 
-    def get_stats(listings):
-        """Compute summary stats for listings."""
-        if not listings:
-            return {'total': 0, 'avg_price': 0, 'min_price': 0, 'max_price': 0, 'neighborhoods': 0}
-        prices = [float(l['price']) for l in listings if l.get('price')]
-        neighborhoods = set(l['neighborhood'] for l in listings if l.get('neighborhood'))
+    PAGE_SIZE = 50
+
+    def listing_filters(args):
+        """Sort and filter parameters for Database.get_listings_page from a request's query string."""
+        def number(name):
+            try:
+                return int(args[name]) if args.get(name) else None
+            except ValueError:
+                return None
+
+        sort = args.get('sort') if args.get('sort') in SORT_KEYS else 'created_at'
         return {
-            'total': len(listings),
-            'avg_price': sum(prices) / len(prices) if prices else 0,
-            'min_price': min(prices) if prices else 0,
-            'max_price': max(prices) if prices else 0,
-            'neighborhoods': len(neighborhoods),
+            'sort': sort,
+            'dir': 'asc' if args.get('dir') == 'asc' else 'desc',
+            'neighborhood': args.get('neighborhood') or None,
+            'min_price': number('min_price'),
+            'max_price': number('max_price'),
+            'q': args.get('q', '').strip() or None,
         }
 
+    def listings_page(args):
+        """Render context for one page of the listings table: rows, numbering and the next page's URL."""
+        filters = listing_filters(args)
+        after = None
+        if args.get('after'):
+            try:
+                after = json.loads(base64.urlsafe_b64decode(args['after']))
+            except ValueError:
+                after = None
+            if not (isinstance(after, list) and len(after) == 2):
+                after = None
+        try:
+            start = max(0, int(args.get('start', 0)))
+        except ValueError:
+            start = 0
+
+        rows, cursor = db.get_listings_page(
+            sort=filters['sort'], descending=filters['dir'] == 'desc', after=after, limit=PAGE_SIZE,
+            neighborhood=filters['neighborhood'], min_price=filters['min_price'],
+            max_price=filters['max_price'], query=filters['q'],
+        )
+        next_url = None
+        if cursor:
+            token = base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+            params = {key: value for key, value in filters.items() if value is not None}
+            next_url = url_for('listings', **params, after=token, start=start + len(rows))
+        filtered = any(filters[key] is not None for key in ('neighborhood', 'min_price', 'max_price', 'q'))
+        return {'listings': rows, 'start': start, 'next_url': next_url, 'filtered': filtered}
+
     @app.template_filter()
     def format_datetime(created_at):
         """Format date and time for current timezone."""
@@ -107,24 +145,32 @@ def create_app():
                     for listing in found_listings:
                         listing['created_at'] = datetime.now().isoformat()
                     print(f'Returning {len(found_listings)} listings for dry run')
-                    return render_template('table.html', listings=found_listings)
+                    return render_template('table.html', listings=found_listings, start=0, next_url=None)
                 else:
-                    db_listings = db.get_listings_sorted()
-                    print(f'Returning {len(db_listings)} listings from database')
-                    return render_template('table.html', listings=db_listings)
+                    return render_template('table.html', **listings_page({}))
 
             print('Invalid form submission\n')
             return redirect(url_for('index'))
 
-        listings = db.get_listings_sorted()
         return render_template(
             'index.html',
-            listings=listings,
-            stats=get_stats(listings),
+            **listings_page(request.args),
+            stats=db.get_listing_stats(),
+            neighborhoods=db.get_neighborhoods(),
             form=SearchForm(),  # Use defaults from Config
         )
     
 
+    @app.route('/listings', methods=['GET'])
+    def listings():
+        """One page of table rows (HTMX: re-sorting, filtering and infinite scroll)."""
+        return render_template('rows.html', **listings_page(request.args))
+
+    @app.route('/listings/<int:id>/description', methods=['GET'])
+    def description(id):
+        """A listing's description, loaded when its row is first expanded."""
+        return str(escape(db.get_description(id) or ''))
+
     @app.route('/<path:url>', methods=['GET'])
     def url(url):
         try:
@@ -32,22 +32,30 @@ document.addEventListener('DOMContentLoaded', function () {
 });
 
 function initSortableTable() {
+    const filters = document.getElementById('listing-filters');
     document.querySelectorAll('.sortable').forEach(header => {
         header.style.cursor = 'pointer';
         header.addEventListener('click', () => sortTable(header));
+        if (filters && header.dataset.sort === filters.elements.sort.value) {
+            showSortIcon(header, filters.elements.dir.value);
+        }
     });
 }
 
+// Sorting happens in the database: set the filter form's sort fields and reload the first page
 function sortTable(header) {
-    const table = header.closest('table');
-    const tbody = table.querySelector('tbody');
-    const rows = Array.from(tbody.querySelectorAll('tr'));
-    const colIndex = Array.from(header.parentNode.children).indexOf(header);
-    const type = header.dataset.type || 'string';
-
-    // Toggle sort direction
-    const isAsc = header.classList.contains('sorted-asc');
+    const filters = document.getElementById('listing-filters');
+    if (!filters) return;
+
+    const sameColumn = filters.elements.sort.value === header.dataset.sort;
+    const direction = sameColumn && filters.elements.dir.value === 'desc' ? 'asc' : 'desc';
+    filters.elements.sort.value = header.dataset.sort;
+    filters.elements.dir.value = direction;
+    showSortIcon(header, direction);
+    htmx.trigger(filters, 'submit');
+}
 
+function showSortIcon(header, direction) {
     // Clear all sort indicators
     header.parentNode.querySelectorAll('.sortable').forEach(th => {
         th.classList.remove('sorted-asc', 'sorted-desc');
@@ -55,38 +63,13 @@ function sortTable(header) {
         if (icon) icon.remove();
     });
 
-    const direction = isAsc ? 'desc' : 'asc';
     header.classList.add(`sorted-${direction}`);
-
     const icon = document.createElement('i');
     icon.className = direction === 'asc' ? 'bi bi-caret-up-fill ms-1' : 'bi bi-caret-down-fill ms-1';
     header.appendChild(icon);
-
-    rows.sort((a, b) => {
-        const aVal = a.children[colIndex]?.dataset.value || '';
-        const bVal = b.children[colIndex]?.dataset.value || '';
-
-        let comparison = 0;
-        if (type === 'number') {
-            comparison = (parseFloat(aVal) || 0) - (parseFloat(bVal) || 0);
-        } else if (type === 'date') {
-            comparison = new Date(aVal) - new Date(bVal);
-        } else {
-            comparison = aVal.localeCompare(bVal);
-        }
-
-        return direction === 'asc' ? comparison : -comparison;
-    });
-
-    rows.forEach(row => tbody.appendChild(row));
-
-    // Update row numbers
-    rows.forEach((row, i) => {
-        row.children[0].textContent = i + 1;
-    });
 }
 
-// Re-init sorting after HTMX swaps
-document.body.addEventListener('htmx:afterSwap', function() {
-    initSortableTable();
+// Re-init sorting when the whole table is swapped (not for pages appended to it)
+document.body.addEventListener('htmx:afterSwap', function(event) {
+    if (event.detail.target.id === 'table') initSortableTable();
 });
@@ -0,0 +1,30 @@
+"""
+Resident browser for StreetEasy Monitor.
+
+Keeps the persistent Chromium profile running and warmed up so that scheduled runs
+(with browser_daemon = True in config.py) attach to it instead of launching a browser.
+
+Usage:
+    python browser_daemon.py             # Listen on browser_daemon_port (default: 9222)
+    python browser_daemon.py --port 9333 # Listen on another port
+"""
+
+import argparse
+import sys
+
+from src.streeteasymonitor.config import Config
+from src.streeteasymonitor.daemon import BrowserDaemon
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='StreetEasy Monitor browser daemon')
+    parser.add_argument('--port', type=int, default=Config.browser_daemon_port,
+                        help=f'Remote debugging port (default: {Config.browser_daemon_port})')
+
+    args = parser.parse_args()
+
+    try:
+        BrowserDaemon(args.port).serve()
+    except KeyboardInterrupt:
+        print('\n\nBrowser daemon stopped by user.')
+        sys.exit(0)
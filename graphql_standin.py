@@ -0,0 +1,151 @@
+"""
+Local stand-in for StreetEasy's messaging GraphQL API.
+
+Answers startPageflow / finishPageflow (single or aliased in one request) and automatic
+persisted queries, so message delivery can be exercised without contacting anyone. Point
+the monitor at it with message_api_url = 'http://127.0.0.1:8765/' in config.py and run, e.g.,
+python scheduler.py --drain-outbox.
+
+Usage:
+    python graphql_standin.py                   # Listen on 127.0.0.1:8765
+    python graphql_standin.py --no-batching     # Reject requests with more than one operation
+    python graphql_standin.py --no-persisted    # Answer persisted-query hashes with PersistedQueryNotSupported
+    python graphql_standin.py --latency 200     # Add 200 ms to every response
+    python graphql_standin.py --reject-rate 0.1 # Refuse 10% of submissions with a KoiosErrorResponse
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Root fields of an operation, optionally aliased: `m0: startPageflow(request: $r0)`
+FIELD_PATTERN = re.compile(r'(?:(\w+)\s*:\s*)?(startPageflow|finishPageflow)\s*\(\s*request\s*:\s*\$(\w+)\s*\)')
+
+
+class StandIn:
+    """State shared by every request: registered queries, open pageflows and counters."""
+
+    def __init__(self, args) -> None:
+        self.args = args
+        self.queries = {}
+        self.pageflows = {}
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'operations': 0, 'bytes': 0, 'hash_only': 0, 'sent': 0}
+
+    def handle(self, body: dict) -> tuple[int, dict]:
+        query = body.get('query')
+        persisted = (body.get('extensions') or {}).get('persistedQuery')
+        if persisted:
+            if self.args.no_persisted:
+                return 200, error('PersistedQueryNotSupported', 'PERSISTED_QUERY_NOT_SUPPORTED')
+            sha = persisted.get('sha256Hash')
+            if query is None:
+                with self.lock:
+                    query = self.queries.get(sha)
+                    self.stats['hash_only'] += 1
+                if query is None:
+                    return 200, error('PersistedQueryNotFound', 'PERSISTED_QUERY_NOT_FOUND')
+            elif hashlib.sha256(query.encode()).hexdigest() != sha:
+                return 400, error('provided sha does not match query', 'BAD_USER_INPUT')
+            else:
+                with self.lock:
+                    self.queries[sha] = query
+        if not query:
+            return 400, error('Must provide query string.', 'BAD_USER_INPUT')
+
+        fields = FIELD_PATTERN.findall(query)
+        if not fields:
+            return 400, error('Unknown operation', 'GRAPHQL_VALIDATION_FAILED')
+        if len(fields) > 1 and self.args.no_batching:
+            return 400, error('Batched operations are not allowed', 'GRAPHQL_VALIDATION_FAILED')
+        with self.lock:
+            self.stats['operations'] += len(fields)
+
+        variables = body.get('variables') or {}
+        data = {}
+        for alias, field, variable in fields:
+            request = (variables.get(variable) or {})
+            data[alias or 'data'] = self.start(request) if field == 'startPageflow' else self.finish(request)
+        return 200, {'data': data}
+
+    def start(self, request: dict) -> dict:
+        if not (request.get('context') or {}).get('rental_id'):
+            return {'code': 400, 'message': 'rental_id is required', 'errorFields': ['rental_id']}
+        pageflow_id, reply_token = str(uuid.uuid4()), uuid.uuid4().hex
+        with self.lock:
+            self.pageflows[pageflow_id] = reply_token
+        return {'code': 200, 'pageflowId': pageflow_id, 'replyToken': reply_token}
+
+    def finish(self, request: dict) -> dict:
+        with self.lock:
+            reply_token = self.pageflows.get(request.get('pageflowId'))
+        if reply_token is None or reply_token != request.get('replyToken'):
+            return {'code': 404, 'message': 'Unknown pageflow', 'errorFields': []}
+        if random.random() < self.args.reject_rate:
+            return {'code': 422, 'message': 'Submission rejected', 'errorFields': ['message']}
+        with self.lock:
+            del self.pageflows[request['pageflowId']]
+            self.stats['sent'] += 1
+        return {'code': 200, 'returnConfig': {}}
+
+    def report(self) -> None:
+        stats = self.stats
+        print(f"{stats['requests']} requests, {stats['operations']} operations, {stats['bytes']} bytes received, "
+              f"{stats['hash_only']} sent by hash only, {stats['sent']} messages accepted")
+
+
+def error(message: str, code: str) -> dict:
+    return {'errors': [{'message': message, 'extensions': {'code': code}}]}
+
+
+def make_handler(standin: StandIn):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            raw = self.rfile.read(int(self.headers.get('content-length', 0)))
+            with standin.lock:
+                standin.stats['requests'] += 1
+                standin.stats['bytes'] += len(raw)
+            try:
+                status, body = standin.handle(json.loads(raw))
+            except (ValueError, AttributeError):
+                status, body = 400, error('Malformed request body', 'BAD_REQUEST')
+            time.sleep(standin.args.latency / 1000)
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('content-type', 'application/json')
+            self.send_header('content-length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            print(f'{self.address_string()} {format % args}')
+
+    return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stand-in for the StreetEasy messaging GraphQL API')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on (default: 8765)')
+    parser.add_argument('--no-batching', action='store_true', help='Reject requests carrying several operations')
+    parser.add_argument('--no-persisted', action='store_true', help='Refuse persisted-query hashes')
+    parser.add_argument('--latency', type=float, default=0, help='Milliseconds added to every response')
+    parser.add_argument('--reject-rate', type=float, default=0, help='Fraction of submissions to refuse')
+
+    args = parser.parse_args()
+    standin = StandIn(args)
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(standin))
+    print(f'GraphQL stand-in listening on http://127.0.0.1:{args.port}/')
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+        standin.report()
+        sys.exit(0)
@@ -1,12 +1,54 @@
+import asyncio
+
+from src.streeteasymonitor.database import Database
+from src.streeteasymonitor.matcher import KeywordMatcher
 from src.streeteasymonitor.monitor import Monitor
+from src.streeteasymonitor.messager import Messager
 from src.streeteasymonitor.config import Config
 
 
-def main(**kwargs):
+def main(profiles=None, **kwargs):
+    if getattr(Config, 'use_async', False):
+        return asyncio.run(async_main(profiles, **kwargs))
+
     with Monitor(**kwargs) as monitor:
-        monitor.run()
+        monitor.run(profiles)
+        return monitor.listings
+
+
+async def async_main(profiles=None, **kwargs):
+    from src.streeteasymonitor.aio import AsyncMonitor
+
+    async with AsyncMonitor(**kwargs) as monitor:
+        await monitor.run(profiles)
         return monitor.listings
 
 
+def drain_outbox():
+    """Deliver queued and retry-due messages without running a search."""
+    monitor = Monitor()
+    try:
+        Messager(monitor, []).send_messages()
+    finally:
+        monitor.session.close()
+        monitor.db.close()
+
+
+def rescreen():
+    """List contacted listings whose stored description matches the current description_filters."""
+    db = Database()
+    try:
+        keywords = getattr(Config, 'description_filters', [])
+        matches = db.rescreen_listings(keywords)
+        matcher = KeywordMatcher.compile(keywords)
+        for listing in matches:
+            rule = matcher.find(listing['description'] or '')
+            print(f"  {listing['address']} ({listing['neighborhood']}, ${listing['price']}) - description contains '{rule}'")
+        print(f'{len(matches)} of {db.count_listings()} contacted listings match the current description filters')
+        return matches
+    finally:
+        db.close()
+
+
 if __name__ == '__main__':
-    main(**Config.defaults)
+    main(Config.profiles(), **Config.defaults)
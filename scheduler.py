@@ -6,6 +6,10 @@ Usage:
     python scheduler.py              # Run every 8 minutes (default)
     python scheduler.py --interval 5 # Run every 5 minutes
     python scheduler.py --once       # Run once and exit
+    python scheduler.py --full-sweep # Ignore pagination watermarks and check every page
+    python scheduler.py --profile brooklyn  # Only run the named search profile(s)
+    python scheduler.py --drain-outbox      # Deliver queued messages, then exit
+    python scheduler.py --rescreen          # Check stored descriptions against the current description_filters
 """
 
 import argparse
@@ -13,37 +17,37 @@ import time
 import sys
 from datetime import datetime
 
-from main import main
+from main import drain_outbox, main, rescreen
 from src.streeteasymonitor.config import Config
 
 
-def run_monitor():
-    """Run the monitor and handle any errors."""
+def run_monitor(profile_names=None):
+    """Run the monitor (every selected search profile in one session) and handle any errors."""
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     print(f'\n{"="*60}')
     print(f'[{timestamp}] Starting monitor run...')
     print(f'{"="*60}\n')
 
     try:
-        main(**Config.defaults)
+        main(Config.profiles(profile_names), **Config.defaults)
         print(f'\n[{timestamp}] Monitor run completed successfully.')
     except Exception as e:
         print(f'\n[{timestamp}] Error during monitor run: {e}')
 
 
-def scheduler(interval_minutes: int):
+def scheduler(interval_minutes: int, profile_names=None):
     """Run the monitor on a schedule."""
     print(f'StreetEasy Monitor Scheduler')
     print(f'Running every {interval_minutes} minutes. Press Ctrl+C to stop.\n')
 
     # Run immediately on start
-    run_monitor()
+    run_monitor(profile_names)
 
     while True:
         try:
             # Sleep for the interval
             time.sleep(interval_minutes * 60)
-            run_monitor()
+            run_monitor(profile_names)
         except KeyboardInterrupt:
             print('\n\nScheduler stopped by user.')
             sys.exit(0)
@@ -55,10 +59,25 @@ if __name__ == '__main__':
                         help='Minutes between runs (default: 8)')
     parser.add_argument('--once', action='store_true',
                         help='Run once and exit')
+    parser.add_argument('--full-sweep', action='store_true',
+                        help='Ignore pagination watermarks and check every page')
+    parser.add_argument('--profile', action='append', dest='profiles',
+                        help='Search profile to run (repeatable, default: all profiles)')
+    parser.add_argument('--drain-outbox', action='store_true',
+                        help='Deliver queued and retry-due messages without searching, then exit')
+    parser.add_argument('--rescreen', action='store_true',
+                        help='List contacted listings whose description matches the current description_filters, then exit')
 
     args = parser.parse_args()
 
-    if args.once:
-        run_monitor()
+    if args.full_sweep:
+        Config.force_full_sweep = True
+
+    if args.drain_outbox:
+        drain_outbox()
+    elif args.rescreen:
+        rescreen()
+    elif args.once:
+        run_monitor(args.profiles)
     else:
-        scheduler(args.interval)
+        scheduler(args.interval, args.profiles)
@@ -0,0 +1,492 @@
+"""asyncio-native variant of the monitor pipeline built on patchright.async_api.
+
+Waits are awaitable and independent network operations (results pages, listing descriptions and
+message POSTs) run concurrently on a single event loop. Parsing, filtering and the messaging
+payloads are shared with the synchronous pipeline.
+"""
+
+import asyncio
+import json
+import random
+import time
+import traceback
+
+from patchright.async_api import async_playwright
+
+from .api import APIError
+from .challenge import ChallengeDetector
+from .config import Config
+from .daemon import daemon_endpoint, session_is_warm, write_state
+from .messager import Messager
+from .monitor import COOKIE_URLS, Monitor, write_cookies
+from .search import RESULTS_PAGE_JS, Parser, Search
+from .server import solve_headed_async
+from .shards import ShardPlanner
+from .utils import get_datetime
+
+
+class AsyncMonitor(Monitor):
+    """Monitor whose browser, search and messaging run on an asyncio event loop."""
+
+    async def __aenter__(self):
+        self._browser_lock = asyncio.Lock()
+        # Shared by every search's tab: only one tab can hold the mouse at a time
+        self._solve_lock = asyncio.Lock()
+        # In http mode the browser is only launched if the API path hits a challenge
+        if getattr(Config, 'search_mode', 'browser') != 'http':
+            await self.start_browser()
+        return self
+
+    async def start_browser(self):
+        """Launch the persistent Chromium context and warm up the session (no-op if already running)."""
+        # Concurrent searches may all fall back to the browser at once
+        async with self._browser_lock:
+            if self.context:
+                return
+            self.playwright = await async_playwright().start()
+            endpoint = await asyncio.to_thread(daemon_endpoint) if getattr(Config, 'browser_daemon', False) else None
+            if endpoint:
+                self.browser = await self.playwright.chromium.connect_over_cdp(endpoint)
+                self.context = self.browser.contexts[0]
+                self.page = await self.context.new_page()
+                print(f'Attached to browser daemon at {endpoint}')
+            else:
+                if getattr(Config, 'browser_daemon', False):
+                    print('Browser daemon not running, launching a browser for this run.')
+                self.context = await self.playwright.chromium.launch_persistent_context(**self.launch_options())
+                self.page = self.context.pages[0] if self.context.pages else await self.context.new_page()
+            if self.blocker:
+                await self.blocker.attach_async(self.context)
+            ChallengeDetector.for_page(self.page)
+            self.memory.start()
+
+            if self.browser and session_is_warm(await self.context.cookies(COOKIE_URLS)):
+                print('Session clearance still valid, skipping warm-up.')
+            else:
+                await self._warmup()
+                if self.browser:
+                    write_state(warmed_at=time.time())
+
+    async def _warmup(self):
+        """Visit StreetEasy homepage first to establish cookies and session."""
+        print('Warming up browser session...')
+        await self.page.goto('https://streeteasy.com/', wait_until='domcontentloaded', timeout=30000)
+        await asyncio.sleep(random.uniform(2, 4))
+        search = AsyncSearch.__new__(AsyncSearch)
+        search.monitor = self
+        search.page = self.page
+        search._solve_lock = self._solve_lock
+        if await search._is_bot_check():
+            print('  Bot check on homepage — solving...')
+            await search._wait_for_bot_check()
+            await asyncio.sleep(random.uniform(1, 2))
+
+    async def _save_cookies(self):
+        """Export the browser's cookies and user agent so later runs can use the API directly."""
+        try:
+            write_cookies(
+                await self.context.cookies(COOKIE_URLS),
+                await self.page.evaluate('navigator.userAgent'),
+            )
+        except Exception as e:
+            print(f'  Could not save browser cookies: {e}')
+
+    async def __aexit__(self, *args, **kwargs):
+        try:
+            if self.context:
+                await self._save_cookies()
+            if self.browser:
+                if self.blocker:
+                    await self.context.unroute('**/*', self.blocker.handle_async)
+                await self.page.close()
+            elif self.context:
+                await self.context.close()
+        except Exception:
+            pass
+        if self.context and self.blocker:
+            self.blocker.report()
+        if self.context:
+            ChallengeDetector.report()
+            self.memory.stop()
+            self.memory.report()
+        if self.playwright:
+            await self.playwright.stop()
+        self.session.close()
+        self.db.close()
+
+    async def run(self, profiles=None):
+        """Run every shard of one or more search profiles concurrently, messaging listings as they are found.
+
+        Args:
+            profiles (list[tuple[str, dict]]): (name, search parameters) pairs (defaults to the monitor's kwargs).
+        """
+        profiles = profiles or [(None, self.kwargs)]
+        planner = ShardPlanner(self.db)
+        shards = [(shard, kwargs) for _, kwargs in profiles for shard in planner.plan(kwargs)]
+        self.searches = [AsyncSearch(self, shard.kwargs(kwargs), own_tab=len(shards) > 1) for shard, kwargs in shards]
+
+        # Searches hand each batch to the outbox sender as soon as it passes the filters;
+        # listings found by more than one search are already dropped by the claimed-ID check.
+        # The sender runs on its own threads; submit and finish are called via asyncio.to_thread
+        self.messager = Messager(self, [])
+        self.messager.start()
+        completed = False
+        try:
+            results = await asyncio.gather(*(search.fetch(sink=self.messager.submit) for search in self.searches))
+            completed = True
+        finally:
+            await asyncio.to_thread(self.messager.finish, completed)
+
+        for (shard, _), search in zip(shards, self.searches):
+            shard.count = search.result_count
+        planner.record([shard for shard, _ in shards])
+        self.listings = [listing for listings in results for listing in listings]
+
+
+class AsyncSearch(Search):
+    """Search that loads results pages and listing descriptions concurrently."""
+
+    def __init__(self, monitor, kwargs=None, own_tab=False) -> None:
+        """Initializes the search.
+
+        Args:
+            monitor (AsyncMonitor): The owning monitor.
+            kwargs (dict): Search parameters overriding the monitor's keyword arguments.
+            own_tab (bool): Use a separate tab instead of the monitor's main page, so several searches can run at once.
+        """
+        super().__init__(monitor, kwargs)
+        self.own_tab = own_tab
+        self._sink = None
+        self._solve_lock = monitor._solve_lock
+
+    async def _is_bot_check(self, page=None) -> bool:
+        """Check if the current page (or the given tab) is a bot detection challenge."""
+        page = page or self.page
+        return await ChallengeDetector.for_page(page).is_challenged_async()
+
+    async def _find_challenge_target(self, page):
+        """Find the element to press and hold, returning (element, bounding box)."""
+        # Strategy 1: Cloudflare Turnstile iframe
+        for frame in page.frames:
+            if 'challenges.cloudflare.com' in frame.url or 'turnstile' in frame.url:
+                for sel in ['body', '#challenge-stage', 'input', 'button', 'div']:
+                    try:
+                        el = await frame.query_selector(sel)
+                        box = await el.bounding_box() if el else None
+                        if box and box['width'] > 0:
+                            return el, box
+                    except Exception:
+                        continue
+
+        # Strategy 2: any visible challenge-like iframe (PerimeterX injects iframes with no src)
+        for iframe in await page.query_selector_all('iframe'):
+            try:
+                box = await iframe.bounding_box()
+                if box and box['width'] > 40 and box['height'] > 20:
+                    src = await iframe.get_attribute('src') or ''
+                    if not src or any(s in src for s in ('challenge', 'captcha', 'turnstile', 'cloudflare', 'px')):
+                        return iframe, box
+            except Exception:
+                continue
+
+        # Strategy 3: any visible button/clickable on the main page
+        for sel in ['[class*="challenge"]', '[id*="challenge"]', 'button:visible', '[role="button"]:visible']:
+            try:
+                el = await page.query_selector(sel)
+                if el and await el.is_visible():
+                    box = await el.bounding_box()
+                    if box and box['width'] > 20:
+                        return el, box
+            except Exception:
+                continue
+
+        return None, None
+
+    async def _try_solve_press_and_hold(self, page=None) -> bool:
+        """Attempt to solve a press-and-hold CAPTCHA automatically."""
+        page = page or self.page
+        try:
+            target, box = await self._find_challenge_target(page)
+            if not target or not box:
+                print('  Could not find any challenge element.')
+                return False
+
+            x = box['x'] + box['width'] / 2
+            y = box['y'] + box['height'] / 2
+
+            # Human-like mouse movement
+            await page.mouse.move(random.uniform(100, 400), random.uniform(100, 400))
+            await asyncio.sleep(random.uniform(0.3, 0.7))
+            await page.mouse.move(x + random.uniform(-5, 5), y + random.uniform(-5, 5))
+            await asyncio.sleep(random.uniform(0.1, 0.3))
+
+            # Press and hold
+            print(f'  Pressing and holding at ({x:.0f}, {y:.0f})...')
+            await page.mouse.down()
+            await asyncio.sleep(random.uniform(8, 13))
+            await page.mouse.up()
+            return True
+
+        except Exception as e:
+            print(f'  Auto-solve error: {e}')
+        return False
+
+    async def _wait_for_bot_check(self, timeout=90, page=None) -> bool:
+        """If a bot check is present, try to solve it automatically, then fall back to manual.
+        Returns True if page is ready."""
+        page = page or self.page
+        detector = ChallengeDetector.for_page(page)
+        if not await detector.is_challenged_async():
+            return True
+
+        # Only one tab can hold the mouse at a time (the lock is the monitor's, shared by every search)
+        async with self._solve_lock:
+            if not await detector.is_challenged_async():
+                return True
+
+            print('  Bot check detected — attempting automatic solve...')
+            await page.bring_to_front()
+            await asyncio.sleep(2)
+
+            for attempt in range(3):
+                await self._try_solve_press_and_hold(page)
+                if await detector.wait_until_cleared_async(timeout=5):
+                    print('  Bot check passed automatically!')
+                    return True
+                print(f'  Auto-solve attempt {attempt + 1} failed.')
+
+            monitor = getattr(self, 'monitor', None)
+            if getattr(Config, 'server_mode', False) and monitor and monitor.playwright:
+                # Nobody can see a headless tab; hand the challenge to a headed window if allowed
+                if getattr(Config, 'headed_fallback', False) and await solve_headed_async(monitor.playwright, page, timeout):
+                    print('  Bot check passed!')
+                    return True
+            else:
+                print('  Please solve the challenge manually in the browser window.')
+                if await detector.wait_until_cleared_async(timeout=timeout):
+                    print('  Bot check passed!')
+                    return True
+
+        print(f'  Bot check not resolved within {timeout}s.')
+        return False
+
+    async def _capture_rental_ids(self, response):
+        """Intercept GraphQL API responses to extract rental IDs and listing details."""
+        if 'api-v6.streeteasy.com' not in response.url:
+            return
+        try:
+            self._record_search_results(await response.json())
+        except Exception:
+            pass
+
+    async def fetch(self, sink=None) -> list[dict[str, str]]:
+        """Check the search URL for new listings, paginating through all results.
+
+        Args:
+            sink (callable): Called (in a worker thread) with each page's or batch's new listings as soon as they pass the filters.
+        """
+        print(f'Running script with parameters:\n{json.dumps(self.parameters, indent=2)}\n')
+        print(f'Base URL: {self.url}')
+        self._sink = sink
+        collected = []
+
+        if getattr(Config, 'search_mode', 'browser') == 'http':
+            try:
+                # The API client is synchronous; keep it off the event loop
+                return await asyncio.to_thread(self._drain_http, collected)
+            except APIError as e:
+                print(f'{get_datetime()} API search failed ({e}), falling back to browser.\n')
+
+        await self.monitor.start_browser()
+        self.page = await self.monitor.context.new_page() if self.own_tab else self.monitor.page
+        try:
+            return collected + await self._fetch_browser()
+        finally:
+            if self.own_tab:
+                await self.page.close()
+
+    def _drain_http(self, collected) -> list[dict[str, str]]:
+        for page_listings in self._stream_http():
+            collected.extend(page_listings)
+            if self._sink:
+                self._sink(page_listings)
+        return collected
+
+    async def _load_page(self, tab, page_num: int, delay: float) -> str | None:
+        """Navigate a tab to a results page and return its HTML, or None to stop."""
+        await asyncio.sleep(delay)
+        print(f'\n--- Page {page_num} ---')
+        print(f'URL: {self._page_url(page_num)}')
+        await tab.goto(self._page_url(page_num), wait_until='domcontentloaded', timeout=60000)
+
+        if not await self._wait_for_bot_check(page=tab):
+            print('Stopping due to bot detection.')
+            return None
+
+        try:
+            await tab.wait_for_selector('[data-testid="listing-card"]', timeout=15000)
+        except Exception:
+            try:
+                empty = Search._is_empty_results(
+                    await tab.evaluate(RESULTS_PAGE_JS), await ChallengeDetector.for_page(tab).is_challenged_async()
+                )
+            except Exception:
+                empty = False
+            if empty:
+                print(f'No listings found on page {page_num}, stopping pagination.')
+                self._completed = True
+            else:
+                print(f'Page {page_num} did not load as a results page, stopping pagination.')
+            return None
+
+        return await tab.content()
+
+    async def _fetch_browser(self) -> list[dict[str, str]]:
+        """Load batches of results pages concurrently in a pool of tabs."""
+        all_listings = []
+        page_num = 1
+        seen_ids = set()
+        seen_listings = []
+        self._load_watermark()
+
+        context = self.page.context
+        context.on('response', self._capture_rental_ids)
+        concurrency = max(1, getattr(Config, 'page_concurrency', 1))
+        tabs = [self.page] + [await context.new_page() for _ in range(concurrency - 1)]
+        for tab in tabs:
+            ChallengeDetector.for_page(tab)
+        first_batch = True
+
+        try:
+            done = False
+            while not done:
+                if not first_batch and self.monitor.memory.over_limit():
+                    tabs = await self._recycle_tabs(tabs)
+
+                # Stagger tab starts; every batch after the first also waits out the per-tab pacing
+                delays = []
+                for i in range(len(tabs)):
+                    delay = 0 if first_batch else random.uniform(*Config.tab_pacing)
+                    delays.append(delay + i * random.uniform(*Config.tab_stagger))
+                first_batch = False
+
+                batch = list(enumerate(tabs, start=page_num))
+                contents = await asyncio.gather(
+                    *(self._load_page(tab, num, delay) for (num, tab), delay in zip(batch, delays))
+                )
+
+                candidates = []
+                observed, known, judged = [], {}, set()
+                parser = None
+                for (num, _), content in zip(batch, contents):
+                    if content is None:
+                        done = True
+                        break
+                    page_num = num
+                    parser = Parser(content.encode(), self.db, None, self.kwargs, self._rental_id_map, self._listing_details)
+
+                    parsed_all = [parser.parse(card) for card in parser.cards()]
+                    new_card_ids = [p['listing_id'] for p in parsed_all if p['listing_id'] not in seen_ids]
+                    seen_ids.update(p['listing_id'] for p in parsed_all)
+                    seen_listings.extend(parsed_all)
+                    observed.extend(parsed_all)
+                    known.update(self.history.lookup(parsed_all))
+
+                    if not new_card_ids:
+                        print(f'No new unique cards on page {num}, stopping pagination.')
+                        self._completed = True
+                        done = True
+                        break
+
+                    if self._below_watermark(parsed_all):
+                        print(f'Page {num} is entirely below last run\'s watermark, stopping pagination.')
+                        done = True
+                        break
+
+                    unclaimed = self._unclaimed(parsed_all)
+                    judged.update(self._ids(unclaimed))
+                    page_candidates = self._prefilter(unclaimed, parser, known)
+                    print(f'Found {len(page_candidates)} candidate listings on page {num}')
+                    candidates.extend(page_candidates)
+
+                batch_listings = self._claim(await self._check_descriptions(candidates, parser))
+                self.history.record(observed, judged, self._ids(batch_listings), known)
+                all_listings.extend(batch_listings)
+                if batch_listings and self._sink:
+                    # submit() may block for back-pressure; only this search waits on it
+                    await asyncio.to_thread(self._sink, batch_listings)
+
+                if not done:
+                    page_num += 1
+
+        except Exception as e:
+            print(f'{get_datetime()} Error fetching page: {e}\n')
+            traceback.print_exc()
+
+        context.remove_listener('response', self._capture_rental_ids)
+        for tab in tabs[1:]:
+            try:
+                await tab.close()
+            except Exception:
+                pass
+
+        if self.result_count is None and self._completed:
+            self.result_count = len(seen_ids)
+        self._save_watermark(seen_ids, seen_listings)
+        self.listings = all_listings
+        self.history.report()
+
+        if not self.listings:
+            print(f'{get_datetime()} No new listings.\n')
+        else:
+            print(f'\nTotal: {len(self.listings)} listings across {page_num} page(s)')
+
+        return self.listings
+
+    async def _recycle_tabs(self, tabs) -> list:
+        """Replace this search's extra tabs to free their renderers' memory.
+
+        Other searches may be using the context concurrently, so it is never relaunched here.
+        """
+        before = self.monitor.memory.current_mb
+        for tab in tabs[1:]:
+            try:
+                await tab.close()
+            except Exception:
+                pass
+        await self.page.goto('about:blank')
+        tabs = [self.page] + [await self.page.context.new_page() for _ in range(len(tabs) - 1)]
+        for tab in tabs:
+            ChallengeDetector.for_page(tab)
+        print(f'  Recycled tabs ({before:.0f} MB -> {self.monitor.memory.sample():.0f} MB)')
+        return tabs
+
+    async def _check_descriptions(self, candidates, parser) -> list[dict[str, str]]:
+        """Fetch uncached candidate descriptions concurrently and apply the description keyword filter."""
+        if not candidates or not getattr(Config, 'description_filters', []):
+            return candidates
+
+        urls = self._load_cached_descriptions(candidates)
+        semaphore = asyncio.Semaphore(max(1, getattr(Config, 'description_concurrency', 1)))
+        descriptions = await asyncio.gather(*(self.get_description(url, semaphore) for url in urls))
+        self._descriptions.update(zip(urls, descriptions))
+
+        return self._judge_descriptions(candidates, parser)
+
+    async def get_description(self, url: str, semaphore: asyncio.Semaphore) -> str:
+        """Fetch the description from a listing's detail page in its own tab, solving a bot check if one appears."""
+        if not url:
+            return ''
+        async with semaphore:
+            tab = await self.page.context.new_page()
+            ChallengeDetector.for_page(tab)
+            try:
+                await asyncio.sleep(random.uniform(*Config.description_pacing))
+                await tab.goto(url, wait_until='domcontentloaded', timeout=30000)
+                await self._wait_for_bot_check(page=tab)
+                await tab.wait_for_selector('[data-testid="listing-details-description"], [class*="Description"]', timeout=10000)
+                return Parser.extract_description(await tab.content())
+            except Exception:
+                return ''
+            finally:
+                await tab.close()
@@ -0,0 +1,200 @@
+import json
+import os
+
+import requests
+
+
+class APIError(Exception):
+    """The API returned something other than search results."""
+
+
+class ChallengeError(APIError):
+    """The API answered with a bot-detection challenge instead of data."""
+
+
+def parse_rental_node(node: dict) -> dict:
+    """Convert a searchRentals edge node into the listing details used by the parser."""
+    return {
+        'beds': node.get('bedroomCount'),
+        'baths': (node.get('fullBathroomCount', 0) or 0) + (node.get('halfBathroomCount', 0) or 0) * 0.5,
+        'status': (node.get('status') or '').capitalize(),
+        'building_type': (node.get('buildingType') or '').replace('_', ' ').capitalize(),
+        'source': node.get('sourceGroupLabel', ''),
+        'listed_at': node.get('listedAt') or '',
+    }
+
+
+class RentalsAPI:
+    """Browserless client for the searchRentals GraphQL query that backs every results page.
+
+    Attributes:
+        api_url (str): StreetEasy's GraphQL endpoint.
+        challenge_markers (tuple[str]): Substrings that identify a challenge page in a response body.
+    """
+
+    api_url = 'https://api-v6.streeteasy.com/'
+    per_page = 50
+
+    challenge_markers = (
+        'captcha',
+        'press & hold',
+        'verify you are human',
+        'just a moment',
+        'attention required',
+    )
+
+    search_query = """
+        query SearchRentals($input: SearchRentalsInput!) {
+            searchRentals(input: $input) {
+                totalCount
+                edges {
+                    ... on OrganicRentalEdge {
+                        node {
+                            id
+                            urlPath
+                            street
+                            unit
+                            areaName
+                            price
+                            bedroomCount
+                            fullBathroomCount
+                            halfBathroomCount
+                            status
+                            buildingType
+                            sourceGroupLabel
+                            listedAt
+                        }
+                    }
+                }
+            }
+        }
+    """
+
+    def __init__(self, session, cookies_path: str = None) -> None:
+        """Initializes the client.
+
+        Args:
+            session (requests.Session): Pooled session shared with the rest of the monitor.
+            cookies_path (str): JSON file of cookies exported from the persistent browser profile.
+        """
+        self.session = session
+        self.cookies_path = cookies_path
+        self.load_cookies()
+
+    def load_cookies(self) -> bool:
+        """Copy cookies (and the matching user agent) saved by the browser into the session."""
+        if not self.cookies_path or not os.path.exists(self.cookies_path):
+            return False
+        try:
+            with open(self.cookies_path, 'r') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        for cookie in saved.get('cookies', []):
+            self.session.cookies.set(
+                cookie['name'],
+                cookie['value'],
+                domain=cookie.get('domain', ''),
+                path=cookie.get('path', '/'),
+            )
+        # Clearance cookies are tied to the browser that earned them
+        if saved.get('user_agent'):
+            self.session.headers['user-agent'] = saved['user_agent']
+        return True
+
+    def _check_challenge(self, r) -> None:
+        """Raise ChallengeError if the response looks like a bot check."""
+        if r.status_code in (403, 429, 503):
+            raise ChallengeError(f'HTTP {r.status_code}')
+        content_type = r.headers.get('content-type', '')
+        if 'html' in content_type:
+            body = r.text[:5000].lower()
+            if any(marker in body for marker in RentalsAPI.challenge_markers):
+                raise ChallengeError('challenge page returned')
+
+    def build_variables(self, kwargs: dict, codes: list[str], page_num: int) -> dict:
+        """Translate search keyword arguments into searchRentals input variables."""
+        filters = {
+            'rentalStatus': 'ACTIVE',
+            'areas': [int(code) for code in codes],
+            'price': {'lowerBound': kwargs['min_price'], 'upperBound': kwargs['max_price']},
+            'bedrooms': {'lowerBound': kwargs['min_beds'], 'upperBound': kwargs['max_beds']},
+            'bathrooms': {'lowerBound': kwargs['baths']},
+        }
+        if kwargs.get('amenities'):
+            filters['amenities'] = [amenity.upper() for amenity in kwargs['amenities']]
+        if kwargs.get('no_fee'):
+            filters['noFee'] = True
+
+        return {
+            'input': {
+                'filters': filters,
+                'page': page_num,
+                'perPage': RentalsAPI.per_page,
+                'sorting': {'attribute': 'LISTED_AT', 'direction': 'DESCENDING'},
+            }
+        }
+
+    def search(self, kwargs: dict, codes: list[str], page_num: int = 1) -> tuple[list[dict], int]:
+        """Fetch one page of search results.
+
+        Returns:
+            tuple[list[dict], int]: The edge nodes on the page and the total result count.
+
+        Raises:
+            APIError: The request failed, or the API answered with something other than results.
+        """
+        payload = {
+            'query': RentalsAPI.search_query,
+            'variables': self.build_variables(kwargs, codes, page_num),
+        }
+        try:
+            r = self.session.post(RentalsAPI.api_url, json=payload, timeout=30)
+        except requests.RequestException as e:
+            # Connection errors and timeouts fall back to the browser like any other API failure
+            raise APIError(f'request failed ({e.__class__.__name__}: {e})') from e
+        self._check_challenge(r)
+
+        try:
+            body = r.json()
+        except ValueError:
+            raise APIError(f'non-JSON response (HTTP {r.status_code})')
+        if body.get('errors'):
+            raise APIError(body['errors'][0].get('message', 'GraphQL error'))
+
+        results = (body.get('data') or {}).get('searchRentals') or {}
+        nodes = [edge['node'] for edge in results.get('edges', []) if edge.get('node')]
+        return nodes, results.get('totalCount', 0)
+
+    def get_html(self, url: str) -> str:
+        """Fetch a StreetEasy page (e.g. a listing detail page) without a browser."""
+        r = self.session.get(url, headers={'accept': 'text/html'}, timeout=30)
+        self._check_challenge(r)
+        r.raise_for_status()
+        return r.text
+
+    @staticmethod
+    def to_listing(node: dict) -> dict:
+        """Build a listing dict (same shape as Parser.parse) from an edge node."""
+        url = f"https://streeteasy.com{node.get('urlPath', '')}"
+        address = node.get('street') or ''
+        if node.get('unit'):
+            address = f"{address} #{node['unit']}"
+
+        price = node.get('price')
+        price = str(int(price)) if isinstance(price, (int, float)) else ''
+
+        details = parse_rental_node(node)
+
+        return {
+            'listing_id': str(node.get('id', '')),
+            'url': url,
+            'price': price,
+            'address': address,
+            'neighborhood': node.get('areaName') or '',
+            'beds': details['beds'] if details['beds'] is not None else '',
+            'baths': details['baths'],
+            'building_type': details['building_type'],
+            'source': details['source'],
+        }
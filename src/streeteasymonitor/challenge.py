@@ -0,0 +1,210 @@
+import time
+import weakref
+from urllib.parse import urlparse
+
+from .config import Config
+
+
+class ChallengeDetector:
+    """Event-driven bot-check detection for one page.
+
+    Instead of serializing and scanning the whole DOM, a page is flagged by cheap signals: challenge
+    frames attaching or navigating (Cloudflare/PerimeterX hosts in Config.allowed_hosts), document
+    responses with challenge status codes or a `cf-mitigated: challenge` header, and a single
+    targeted selector probe plus the page title. Waiting for a challenge to clear is done with
+    page.wait_for_function, which resolves in the browser as soon as the markers disappear.
+
+    Attributes:
+        probe_selector (str): Elements that only exist while a challenge is showing.
+        title_markers (tuple[str]): Lowercase substrings of challenge page titles.
+        clear_times (list[float]): Seconds each challenge took to clear, since the last report.
+    """
+
+    probe_selector = ', '.join([
+        '#px-captcha',
+        '#challenge-form',
+        '#challenge-stage',
+        '#cf-challenge-running',
+        'iframe[src*="challenges.cloudflare.com"]',
+        'iframe[src*="captcha"]',
+    ])
+
+    title_markers = ('just a moment', 'attention required')
+
+    cleared_js = """
+        ([selector, markers]) => {
+            const title = document.title.toLowerCase();
+            return !document.querySelector(selector) && !markers.some(m => title.includes(m));
+        }
+    """
+
+    clear_times = []
+
+    _registry = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def for_page(cls, page):
+        """Return the detector attached to a page, attaching one on first use."""
+        detector = cls._registry.get(page)
+        if detector is None:
+            detector = cls._registry[page] = cls(page)
+        return detector
+
+    def __init__(self, page) -> None:
+        self.page = page
+        self.hosts = tuple(Config.allowed_hosts)
+        self.document_challenged = False
+        self.challenge_frames = set()
+        self.reason = ''
+        self.detected_at = None
+        self.waiting = False
+
+        page.on('request', self._on_request)
+        page.on('response', self._on_response)
+        page.on('frameattached', self._on_frame)
+        page.on('framenavigated', self._on_frame)
+        page.on('framedetached', self._on_frame_detached)
+
+    @property
+    def flagged(self) -> bool:
+        return self.document_challenged or bool(self.challenge_frames)
+
+    def _is_challenge_url(self, url: str) -> bool:
+        host = urlparse(url).hostname or ''
+        return any(host == h or host.endswith('.' + h) for h in self.hosts)
+
+    def _flag(self, reason: str) -> None:
+        if not self.flagged:
+            self.reason = reason
+        if self.detected_at is None:
+            self.detected_at = time.time()
+
+    def _on_request(self, request) -> None:
+        # A new top-level navigation starts a fresh document: the only place event flags are reset.
+        # While a challenge is being waited on, its timer carries over the reload that solving it triggers.
+        try:
+            if request.is_navigation_request() and request.frame == self.page.main_frame:
+                self.document_challenged = False
+                self.challenge_frames.clear()
+                if not self.waiting:
+                    self.detected_at = None
+                    self.reason = ''
+        except Exception:
+            pass
+
+    def _on_response(self, response) -> None:
+        try:
+            request = response.request
+            if request.resource_type != 'document':
+                return
+            if response.headers.get('cf-mitigated') == 'challenge':
+                self._flag('cf-mitigated header')
+                self.document_challenged = True
+            elif request.frame == self.page.main_frame and response.status in (403, 429, 503):
+                self._flag(f'HTTP {response.status}')
+                self.document_challenged = True
+        except Exception:
+            pass
+
+    def _on_frame(self, frame) -> None:
+        if frame.url and self._is_challenge_url(frame.url):
+            self._flag(f'challenge frame {urlparse(frame.url).hostname}')
+            self.challenge_frames.add(frame)
+
+    def _on_frame_detached(self, frame) -> None:
+        self.challenge_frames.discard(frame)
+
+    def _probe_hit(self, found_element, title: str) -> bool:
+        if found_element:
+            self._flag('challenge element on page')
+            return True
+        if any(marker in title.lower() for marker in ChallengeDetector.title_markers):
+            self._flag('challenge page title')
+            return True
+        return False
+
+    def _record_clear(self) -> None:
+        if self.detected_at is not None:
+            elapsed = time.time() - self.detected_at
+            ChallengeDetector.clear_times.append(elapsed)
+            print(f'  Challenge ({self.reason or "probe"}) cleared after {elapsed:.1f}s')
+        self.detected_at = None
+        self.reason = ''
+
+    def is_challenged(self) -> bool:
+        """Check event flags first, then one selector probe and the title (sync API)."""
+        if self.flagged:
+            return True
+        try:
+            return self._probe_hit(self.page.query_selector(ChallengeDetector.probe_selector), self.page.title())
+        except Exception:
+            return False
+
+    async def is_challenged_async(self) -> bool:
+        """Check event flags first, then one selector probe and the title (async API)."""
+        if self.flagged:
+            return True
+        try:
+            return self._probe_hit(await self.page.query_selector(ChallengeDetector.probe_selector), await self.page.title())
+        except Exception:
+            return False
+
+    def wait_until_cleared(self, timeout: float) -> bool:
+        """Block until the challenge markers are gone and no event flags the page (sync API).
+
+        Returns False on timeout. A clean DOM alone isn't enough: a challenge response or frame
+        without markers stays flagged until the page navigates to a fresh document.
+        """
+        deadline = time.time() + timeout
+        self.waiting = True
+        try:
+            while (remaining := deadline - time.time()) > 0 and not self.page.is_closed():
+                try:
+                    self.page.wait_for_function(
+                        ChallengeDetector.cleared_js,
+                        arg=[ChallengeDetector.probe_selector, list(ChallengeDetector.title_markers)],
+                        timeout=remaining * 1000,
+                    )
+                except Exception:
+                    # Timed out, or the challenge navigated and destroyed the context: re-check the new document
+                    continue
+                if self.flagged:
+                    self.page.wait_for_timeout(min(500, remaining * 1000))
+                    continue
+                self._record_clear()
+                return True
+            return False
+        finally:
+            self.waiting = False
+
+    async def wait_until_cleared_async(self, timeout: float) -> bool:
+        """Async counterpart of wait_until_cleared."""
+        deadline = time.time() + timeout
+        self.waiting = True
+        try:
+            while (remaining := deadline - time.time()) > 0 and not self.page.is_closed():
+                try:
+                    await self.page.wait_for_function(
+                        ChallengeDetector.cleared_js,
+                        arg=[ChallengeDetector.probe_selector, list(ChallengeDetector.title_markers)],
+                        timeout=remaining * 1000,
+                    )
+                except Exception:
+                    continue
+                if self.flagged:
+                    await self.page.wait_for_timeout(min(500, remaining * 1000))
+                    continue
+                self._record_clear()
+                return True
+            return False
+        finally:
+            self.waiting = False
+
+    @classmethod
+    def report(cls) -> None:
+        """Print how long challenges took to clear since the last report, then reset."""
+        if cls.clear_times:
+            total = sum(cls.clear_times)
+            print(f'Challenges cleared: {len(cls.clear_times)} '
+                  f'(total {total:.1f}s, slowest {max(cls.clear_times):.1f}s)')
+        cls.clear_times = []
@@ -31,12 +31,200 @@ class Config:
         'no_fee': False,
     }
 
+    # Named search profiles, run back to back in one browser session by main.py and scheduler.py.
+    # Each profile overrides keys of `defaults`; leave empty to run `defaults` alone. Example:
+    #     search_profiles = {
+    #         'downtown': {},
+    #         'brooklyn': {'areas': ['Bushwick', 'Williamsburg'], 'max_price': 3000},
+    #     }
+    search_profiles = {}
+
+    # Split wide searches into shards (area groups, then halves of areas, then price bands) that
+    # run independently and merge by listing_id. A shard is only split once a run has observed
+    # more than shard_target_results results for it. Area groups with fewer than
+    # shard_min_group_areas areas are merged into a neighbouring group. Price bands never get
+    # narrower than shard_min_price_band.
+    shard_searches = True
+    shard_target_results = 500
+    shard_min_group_areas = 3
+    shard_min_price_band = 250
+
     # Set to True to preview listings without sending messages
     dry_run = True
 
     # Set to True to export listings to CSV file in data/ folder
     export_csv = True
 
+    # 'browser' renders each results page in Chromium.
+    # 'http' queries StreetEasy's searchRentals API directly (reusing cookies saved from the
+    # browser profile) and only launches the browser if the API fails or a challenge comes back.
+    search_mode = 'browser'
+
+    # Random delay range (seconds) between API result pages
+    api_page_delay = (0.5, 1.5)
+
+    # Number of separate tabs (or HTTP workers) fetching listing descriptions concurrently
+    description_concurrency = 3
+
+    # Random delay range (seconds) between description fetches on the same tab
+    description_pacing = (1.5, 3)
+
+    # HTML parser backend: 'lxml' (fast, optional dependency) or 'bs4' (BeautifulSoup reference)
+    parser_backend = 'lxml'
+
+    # Set to True to also run the bs4 reference backend and print any difference in parsed output
+    parser_parity_check = False
+
+    # Cache listing descriptions (and their filter verdicts) in the database between runs.
+    # Cached descriptions are re-fetched after description_cache_ttl_hours; entries unused for
+    # description_cache_idle_days are evicted, and the cache is capped at description_cache_size rows.
+    description_cache = True
+    description_cache_ttl_hours = 24
+    description_cache_idle_days = 14
+    description_cache_size = 20000
+
+    # Keep a history of every listing the searches observe (first/last seen, price changes, filter
+    # verdict). Unchanged rows are rewritten at most every seen_touch_minutes, and an unchanged
+    # listing already rejected under the same search and filters isn't judged again
+    seen_history = True
+    seen_touch_minutes = 60
+
+    # Contacted listing IDs are indexed in memory once per run. Up to contacted_exact_limit IDs are
+    # kept in a set; beyond that a Bloom filter (contacted_fp_rate false positives, each confirmed
+    # against the database) keeps memory flat as the history grows.
+    contacted_exact_limit = 200000
+    contacted_fp_rate = 0.01
+
+    # SQLite connections are reused per thread, with the database in WAL mode so the dashboard can
+    # read while a run writes. Writers wait up to sqlite_busy_timeout_ms for each other; the page
+    # cache, memory map and prepared-statement cache are per connection
+    sqlite_busy_timeout_ms = 5000
+    sqlite_cache_size_kb = 8192
+    sqlite_mmap_size_mb = 64
+    sqlite_cached_statements = 256
+
+    # Set to True to run the asyncio pipeline (patchright.async_api), which overlaps page loads,
+    # description fetches and message POSTs on one event loop
+    use_async = False
+
+    # Number of listings in flight at once while messaging
+    message_concurrency = 4
+
+    # Token bucket shared by every messaging POST (two per listing): sustained rate, and how many
+    # may go out back to back when a batch of listings arrives at once
+    message_rate_per_minute = 30
+    message_burst = 8
+
+    # Listings to message are queued in an outbox table and delivered by a background sender.
+    # A failed delivery is retried after outbox_backoff_seconds, doubling each attempt (capped at
+    # outbox_backoff_max_seconds), until outbox_max_attempts. A claimed row is only picked up by
+    # another sender once outbox_lease_seconds have passed (e.g. after a crash).
+    outbox_max_attempts = 5
+    outbox_backoff_seconds = 60
+    outbox_backoff_max_seconds = 3600
+    outbox_lease_seconds = 300
+    outbox_poll_seconds = 2
+
+    # Each results page's listings are queued for messaging as soon as the page is filtered. The
+    # search pauses while more than this many of them are still waiting for the sender (0 = never)
+    stream_max_pending = 50
+
+    # Listings whose pageflows are started (and then finished) together in one aliased GraphQL
+    # request; 1 sends each listing on its own. Falls back to 1 if the API rejects batches
+    message_batch_size = 1
+
+    # Send the persisted-query hash instead of the full query text once the API has seen it
+    # (automatic persisted queries); switched off for the run if the API doesn't support them
+    message_persisted_queries = True
+
+    # GraphQL endpoint messages are sent to (e.g. http://127.0.0.1:8765/ for graphql_standin.py)
+    message_api_url = 'https://api-v6.streeteasy.com/'
+
+    # Times a POST is retried after a 429, waiting out Retry-After (or 5s, 10s, 20s... without one)
+    message_max_retries = 3
+
+    # Number of browser tabs that load results pages concurrently
+    page_concurrency = 3
+
+    # Random delay range (seconds) between navigations on the same tab
+    tab_pacing = (3, 7)
+
+    # Random delay range (seconds) between starting navigations on different tabs
+    tab_stagger = (0.5, 1.5)
+
+    # Stop paginating once a results page holds nothing newer than the previous run's watermark
+    # (results are sorted newest first). A full sweep still runs every full_sweep_minutes.
+    watermark_stop = True
+    full_sweep_minutes = 120
+
+    # Most listing IDs kept in a watermark (this run's plus earlier runs', newest first)
+    watermark_max_ids = 2000
+
+    # Set to True to ignore the watermark and sweep every page on the next run
+    force_full_sweep = False
+
+    # Attach to a resident browser (started with `python browser_daemon.py`) over CDP instead of
+    # launching Chromium for every run. Runs fall back to launching their own browser if the daemon
+    # isn't listening on browser_daemon_port.
+    browser_daemon = False
+    browser_daemon_port = 9222
+
+    # Seconds between the daemon's health checks, and how long one Chromium instance may live
+    browser_daemon_check_interval = 30
+    browser_daemon_max_age_hours = 12
+
+    # Attached runs skip the homepage warm-up while one of these clearance cookies is unexpired
+    # (or, if none is set, for warmup_ttl_minutes after the last warm-up)
+    clearance_cookies = ['cf_clearance', '_px3', '_pxhd']
+    warmup_ttl_minutes = 30
+
+    # Server mode: headless Chromium with a fixed small viewport and memory-saving flags, for
+    # small Linux VMs without a display. A challenge that can't be solved automatically is shown
+    # in a temporary headed window if headed_fallback is on (and a display is available).
+    server_mode = False
+    server_viewport = {'width': 1280, 'height': 800}
+    server_browser_args = [
+        '--disable-dev-shm-usage',
+        '--disable-gpu',
+        '--disable-extensions',
+        '--disable-background-networking',
+        '--disable-component-update',
+        '--disable-features=Translate,MediaRouter,OptimizationHints,BackForwardCache',
+        '--renderer-process-limit=2',
+        '--js-flags=--max-old-space-size=256',
+        '--disk-cache-size=1',
+        '--mute-audio',
+        '--no-first-run',
+    ]
+    headed_fallback = True
+
+    # Browser memory (MB, measured from /proc) above which results tabs are recycled between
+    # batches, and then the whole context if that isn't enough. None disables recycling.
+    browser_memory_limit_mb = 1200
+
+    # Seconds between browser memory samples (the run's peak is printed at exit)
+    memory_sample_interval = 1.0
+
+    # Abort non-essential browser requests (see network.ResourceBlocker) and report the savings
+    block_resources = True
+
+    # Resource types aborted on every host except the allowed (challenge) hosts
+    blocked_resource_types = ['image', 'media', 'font']
+
+    # Requests to any other host are aborted unless it is an allowed host
+    first_party_hosts = ['streeteasy.com']
+
+    # Bot-check hosts whose scripts and iframes must always load
+    allowed_hosts = [
+        'challenges.cloudflare.com',
+        'perimeterx.net',
+        'px-cdn.net',
+        'px-cloud.net',
+        'pxchk.net',
+        'px-client.net',
+        'hcaptcha.com',
+    ]
+
     filters = {
         'url': [
             '?featured=1',
@@ -87,6 +275,17 @@ class Config:
             'origin': 'https://streeteasy.com',
         }
 
+    @classmethod
+    def profiles(cls, names=None):
+        """Return (name, search parameters) pairs for the selected profiles (all of them by default)."""
+        if not cls.search_profiles:
+            return [('default', dict(cls.defaults))]
+        names = names or list(cls.search_profiles)
+        unknown = [name for name in names if name not in cls.search_profiles]
+        if unknown:
+            raise KeyError(f"Unknown search profile(s): {', '.join(unknown)}")
+        return [(name, {**cls.defaults, **cls.search_profiles[name]}) for name in names]
+
     def get_field_values(self):
         return {
             'message': self.env('MESSAGE', default=''),
@@ -0,0 +1,97 @@
+import hashlib
+import math
+import threading
+
+from .config import Config
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings.
+
+    Attributes:
+        capacity (int): Number of items the filter was sized for.
+        size (int): Number of bits.
+        hashes (int): Number of bit positions set per item.
+    """
+
+    def __init__(self, capacity: int, fp_rate: float) -> None:
+        self.capacity = max(capacity, 1)
+        self.size = max(int(-self.capacity * math.log(fp_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(round(self.size / self.capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class ContactedIndex:
+    """Run-scoped index of listing IDs that have already been contacted.
+
+    Loaded from the database once per run and kept current as listings are inserted, so every
+    results page and filter shares one lookup instead of reloading the listings table. Histories up
+    to Config.contacted_exact_limit IDs are held in a set; larger ones go into a Bloom filter, and
+    its positives are confirmed with an indexed lookup on listings.listing_id.
+    """
+
+    def __init__(self, db) -> None:
+        self.db = db
+        self.lock = threading.Lock()
+        self.exact = None
+        self.bloom = None
+        self.confirmed = set()  # IDs known to be contacted (Bloom positives checked, or added this run)
+        self.lookups = 0
+        self.load()
+
+    def load(self) -> None:
+        """(Re)build the index from the listings table."""
+        total = self.db.count_listings()
+        if total <= Config.contacted_exact_limit:
+            self.exact = set(self.db.iter_existing_ids())
+            self.bloom = None
+        else:
+            # Leave room for the history to keep growing before a rebuild
+            self.bloom = BloomFilter(total * 2, Config.contacted_fp_rate)
+            for listing_id in self.db.iter_existing_ids():
+                self.bloom.add(listing_id)
+            self.exact = None
+        self.confirmed = set()
+
+    def add(self, listing_id: str) -> None:
+        """Record a listing contacted during this run."""
+        with self.lock:
+            if self.exact is not None:
+                self.exact.add(listing_id)
+                return
+            self.confirmed.add(listing_id)
+            self.bloom.add(listing_id)
+            if self.bloom.count > self.bloom.capacity:
+                self.load()
+
+    def __contains__(self, listing_id: str) -> bool:
+        if self.exact is not None:
+            return listing_id in self.exact
+        if listing_id in self.confirmed:
+            return True
+        if listing_id not in self.bloom:
+            return False
+        self.lookups += 1
+        if self.db.has_listing(listing_id):
+            self.confirmed.add(listing_id)
+            return True
+        return False
+
+    def __len__(self) -> int:
+        return len(self.exact) if self.exact is not None else self.bloom.count
@@ -0,0 +1,148 @@
+"""Resident browser service that keeps a warmed Chromium context alive between runs.
+
+The daemon launches the persistent profile with a local remote-debugging port; monitor runs
+attach to it over CDP (see Monitor.start_browser) instead of launching and warming their own
+browser, and only open and close their own tabs.
+"""
+
+import json
+import os
+import time
+from datetime import datetime, UTC
+
+import requests
+
+from .config import Config
+
+# Written by the daemon (and by attached runs after a warm-up) so runs can tell how fresh the session is
+STATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data', 'browser_daemon.json')
+
+
+def read_state() -> dict:
+    try:
+        with open(os.path.abspath(STATE_PATH), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_state(**values) -> None:
+    state = read_state()
+    state.update(values)
+    with open(os.path.abspath(STATE_PATH), 'w') as f:
+        json.dump(state, f)
+
+
+def daemon_endpoint(port: int = None) -> str | None:
+    """Return the CDP endpoint of a running browser daemon, or None if nothing answers on the port.
+
+    Args:
+        port (int): Remote-debugging port to probe (defaults to Config.browser_daemon_port).
+    """
+    endpoint = f'http://127.0.0.1:{port or Config.browser_daemon_port}'
+    try:
+        r = requests.get(f'{endpoint}/json/version', timeout=2)
+        r.raise_for_status()
+        r.json()['webSocketDebuggerUrl']
+    except (requests.RequestException, ValueError, KeyError):
+        return None
+    return endpoint
+
+
+def session_is_warm(cookies: list[dict]) -> bool:
+    """Whether the context's bot-check clearance is still good enough to skip the homepage warm-up.
+
+    True if a clearance cookie is present and not about to expire. If StreetEasy hasn't set any
+    clearance cookie, fall back to how recently the session was last warmed.
+    """
+    now = time.time()
+    clearance = [c for c in cookies if c.get('name') in Config.clearance_cookies]
+    if clearance:
+        return any(c.get('expires', -1) == -1 or c['expires'] > now + 60 for c in clearance)
+    warmed_at = read_state().get('warmed_at')
+    return bool(warmed_at) and now - warmed_at < Config.warmup_ttl_minutes * 60
+
+
+class BrowserDaemon:
+    """Keeps one persistent Chromium context running, warm and healthy.
+
+    Attributes:
+        port (int): Local remote-debugging port runs attach to.
+        monitor (Monitor): Monitor whose launch options, warm-up and cookie export the daemon reuses.
+        started_at (float): When the current Chromium instance was launched.
+    """
+
+    def __init__(self, port: int = None) -> None:
+        from .monitor import Monitor
+
+        self.port = port or Config.browser_daemon_port
+        self.monitor = Monitor()
+        self.started_at = None
+
+    def start(self) -> None:
+        from patchright.sync_api import sync_playwright
+
+        monitor = self.monitor
+        monitor.playwright = sync_playwright().start()
+        options = monitor.launch_options()
+        options['args'] = options['args'] + [
+            f'--remote-debugging-port={self.port}',
+            '--remote-debugging-address=127.0.0.1',
+        ]
+        monitor.context = monitor.playwright.chromium.launch_persistent_context(**options)
+        monitor.page = monitor.context.pages[0] if monitor.context.pages else monitor.context.new_page()
+        self.started_at = time.time()
+        print(f'{datetime.now(UTC):%Y-%m-%d %H:%M:%S} Browser daemon listening on 127.0.0.1:{self.port}')
+        self.warm()
+
+    def warm(self) -> None:
+        self.monitor._warmup()
+        self.monitor._save_cookies()
+        write_state(port=self.port, pid=os.getpid(), warmed_at=time.time())
+
+    def stop(self) -> None:
+        monitor = self.monitor
+        try:
+            if monitor.context:
+                monitor._save_cookies()
+                monitor.context.close()
+        except Exception:
+            pass
+        if monitor.playwright:
+            try:
+                monitor.playwright.stop()
+            except Exception:
+                pass
+        monitor.context = monitor.page = monitor.playwright = None
+
+    def restart(self, reason: str) -> None:
+        print(f'{datetime.now(UTC):%Y-%m-%d %H:%M:%S} Restarting Chromium ({reason})')
+        self.stop()
+        self.start()
+
+    def healthy(self) -> bool:
+        """Check the keeper tab still evaluates script and the CDP endpoint still answers."""
+        page = self.monitor.page
+        try:
+            if page is None or page.is_closed() or page.evaluate('1 + 1') != 2:
+                return False
+        except Exception:
+            return False
+        return daemon_endpoint(self.port) is not None
+
+    def serve(self) -> None:
+        """Run until interrupted, restarting Chromium when it stops responding or gets too old."""
+        self.start()
+        try:
+            while True:
+                time.sleep(Config.browser_daemon_check_interval)
+                if not self.healthy():
+                    self.restart('unhealthy')
+                elif time.time() - self.started_at > Config.browser_daemon_max_age_hours * 3600:
+                    self.restart('scheduled recycle')
+                elif not session_is_warm(self.monitor.context.cookies()):
+                    print('Session clearance expired, warming up again...')
+                    self.warm()
+        finally:
+            self.stop()
+            self.monitor.session.close()
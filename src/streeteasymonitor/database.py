@@ -1,61 +1,809 @@
+import json
 import os
+import re
 import sqlite3
+import threading
+import weakref
+from contextlib import contextmanager
+
+from .config import Config
+from .contacted import ContactedIndex
+from .utils import to_number
+
+
+def _add_listing_columns(conn):
+    # Databases from before these columns existed
+    existing = {row[1] for row in conn.execute('PRAGMA table_info(listings)')}
+    for col, col_type in [('beds', 'REAL'), ('baths', 'REAL'), ('building_type', 'TEXT'), ('source', 'TEXT'), ('description', 'TEXT')]:
+        if col not in existing:
+            conn.execute(f'ALTER TABLE listings ADD COLUMN {col} {col_type}')
+
+
+def _create_listings_fts(conn):
+    # External-content FTS5 index over listings; the triggers keep it in step with every write
+    if not conn.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')").fetchone()[0]:
+        print('SQLite was built without FTS5; description search will scan the listings table')
+        return
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS listings_fts USING fts5(
+            description, address, neighborhood,
+            content='listings', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS listings_fts_insert AFTER INSERT ON listings BEGIN
+            INSERT INTO listings_fts (rowid, description, address, neighborhood)
+            VALUES (new.id, new.description, new.address, new.neighborhood);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS listings_fts_delete AFTER DELETE ON listings BEGIN
+            INSERT INTO listings_fts (listings_fts, rowid, description, address, neighborhood)
+            VALUES ('delete', old.id, old.description, old.address, old.neighborhood);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS listings_fts_update AFTER UPDATE OF description, address, neighborhood ON listings BEGIN
+            INSERT INTO listings_fts (listings_fts, rowid, description, address, neighborhood)
+            VALUES ('delete', old.id, old.description, old.address, old.neighborhood);
+            INSERT INTO listings_fts (rowid, description, address, neighborhood)
+            VALUES (new.id, new.description, new.address, new.neighborhood);
+        END
+    """)
+    conn.execute("INSERT INTO listings_fts (listings_fts) VALUES ('rebuild')")
+
+
+def _create_listing_stats(conn):
+    # One-row summary of the listings table plus per-neighborhood counts, kept current by triggers
+    # so the dashboard header is a single-row read. Min/max are re-read from idx_listings_price
+    # when a row leaves the table (an index seek, not a scan).
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS listing_stats (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total INTEGER NOT NULL,
+            priced INTEGER NOT NULL,
+            price_sum REAL NOT NULL,
+            min_price REAL,
+            max_price REAL,
+            neighborhoods INTEGER NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS neighborhood_counts (
+            neighborhood TEXT PRIMARY KEY,
+            listings INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+    _backfill_listing_stats(conn)
+
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS neighborhood_counts_insert AFTER INSERT ON neighborhood_counts BEGIN
+            UPDATE listing_stats SET neighborhoods = neighborhoods + 1 WHERE id = 1;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS neighborhood_counts_delete AFTER DELETE ON neighborhood_counts BEGIN
+            UPDATE listing_stats SET neighborhoods = neighborhoods - 1 WHERE id = 1;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS listing_stats_insert AFTER INSERT ON listings BEGIN
+            UPDATE listing_stats SET
+                total = total + 1,
+                priced = priced + (new.price IS NOT NULL),
+                price_sum = price_sum + COALESCE(new.price, 0),
+                min_price = CASE WHEN min_price IS NULL OR new.price < min_price THEN COALESCE(new.price, min_price) ELSE min_price END,
+                max_price = CASE WHEN max_price IS NULL OR new.price > max_price THEN COALESCE(new.price, max_price) ELSE max_price END
+            WHERE id = 1;
+            INSERT INTO neighborhood_counts (neighborhood, listings)
+            SELECT new.neighborhood, 1 WHERE new.neighborhood != ''
+            ON CONFLICT(neighborhood) DO UPDATE SET listings = listings + 1;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS listing_stats_delete AFTER DELETE ON listings BEGIN
+            UPDATE listing_stats SET
+                total = total - 1,
+                priced = priced - (old.price IS NOT NULL),
+                price_sum = price_sum - COALESCE(old.price, 0),
+                min_price = (SELECT MIN(price) FROM listings),
+                max_price = (SELECT MAX(price) FROM listings)
+            WHERE id = 1;
+            UPDATE neighborhood_counts SET listings = listings - 1 WHERE neighborhood = old.neighborhood;
+            DELETE FROM neighborhood_counts WHERE neighborhood = old.neighborhood AND listings <= 0;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS listing_stats_update_price AFTER UPDATE OF price ON listings BEGIN
+            UPDATE listing_stats SET
+                priced = priced - (old.price IS NOT NULL) + (new.price IS NOT NULL),
+                price_sum = price_sum - COALESCE(old.price, 0) + COALESCE(new.price, 0),
+                min_price = (SELECT MIN(price) FROM listings),
+                max_price = (SELECT MAX(price) FROM listings)
+            WHERE id = 1;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS listing_stats_update_neighborhood AFTER UPDATE OF neighborhood ON listings
+        WHEN old.neighborhood IS NOT new.neighborhood BEGIN
+            UPDATE neighborhood_counts SET listings = listings - 1 WHERE neighborhood = old.neighborhood;
+            DELETE FROM neighborhood_counts WHERE neighborhood = old.neighborhood AND listings <= 0;
+            INSERT INTO neighborhood_counts (neighborhood, listings)
+            SELECT new.neighborhood, 1 WHERE new.neighborhood != ''
+            ON CONFLICT(neighborhood) DO UPDATE SET listings = listings + 1;
+        END
+    """)
+
+
+def _backfill_listing_stats(conn):
+    # Recount listing_stats and neighborhood_counts from scratch
+    conn.execute('DELETE FROM neighborhood_counts')
+    conn.execute("""
+        INSERT INTO neighborhood_counts (neighborhood, listings)
+        SELECT neighborhood, COUNT(*) FROM listings WHERE neighborhood != '' GROUP BY neighborhood
+    """)
+    conn.execute("""
+        INSERT OR REPLACE INTO listing_stats (id, total, priced, price_sum, min_price, max_price, neighborhoods)
+        SELECT 1, COUNT(*), COUNT(price), COALESCE(SUM(price), 0), MIN(price), MAX(price),
+               (SELECT COUNT(*) FROM neighborhood_counts)
+        FROM listings
+    """)
+
+
+# Schema migrations, applied in order. PRAGMA user_version holds the number already applied, so
+# opening an up-to-date database runs nothing. Append new steps; never edit ones that have shipped.
+# Each step is a list of SQL statements and/or callables taking the connection.
+MIGRATIONS = [
+    # 1: the schema as it was before versioning (IF NOT EXISTS, so existing databases are adopted)
+    [
+        """
+            CREATE TABLE IF NOT EXISTS listings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                listing_id TEXT UNIQUE,
+                url TEXT,
+                price REAL,
+                address TEXT,
+                neighborhood TEXT,
+                beds REAL,
+                baths REAL,
+                building_type TEXT,
+                source TEXT
+            )
+        """,
+        """
+            CREATE TABLE IF NOT EXISTS search_state (
+                search_key TEXT PRIMARY KEY,
+                newest_ids TEXT,
+                listed_at TEXT,
+                last_full_sweep TEXT,
+                updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """,
+        """
+            CREATE TABLE IF NOT EXISTS description_cache (
+                url TEXT PRIMARY KEY,
+                listing_id TEXT,
+                description TEXT,
+                content_hash TEXT,
+                verdict INTEGER,
+                rules_hash TEXT,
+                fetched_at TEXT NOT NULL,
+                last_used_at TEXT NOT NULL
+            )
+        """,
+        'CREATE INDEX IF NOT EXISTS idx_description_cache_last_used ON description_cache (last_used_at)',
+        """
+            CREATE TABLE IF NOT EXISTS outbox (
+                listing_id TEXT PRIMARY KEY,
+                listing TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                pageflow_id TEXT,
+                reply_token TEXT,
+                last_error TEXT,
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """,
+        'CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (state, next_attempt_at)',
+        """
+            CREATE TABLE IF NOT EXISTS shard_stats (
+                shard_key TEXT PRIMARY KEY,
+                result_count INTEGER NOT NULL,
+                updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """,
+        _add_listing_columns,
+    ],
+    # 2: indexes for the dashboard's newest-first sort, neighborhood filter and price stats
+    [
+        'CREATE INDEX IF NOT EXISTS idx_listings_created_at ON listings (created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_listings_neighborhood ON listings (neighborhood, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_listings_price ON listings (price)',
+        'ANALYZE listings',
+    ],
+    # 3: history of every listing observed by a search, with its price changes
+    [
+        """
+            CREATE TABLE IF NOT EXISTS seen_listings (
+                listing_id TEXT PRIMARY KEY,
+                url TEXT,
+                address TEXT,
+                neighborhood TEXT,
+                price REAL,
+                beds REAL,
+                baths REAL,
+                building_type TEXT,
+                content_hash TEXT NOT NULL,
+                rules_hash TEXT,
+                verdict INTEGER,
+                price_history TEXT NOT NULL DEFAULT '[]',
+                first_seen_at TEXT NOT NULL,
+                last_seen_at TEXT NOT NULL
+            )
+        """,
+        'CREATE INDEX IF NOT EXISTS idx_seen_listings_last_seen ON seen_listings (last_seen_at)',
+    ],
+    # 4: full-text search over contacted listings' descriptions, backfilled from the description cache
+    [
+        """
+            UPDATE listings SET description = (
+                SELECT description FROM description_cache
+                WHERE description_cache.listing_id = listings.listing_id AND description != ''
+                ORDER BY last_used_at DESC LIMIT 1
+            )
+            WHERE description IS NULL
+        """,
+        _create_listings_fts,
+    ],
+    # 5: the dashboard's sort keys (see SORT_KEYS), so every sort order is paginated from an index
+    [
+        'CREATE INDEX IF NOT EXISTS idx_listings_price_key ON listings (COALESCE(price, -1))',
+        'CREATE INDEX IF NOT EXISTS idx_listings_beds_key ON listings (COALESCE(beds, -1))',
+        'CREATE INDEX IF NOT EXISTS idx_listings_baths_key ON listings (COALESCE(baths, -1))',
+        "CREATE INDEX IF NOT EXISTS idx_listings_address_key ON listings (COALESCE(address, ''))",
+        "CREATE INDEX IF NOT EXISTS idx_listings_neighborhood_key ON listings (COALESCE(neighborhood, ''))",
+    ],
+    # 6: dashboard header stats, maintained by triggers instead of aggregated on every page load
+    [
+        _create_listing_stats,
+    ],
+    # 7: blank prices, beds and baths were stored as '' (TEXT), which aggregates, price filters and
+    # the stats triggers treat as values; store them as NULL and recount the stats
+    [
+        "UPDATE listings SET price = NULL WHERE typeof(price) NOT IN ('integer', 'real', 'null')",
+        "UPDATE listings SET beds = NULL WHERE typeof(beds) NOT IN ('integer', 'real', 'null')",
+        "UPDATE listings SET baths = NULL WHERE typeof(baths) NOT IN ('integer', 'real', 'null')",
+        _backfill_listing_stats,
+    ],
+]
+
+# Listing fields stored as REAL (see insert_listings)
+NUMERIC_COLUMNS = ('price', 'beds', 'baths')
+
+# Columns the dashboard table shows (descriptions are loaded separately, on demand)
+LISTING_COLUMNS = 'id, created_at, listing_id, url, price, address, neighborhood, beds, baths, building_type, source'
+
+# Sortable dashboard columns -> SQL sort key. Nullable columns are coalesced so keyset
+# comparisons never meet a NULL; id breaks ties so every row has a unique position.
+SORT_KEYS = {
+    'created_at': 'created_at',
+    'price': 'COALESCE(price, -1)',
+    'beds': 'COALESCE(beds, -1)',
+    'baths': 'COALESCE(baths, -1)',
+    'address': "COALESCE(address, '')",
+    'neighborhood': "COALESCE(neighborhood, '')",
+}
+
+# A search box term: a "quoted phrase" or a bare word, optionally ending in * for a prefix match
+QUERY_TERM = re.compile(r'"([^"]*)"(\*?)|(\S+)')
+
+
+def fts_query(text: str) -> str:
+    """Turn search box input into an FTS5 query.
+
+    Words are ANDed, "quoted phrases" match in order, a trailing * matches a prefix and OR
+    between terms matches either. Everything else is quoted, so input can't be an FTS5 syntax error.
+    """
+    parts = []
+    for phrase, phrase_prefix, word in QUERY_TERM.findall(text):
+        if word == 'OR':
+            if parts and parts[-1] != 'OR':
+                parts.append('OR')
+            continue
+        prefix = phrase_prefix or ('*' if word.endswith('*') else '')
+        term = phrase if not word else word.rstrip('*')
+        # Punctuation-only terms have no tokens to match
+        if any(ch.isalnum() for ch in term):
+            parts.append('"' + term.replace('"', '""') + '"' + prefix)
+    while parts and parts[-1] == 'OR':
+        parts.pop()
+    return ' '.join(parts)
+
+
+def fts_any(keywords) -> str:
+    """FTS5 query matching a description that contains any of the keyword phrases."""
+    phrases = ['"' + keyword.replace('"', '""') + '"' for keyword in keywords if keyword.strip()]
+    return f"description : ({' OR '.join(phrases)})" if phrases else ''
+
+
+class _ThreadConnection:
+    """Holds one thread's connection in Database._local and closes it when the thread ends."""
+
+    def __init__(self, conn) -> None:
+        self.conn = conn
+        self.close = weakref.finalize(self, conn.close)
 
 
 class Database:
+    """SQLite storage shared by the monitor and the dashboard.
+
+    Each thread reuses one connection (see connection()). The file is in WAL mode, so the
+    dashboard's reads and a running monitor's writes don't block each other. Connections are
+    in autocommit mode; writes are grouped with transaction().
+    """
+
     def __init__(self):
         self.base_dir = os.path.dirname(os.path.abspath(__file__))
         self.data_dir = os.path.join(self.base_dir, '../..', 'data')
         self.db_path = os.path.join(self.data_dir, 'db.sqlite3')
 
         os.makedirs(self.data_dir, exist_ok=True)
-        self.create_table()
+        self._local = threading.local()
+        self._statements = {}
+        self.migrate()
+        self._contacted = None
 
-    def create_table(self):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS listings (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                    listing_id TEXT UNIQUE,
-                    url TEXT,
-                    price REAL,
-                    address TEXT,
-                    neighborhood TEXT,
-                    beds REAL,
-                    baths REAL,
-                    building_type TEXT,
-                    source TEXT
-                )
-            """)
-            # Add new columns to existing tables
-            for col, col_type in [('beds', 'REAL'), ('baths', 'REAL'), ('building_type', 'TEXT'), ('source', 'TEXT'), ('description', 'TEXT')]:
-                try:
-                    cursor.execute(f'ALTER TABLE listings ADD COLUMN {col} {col_type}')
-                except sqlite3.OperationalError:
-                    pass  # Column already exists
-            conn.commit()
+    def connection(self):
+        """Return this thread's connection to the database, opening and configuring it on first use.
+
+        The connection is closed when its thread ends (the dashboard serves each request on a
+        new thread), or by close().
+        """
+        holder = getattr(self._local, 'holder', None)
+        if holder is None:
+            # check_same_thread is off only because the finalizer may run on whichever thread
+            # drops the last reference; each connection is still used by the thread that opened it
+            conn = sqlite3.connect(
+                self.db_path,
+                timeout=Config.sqlite_busy_timeout_ms / 1000,
+                isolation_level=None,
+                check_same_thread=False,
+                cached_statements=Config.sqlite_cached_statements,
+            )
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')  # Durable at checkpoints; safe against corruption in WAL mode
+            conn.execute(f'PRAGMA busy_timeout = {int(Config.sqlite_busy_timeout_ms)}')
+            conn.execute(f'PRAGMA cache_size = -{int(Config.sqlite_cache_size_kb)}')
+            conn.execute(f'PRAGMA mmap_size = {int(Config.sqlite_mmap_size_mb) * 1024 * 1024}')
+            conn.execute('PRAGMA temp_store = MEMORY')
+            holder = self._local.holder = _ThreadConnection(conn)
+        return holder.conn
+
+    @contextmanager
+    def transaction(self):
+        """Run a group of writes in one transaction on this thread's connection.
+
+        BEGIN IMMEDIATE takes the write lock up front, so two writers wait on busy_timeout
+        instead of failing when a read transaction tries to upgrade.
+        """
+        conn = self.connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def close(self):
+        """Close this thread's connection (e.g. when the monitor exits).
+
+        Connections other threads opened are closed when those threads end.
+        """
+        holder = getattr(self._local, 'holder', None)
+        if holder is not None:
+            del self._local.holder
+            holder.close()
+
+    def upsert_many(self, table, rows, key=None, update=None):
+        """Insert many rows (dicts) with executemany, in one transaction.
+
+        Args:
+            table (str): Table to insert into.
+            rows (list[dict]): Rows to insert; rows with different keys are grouped into separate statements.
+            key (str): Conflict target column(s). Without one, rows that conflict are ignored.
+            update (list[str]): Columns to overwrite when a row conflicts on `key` (defaults to every other column).
+
+        Returns:
+            int: Number of rows inserted or updated.
+        """
+        with self.transaction() as conn:
+            return self._upsert_rows(conn, table, rows, key, update)
+
+    def _upsert_rows(self, conn, table, rows, key=None, update=None):
+        groups = {}
+        for row in rows:
+            groups.setdefault(tuple(row), []).append(row)
+        changed = 0
+        for columns, group in groups.items():
+            changed += conn.executemany(self._upsert_sql(table, columns, key, update), group).rowcount
+        return changed
+
+    def _upsert_sql(self, table, columns, key, update):
+        # Built once per shape; sqlite3 then reuses the prepared statement from its own cache
+        cache_key = (table, columns, key, tuple(update) if update else None)
+        sql = self._statements.get(cache_key)
+        if sql is None:
+            if not all(name.isidentifier() for name in (table, *columns)):
+                raise ValueError(f'Invalid table or column name in {table}{columns}')
+            names = ', '.join(columns)
+            values = ', '.join(f':{column}' for column in columns)
+            if key is None:
+                sql = f'INSERT OR IGNORE INTO {table} ({names}) VALUES ({values})'
+            else:
+                keys = {k.strip() for k in key.split(',')}
+                update = update or [column for column in columns if column not in keys]
+                assignments = ', '.join(f'{column} = excluded.{column}' for column in update)
+                conflict = f'DO UPDATE SET {assignments}' if assignments else 'DO NOTHING'
+                sql = f'INSERT INTO {table} ({names}) VALUES ({values}) ON CONFLICT({key}) {conflict}'
+            self._statements[cache_key] = sql
+        return sql
+
+    @property
+    def contacted(self):
+        """Run-scoped index of contacted listing IDs, loaded on first use (see contacted.py)."""
+        if self._contacted is None:
+            self._contacted = ContactedIndex(self)
+        return self._contacted
+
+    def migrate(self):
+        """Bring the schema up to date by applying the MIGRATIONS the database hasn't had yet.
+
+        Checking the version is a single read, so opening a current database doesn't wait for a
+        run that is writing. Pending steps run in one transaction with the version bump.
+        """
+        conn = self.connection()
+        if conn.execute('PRAGMA user_version').fetchone()[0] >= len(MIGRATIONS):
+            return
+        with self.transaction() as conn:
+            # Another process may have migrated while this one waited for the write lock
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            for number, steps in enumerate(MIGRATIONS[version:], start=version + 1):
+                print(f'Migrating database schema to version {number}')
+                for step in steps:
+                    if callable(step):
+                        step(conn)
+                    else:
+                        conn.execute(step)
+            conn.execute(f'PRAGMA user_version = {len(MIGRATIONS)}')
 
     def get_existing_ids(self):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT listing_id FROM listings')
-            return set(row[0] for row in cursor.fetchall())
+        cursor = self.connection().execute('SELECT listing_id FROM listings')
+        return set(row[0] for row in cursor.fetchall())
+
+    def count_listings(self):
+        return self.connection().execute('SELECT COUNT(*) FROM listings').fetchone()[0]
+
+    def iter_existing_ids(self):
+        """Yield every stored listing ID without materializing the whole column."""
+        cursor = self.connection().execute('SELECT listing_id FROM listings WHERE listing_id IS NOT NULL')
+        for row in cursor:
+            yield row[0]
+
+    def has_listing(self, listing_id):
+        """Exact check against the UNIQUE index on listing_id."""
+        cursor = self.connection().execute('SELECT 1 FROM listings WHERE listing_id = ?', (listing_id,))
+        return cursor.fetchone() is not None
+
+    def _rows(self, sql, params=()):
+        cursor = self.connection().cursor()
+        cursor.row_factory = sqlite3.Row
+        cursor.execute(sql, params)
+        return [dict(row) for row in cursor.fetchall()]
 
     def get_listings_sorted(self):
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM listings ORDER BY created_at DESC')
-            return [dict(row) for row in cursor.fetchall()]
+        return self._rows('SELECT * FROM listings ORDER BY created_at DESC')
+
+    def get_listings_page(self, sort='created_at', descending=True, after=None, limit=50,
+                          neighborhood=None, min_price=None, max_price=None, query=None):
+        """Return one page of contacted listings for the dashboard, without descriptions.
+
+        Pages are keyset-paginated: `after` is the cursor returned with the previous page, so
+        fetching any page costs the same however deep it is.
+
+        Args:
+            sort (str): Column to sort by (a key of SORT_KEYS).
+            descending (bool): Sort direction.
+            after (list): Cursor ([sort value, id]) of the last row of the previous page.
+            limit (int): Rows per page.
+            neighborhood (str): Only listings in this neighborhood.
+            min_price (int): Only listings at or above this price.
+            max_price (int): Only listings at or below this price.
+            query (str): Full-text search box input (see fts_query).
+
+        Returns:
+            tuple[list[dict], list]: The page's rows, and the cursor for the next page (None on the last page).
+        """
+        key = SORT_KEYS.get(sort, SORT_KEYS['created_at'])
+        where, params = [], []
+        if neighborhood:
+            where.append('neighborhood = ?')
+            params.append(neighborhood)
+        if min_price is not None:
+            where.append('price >= ?')
+            params.append(min_price)
+        if max_price is not None:
+            where.append('price <= ?')
+            params.append(max_price)
+        if query:
+            if not fts_query(query):
+                return [], None
+            if self.has_fts:
+                where.append('id IN (SELECT rowid FROM listings_fts WHERE listings_fts MATCH ?)')
+                params.append(fts_query(query))
+            else:
+                where.append('(description LIKE ? OR address LIKE ? OR neighborhood LIKE ?)')
+                params.extend([f'%{query.strip()}%'] * 3)
+        if after is not None:
+            where.append(f'({key}, id) {"<" if descending else ">"} (?, ?)')
+            params.extend(after)
+
+        order = 'DESC' if descending else 'ASC'
+        rows = self._rows(f"""
+            SELECT {LISTING_COLUMNS}, {key} AS sort_key,
+                   COALESCE(description, '') != '' AS has_description
+            FROM listings
+            {'WHERE ' + ' AND '.join(where) if where else ''}
+            ORDER BY {key} {order}, id {order}
+            LIMIT ?
+        """, (*params, limit + 1))
+
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, [rows[-1]['sort_key'], rows[-1]['id']]
+
+    def get_description(self, id):
+        """Return one listing's stored description (loaded when its row is expanded)."""
+        row = self.connection().execute('SELECT description FROM listings WHERE id = ?', (id,)).fetchone()
+        return row[0] if row else None
+
+    def get_neighborhoods(self):
+        """Distinct neighborhoods of contacted listings, for the dashboard's filter."""
+        cursor = self.connection().execute('SELECT neighborhood FROM neighborhood_counts ORDER BY neighborhood')
+        return [row[0] for row in cursor]
+
+    def get_listing_stats(self):
+        """Summary numbers for the dashboard header, read from the trigger-maintained listing_stats row."""
+        row = self.connection().execute("""
+            SELECT total, priced, price_sum, min_price, max_price, neighborhoods FROM listing_stats WHERE id = 1
+        """).fetchone()
+        if row is None:
+            return {'total': 0, 'avg_price': 0, 'min_price': 0, 'max_price': 0, 'neighborhoods': 0}
+        total, priced, price_sum, min_price, max_price, neighborhoods = row
+        return {
+            'total': total,
+            'avg_price': price_sum / priced if priced else 0,
+            'min_price': min_price or 0,
+            'max_price': max_price or 0,
+            'neighborhoods': neighborhoods,
+        }
+
+    @property
+    def has_fts(self):
+        row = self.connection().execute("SELECT 1 FROM sqlite_master WHERE name = 'listings_fts'").fetchone()
+        return row is not None
+
+    def rescreen_listings(self, keywords):
+        """Return the stored listings whose description contains any of the keyword phrases (one indexed query)."""
+        query = fts_any(keywords)
+        if not query:
+            return []
+        if not self.has_fts:
+            return [row for row in self._rows('SELECT * FROM listings WHERE description IS NOT NULL')
+                    if any(keyword.lower() in row['description'].lower() for keyword in keywords)]
+        return self._rows("""
+            SELECT listings.* FROM listings_fts
+            JOIN listings ON listings.id = listings_fts.rowid
+            WHERE listings_fts MATCH ?
+            ORDER BY listings.created_at DESC
+        """, (query,))
 
     def insert_new_listing(self, listing):
-        columns = ', '.join(listing.keys())
-        placeholders = ', '.join('?' * len(listing))
-        sql = f'INSERT OR IGNORE INTO listings ({columns}) VALUES ({placeholders})'
+        self.insert_listings([listing])
+
+    def insert_listings(self, listings):
+        """Record contacted listings in one transaction (listings already stored are left alone).
 
-        with sqlite3.connect(self.db_path) as conn:
+        Numeric fields are stored as numbers, or NULL when blank, so SQL aggregates and
+        comparisons skip listings without them.
+        """
+        self.upsert_many('listings', [
+            {**listing, **{column: to_number(listing[column]) for column in NUMERIC_COLUMNS if column in listing}}
+            for listing in listings
+        ])
+        if self._contacted is not None:
+            for listing in listings:
+                if listing.get('listing_id'):
+                    self._contacted.add(listing['listing_id'])
+
+    def get_search_state(self, search_key):
+        """Return the stored pagination watermark for a search, or None."""
+        rows = self._rows('SELECT * FROM search_state WHERE search_key = ?', (search_key,))
+        if not rows:
+            return None
+        state = rows[0]
+        state['newest_ids'] = set(json.loads(state['newest_ids'] or '[]'))
+        return state
+
+    def save_search_state(self, search_key, newest_ids, listed_at, last_full_sweep):
+        with self.transaction() as conn:
+            conn.execute("""
+                INSERT INTO search_state (search_key, newest_ids, listed_at, last_full_sweep)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(search_key) DO UPDATE SET
+                    newest_ids = excluded.newest_ids,
+                    listed_at = excluded.listed_at,
+                    last_full_sweep = excluded.last_full_sweep,
+                    updated_at = CURRENT_TIMESTAMP
+            """, (search_key, json.dumps(list(newest_ids)), listed_at, last_full_sweep))
+
+    def enqueue_outbox(self, listings):
+        """Queue listings for messaging.
+
+        A listing whose earlier delivery gave up ('failed') is queued again with a fresh attempt
+        count, since it was found again. Listings already queued, in progress or sent are left alone.
+
+        Returns:
+            list[str]: IDs of the listings this call queued.
+        """
+        rows = {listing['listing_id']: json.dumps(listing) for listing in listings if listing['listing_id']}
+        if not rows:
+            return []
+        with self.transaction() as conn:
+            placeholders = ', '.join('?' * len(rows))
+            existing = dict(conn.execute(
+                f'SELECT listing_id, state FROM outbox WHERE listing_id IN ({placeholders})', list(rows)
+            ).fetchall())
+            queued = [listing_id for listing_id in rows if existing.get(listing_id, 'failed') == 'failed']
+            conn.executemany("""
+                INSERT INTO outbox (listing_id, listing) VALUES (?, ?)
+                ON CONFLICT(listing_id) DO UPDATE SET
+                    listing = excluded.listing,
+                    state = 'queued',
+                    attempts = 0,
+                    next_attempt_at = CURRENT_TIMESTAMP,
+                    pageflow_id = NULL,
+                    reply_token = NULL,
+                    last_error = NULL,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE outbox.state = 'failed'
+            """, [(listing_id, rows[listing_id]) for listing_id in queued])
+        return queued
+
+    def claim_outbox(self, limit, lease_seconds):
+        """Claim up to `limit` due outbox rows for delivery.
+
+        Claimed rows have their next attempt pushed out by the lease, so another sender (or this
+        one after a crash) only picks them up again once the lease has run out.
+        """
+        with self.transaction() as conn:
             cursor = conn.cursor()
-            cursor.execute(sql, tuple(listing.values()))
-            conn.commit()
+            cursor.row_factory = sqlite3.Row
+            rows = [dict(row) for row in cursor.execute("""
+                SELECT * FROM outbox
+                WHERE state IN ('queued', 'pageflow_started') AND next_attempt_at <= datetime('now')
+                ORDER BY created_at
+                LIMIT ?
+            """, (limit,))]
+            conn.executemany(
+                "UPDATE outbox SET next_attempt_at = datetime('now', ?), updated_at = CURRENT_TIMESTAMP WHERE listing_id = ?",
+                [(f'+{lease_seconds} seconds', row['listing_id']) for row in rows],
+            )
+        return rows
+
+    def update_outbox(self, listing_id, retry_in=None, **fields):
+        """Update an outbox row's fields; `retry_in` (seconds) schedules its next attempt."""
+        assignments = [f'{column} = ?' for column in fields]
+        values = list(fields.values())
+        if retry_in is not None:
+            assignments.append("next_attempt_at = datetime('now', ?)")
+            values.append(f'+{int(retry_in)} seconds')
+        assignments.append('updated_at = CURRENT_TIMESTAMP')
+        with self.transaction() as conn:
+            conn.execute(f'UPDATE outbox SET {", ".join(assignments)} WHERE listing_id = ?', (*values, listing_id))
+
+    def get_outbox_counts(self):
+        """Return the number of outbox rows in each state."""
+        return dict(self.connection().execute('SELECT state, COUNT(*) FROM outbox GROUP BY state').fetchall())
+
+    def get_shard_counts(self):
+        """Return the last observed result count of every search shard, keyed by shard key."""
+        return dict(self.connection().execute('SELECT shard_key, result_count FROM shard_stats').fetchall())
+
+    def save_shard_counts(self, counts):
+        with self.transaction() as conn:
+            conn.executemany("""
+                INSERT INTO shard_stats (shard_key, result_count) VALUES (?, ?)
+                ON CONFLICT(shard_key) DO UPDATE SET
+                    result_count = excluded.result_count,
+                    updated_at = CURRENT_TIMESTAMP
+            """, list(counts.items()))
+
+    def get_seen_listings(self, listing_ids):
+        """Return the history rows (hash, verdict, last seen) for the given listing IDs, keyed by ID."""
+        if not listing_ids:
+            return {}
+        placeholders = ', '.join('?' * len(listing_ids))
+        rows = self._rows(f"""
+            SELECT listing_id, content_hash, rules_hash, verdict, last_seen_at
+            FROM seen_listings WHERE listing_id IN ({placeholders})
+        """, tuple(listing_ids))
+        return {row['listing_id']: row for row in rows}
+
+    def save_seen_listings(self, rows):
+        """Upsert observed listings in one executemany.
+
+        A row's price is appended to its price_history ([[seen_at, price], ...]) only when it
+        changed. A row without a verdict keeps the one it had while its content is unchanged;
+        once the content changes the old verdict is cleared, so the listing is judged again.
+        """
+        with self.transaction() as conn:
+            conn.executemany("""
+                INSERT INTO seen_listings (
+                    listing_id, url, address, neighborhood, price, beds, baths, building_type,
+                    content_hash, rules_hash, verdict, price_history, first_seen_at, last_seen_at
+                )
+                VALUES (
+                    :listing_id, :url, :address, :neighborhood, :price, :beds, :baths, :building_type,
+                    :content_hash, :rules_hash, :verdict, json_array(json_array(:seen_at, :price)), :seen_at, :seen_at
+                )
+                ON CONFLICT(listing_id) DO UPDATE SET
+                    url = excluded.url,
+                    address = excluded.address,
+                    neighborhood = excluded.neighborhood,
+                    price = excluded.price,
+                    beds = excluded.beds,
+                    baths = excluded.baths,
+                    building_type = excluded.building_type,
+                    content_hash = excluded.content_hash,
+                    rules_hash = CASE
+                        WHEN excluded.verdict IS NOT NULL THEN excluded.rules_hash
+                        WHEN seen_listings.content_hash = excluded.content_hash THEN seen_listings.rules_hash
+                    END,
+                    verdict = CASE
+                        WHEN excluded.verdict IS NOT NULL THEN excluded.verdict
+                        WHEN seen_listings.content_hash = excluded.content_hash THEN seen_listings.verdict
+                    END,
+                    price_history = CASE
+                        WHEN seen_listings.price IS excluded.price THEN seen_listings.price_history
+                        ELSE json_insert(seen_listings.price_history, '$[#]', json_array(excluded.last_seen_at, excluded.price))
+                    END,
+                    last_seen_at = excluded.last_seen_at
+            """, rows)
+
+    def get_cached_descriptions(self, urls):
+        """Return cached description rows for the given URLs, keyed by URL."""
+        if not urls:
+            return {}
+        placeholders = ', '.join('?' * len(urls))
+        rows = self._rows(f'SELECT * FROM description_cache WHERE url IN ({placeholders})', tuple(urls))
+        return {row['url']: row for row in rows}
+
+    def save_cached_descriptions(self, rows, max_idle_days, max_rows):
+        """Upsert description cache rows, then evict idle entries and trim to max_rows (least recently used first)."""
+        with self.transaction() as conn:
+            self._upsert_rows(conn, 'description_cache', rows, key='url')
+            conn.execute(
+                "DELETE FROM description_cache WHERE last_used_at < datetime('now', ?)",
+                (f'-{max_idle_days} days',),
+            )
+            conn.execute("""
+                DELETE FROM description_cache WHERE url IN (
+                    SELECT url FROM description_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                )
+            """, (max_rows,))
@@ -0,0 +1,98 @@
+import json
+from datetime import datetime, timedelta, UTC
+
+from .config import Config
+from .utils import content_hash, to_number
+
+# Listing fields that make up its content hash (a change in any of them is a new snapshot)
+CONTENT_FIELDS = ('url', 'price', 'address', 'neighborhood', 'beds', 'baths', 'building_type')
+
+
+class SeenHistory:
+    """Run-scoped writer for the seen_listings table: every listing a search observes.
+
+    Each page's listings are looked up in one query and written back in one executemany upsert.
+    Rows whose content hash is unchanged are only rewritten once Config.seen_touch_minutes have
+    passed (to keep last_seen_at roughly current), and a listing that is unchanged since an
+    earlier run rejected it under the same filters is skipped without being judged again.
+
+    Attributes:
+        rules_hash (str): Hash of the search parameters and filters verdicts were made under.
+        skipped (int): Listings skipped this run because of an earlier verdict.
+        written (int): Rows inserted or updated this run.
+    """
+
+    def __init__(self, db, kwargs: dict) -> None:
+        self.db = db
+        self.enabled = getattr(Config, 'seen_history', False)
+        rules = {
+            'min_price': kwargs.get('min_price'),
+            'max_price': kwargs.get('max_price'),
+            'areas': sorted(kwargs.get('areas') or []),
+            'filters': Config.filters,
+            'max_street_number': getattr(Config, 'max_street_number', None),
+            'description_filters': getattr(Config, 'description_filters', []),
+        }
+        self.rules_hash = content_hash(json.dumps(rules, sort_keys=True, default=str))
+        self.skipped = 0
+        self.written = 0
+
+    def lookup(self, listings) -> dict:
+        """Return the stored history rows for a page of listings, keyed by listing ID."""
+        if not self.enabled:
+            return {}
+        return self.db.get_seen_listings([listing['listing_id'] for listing in listings if listing['listing_id']])
+
+    def rejected_before(self, listing: dict, known: dict) -> bool:
+        """Whether an unchanged listing was already rejected under the same search and filters."""
+        row = known.get(listing['listing_id'])
+        return bool(row) and row['verdict'] == 0 and row['rules_hash'] == self.rules_hash \
+            and row['content_hash'] == listing_hash(listing)
+
+    def record(self, listings, judged_ids, accepted_ids, known: dict) -> None:
+        """Upsert a page's listings with their verdicts (None for listings this search didn't judge)."""
+        if not self.enabled or not listings:
+            return
+        now = datetime.now(UTC)
+        stale = (now - timedelta(minutes=Config.seen_touch_minutes)).strftime('%Y-%m-%d %H:%M:%S')
+        now = now.strftime('%Y-%m-%d %H:%M:%S')
+
+        rows = {}
+        for listing in listings:
+            listing_id = listing['listing_id']
+            if not listing_id:
+                continue
+            digest = listing_hash(listing)
+            verdict = None
+            if listing_id in judged_ids:
+                verdict = 1 if listing_id in accepted_ids else 0
+            row = known.get(listing_id)
+            if row and row['content_hash'] == digest and row['last_seen_at'] > stale \
+                    and (verdict is None or (verdict == row['verdict'] and row['rules_hash'] == self.rules_hash)):
+                continue
+            rows[listing_id] = {
+                'listing_id': listing_id,
+                'url': listing.get('url'),
+                'address': listing.get('address'),
+                'neighborhood': listing.get('neighborhood'),
+                'price': to_number(listing.get('price')),
+                'beds': to_number(listing.get('beds')),
+                'baths': to_number(listing.get('baths')),
+                'building_type': listing.get('building_type') or None,
+                'content_hash': digest,
+                'rules_hash': self.rules_hash if verdict is not None else None,
+                'verdict': verdict,
+                'seen_at': now,
+            }
+        if rows:
+            self.db.save_seen_listings(list(rows.values()))
+            self.written += len(rows)
+
+    def report(self) -> None:
+        if self.enabled and (self.skipped or self.written):
+            print(f'Listing history: {self.written} rows written, {self.skipped} unchanged rejections skipped')
+
+
+def listing_hash(listing: dict) -> str:
+    """Content hash of the listing fields in CONTENT_FIELDS."""
+    return content_hash('\x1f'.join(str(listing.get(field, '')) for field in CONTENT_FIELDS))
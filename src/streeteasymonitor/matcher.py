@@ -0,0 +1,96 @@
+from bisect import bisect_right
+
+
+class KeywordMatcher:
+    """Multi-pattern substring matcher (Aho-Corasick) for filter rule lists.
+
+    The keywords are normalized once and compiled into a deterministic automaton, so a text is
+    checked against every rule in a single pass over its characters instead of one `in` scan per
+    keyword. Matches report the original rule as written in the config.
+
+    Attributes:
+        rules (list[str]): The keywords as configured, deduplicated, in their original order.
+        ignore_case (bool): Whether keywords and texts are casefolded before matching.
+    """
+
+    _compiled = {}
+
+    @classmethod
+    def compile(cls, keywords, ignore_case: bool = True) -> 'KeywordMatcher':
+        """Return a matcher for a rule list, reusing the automaton built for an identical list."""
+        key = (tuple(keywords), ignore_case)
+        matcher = cls._compiled.get(key)
+        if matcher is None:
+            matcher = cls._compiled[key] = cls(keywords, ignore_case)
+        return matcher
+
+    def __init__(self, keywords, ignore_case: bool = True) -> None:
+        self.ignore_case = ignore_case
+        self.rules = list(dict.fromkeys(k for k in keywords if k))
+        self.keys = [self._normalize(rule) for rule in self.rules]
+
+        # Trie: transitions per state, plus the rule indexes that end at each state
+        goto = [{}]
+        outputs = [[]]
+        for index, key in enumerate(self.keys):
+            state = 0
+            for ch in key:
+                if ch not in goto[state]:
+                    goto.append({})
+                    outputs.append([])
+                    goto[state][ch] = len(goto) - 1
+                state = goto[state][ch]
+            outputs[state].append(index)
+
+        # Breadth-first: fold each state's failure transitions into its own table (a DFA), so
+        # scanning never has to walk failure links
+        self._delta = [dict(goto[0])]
+        self._delta.extend({} for _ in range(len(goto) - 1))
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for state in queue:
+            self._delta[state] = dict(self._delta[fail[state]])
+            self._delta[state].update(goto[state])
+            outputs[state] = outputs[state] + outputs[fail[state]]
+            for ch, child in goto[state].items():
+                fail[child] = self._delta[fail[state]].get(ch, 0) if state else 0
+                queue.append(child)
+        # Rule that ends earliest in the text (then the one listed first in the config) wins
+        self._output = [min(out) if out else None for out in outputs]
+
+        # All keys joined by a separator that can't occur in a key, for the reverse lookup
+        self._joined = '\0'.join(self.keys)
+        self._offsets = []
+        offset = 0
+        for key in self.keys:
+            self._offsets.append(offset)
+            offset += len(key) + 1
+
+    def _normalize(self, text: str) -> str:
+        return text.casefold() if self.ignore_case else text
+
+    def __bool__(self) -> bool:
+        return bool(self.rules)
+
+    def find(self, text: str) -> str | None:
+        """Return the first rule that occurs in the text, or None."""
+        if not self.rules or not text:
+            return None
+        delta = self._delta
+        output = self._output
+        state = 0
+        for ch in self._normalize(text):
+            state = delta[state].get(ch, 0)
+            if output[state] is not None:
+                return self.rules[output[state]]
+        return None
+
+    def find_container(self, text: str) -> str | None:
+        """Return the first rule that contains the whole text (the reverse direction of find), or None."""
+        if not self.rules:
+            return None
+        position = self._joined.find(self._normalize(text))
+        if position < 0:
+            return None
+        # Map the hit back to the key it starts in
+        return self.rules[bisect_right(self._offsets, position) - 1]
@@ -1,7 +1,11 @@
-import random
+import hashlib
+import json
+import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 from .config import Config
+from .ratelimit import TokenBucket, retry_after
 from .utils import get_datetime, export_to_csv
 
 
@@ -122,75 +126,471 @@ class Messager:
         }
     """
 
+    # Batched requests only ask for what delivery needs, not the rendered form
+    start_selection = """
+            ... on KoiosErrorResponse {
+                code
+                message
+                errorFields
+            }
+            ... on KoiosStartPageflowSuccess {
+                code
+                pageflowId
+                replyToken
+            }"""
+
+    finish_selection = """
+            ... on KoiosErrorResponse {
+                code
+                message
+                errorFields
+            }
+            ... on KoiosFinishPageflowSuccess {
+                code
+                returnConfig
+            }"""
+
+    # Shared by every Messager in the process, so back-to-back runs can't exceed the rate either
+    bucket = None
+
+    # Prebuilt query documents by (operation, batch size), with their persisted-query hashes
+    documents = {}
+    # What the API turned out to accept (None until known): persisted queries, aliased batches
+    persisted = None
+    batching = None
+    registered = set()
+
     def __init__(self, monitor, listings):
         self.field_values = monitor.config.get_field_values()
         self.session = monitor.session
         self.db = monitor.db
-        self.listings = listings
+        self.listings = list(listings)
+        self.api_url = getattr(Config, 'message_api_url', None) or Messager.api_url
+
+        if Messager.bucket is None:
+            Messager.bucket = TokenBucket(Config.message_rate_per_minute / 60, Config.message_burst)
+        self.stats = {'sent': 0, 'rejected': 0, 'errors': 0, 'throttled': 0, 'first': None, 'last': None}
+        self.stats_lock = threading.Lock()
+        self.started = None
+
+        # Background sender draining the outbox while the scraper keeps going
+        self._thread = None
+        self._wake = threading.Event()
+        self._closing = threading.Event()
+        self._aborting = threading.Event()
+        # Back-pressure: IDs of listings queued by this run's submit() that the sender hasn't
+        # delivered (or attempted) yet; retries and rows left over from earlier runs aren't counted
+        self._pending = set()
+        self._room = threading.Condition()
 
     def send_messages(self):
-        dry_run = getattr(Config, 'dry_run', False)
-        should_export = getattr(Config, 'export_csv', False)
+        """Queue this messager's listings and deliver everything due in the outbox."""
+        self.start()
+        self.submit(self.listings, record=False)
+        self.finish()
+
+    def start(self):
+        """Start draining the outbox in a background thread (including rows left over from earlier runs)."""
+        if getattr(Config, 'dry_run', False) or self._thread:
+            return
+        self.started = time.monotonic()
+        self._thread = threading.Thread(target=self._work, daemon=True)
+        self._thread.start()
 
-        for listing in self.listings:
-            print(f'{get_datetime()}\nNew listing: {listing["address"]}')
-            print(f'  Neighborhood: {listing["neighborhood"]}')
-            print(f'  Price: ${listing["price"]}')
-            print(f'  URL: {listing["url"]}')
+    def submit(self, listings, record=True):
+        """Queue newly found listings for delivery without waiting for them to be sent.
 
-            if dry_run:
+        Blocks while more than Config.stream_max_pending submitted listings are still waiting
+        for the sender, so a fast scraper can't run arbitrarily far ahead of the rate limit.
+        """
+        if record:
+            self.listings.extend(listings)
+        for listing in listings:
+            self.announce(listing)
+            if getattr(Config, 'dry_run', False):
                 print('  [DRY RUN - Message not sent]\n')
-                continue
-
-            try:
-                print('  Sending message...')
-                pageflow_id, reply_token = self.get_pageflow_id(listing['listing_id'])
-                if self.submit_message(pageflow_id, reply_token):
-                    print('  Message sent successfully\n')
-                    self.db.insert_new_listing(listing)
-                else:
-                    print('  Error sending message: Failed to submit message\n')
-                # Delay between messages to avoid rate limiting
-                delay = random.uniform(2, 5)
-                time.sleep(delay)
-            except Exception as e:
-                print(f'  Error sending message: {e}\n')
+        if listings and not getattr(Config, 'dry_run', False):
+            queued = self.db.enqueue_outbox(listings)
+            print(f'  Queued {len(queued)} listing(s) for messaging\n')
+            with self._room:
+                self._pending.update(queued)
+            self._wake.set()
+            self._wait_for_room()
+
+    def _wait_for_room(self):
+        limit = getattr(Config, 'stream_max_pending', 0)
+        if not limit:
+            return
+        with self._room:
+            if len(self._pending) > limit and self._thread:
+                print(f'  {len(self._pending)} listings waiting to be messaged; pausing the search until the sender catches up')
+            while len(self._pending) > limit and self._thread and self._thread.is_alive():
+                self._room.wait(timeout=Config.outbox_poll_seconds)
+
+    def finish(self, drain=True):
+        """Stop the sender, report, and export the run's listings.
+
+        Args:
+            drain (bool): Deliver everything due first. If False (e.g. after Ctrl-C), only the
+                messages already in flight are completed; the rest stay queued for the next run.
+        """
+        if self._thread:
+            if not drain:
+                print(f'{get_datetime()} Stopping the sender; queued messages will be sent on the next run.')
+                self._aborting.set()
+            self._closing.set()
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+            self.report()
 
         # Export to CSV if enabled
-        if should_export and self.listings:
-            csv_path = export_to_csv(self.listings)
-            if csv_path:
-                print(f'{get_datetime()} Exported {len(self.listings)} listings to {csv_path}\n')
+        if getattr(Config, 'export_csv', False) and self.listings:
+            self.export()
 
-    def submit_message(self, pageflow_id, reply_token):
-        message_variables = {
-            'request': {
-                'pageflowId': pageflow_id,
-                'replyToken': reply_token,
-                'fieldValues': self.field_values,
-            }
-        }
+    def _work(self):
+        workers = max(1, getattr(Config, 'message_concurrency', 1))
+        in_flight = set()
+        batches = {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while True:
+                # Top up the in-flight set as soon as any delivery finishes, so a listing queued
+                # mid-run doesn't wait for a whole batch; the token bucket paces the POSTs themselves
+                size = self.batch_size()
+                free = workers * 2 - len(in_flight)
+                rows = self.db.claim_outbox(free * size, Config.outbox_lease_seconds) if free and not self._aborting.is_set() else []
+                for i in range(0, len(rows), size):
+                    batch = rows[i:i + size]
+                    future = pool.submit(self.deliver_batch, batch)
+                    batches[future] = [row['listing_id'] for row in batch]
+                    in_flight.add(future)
+                if in_flight:
+                    done, in_flight = wait(in_flight, timeout=Config.outbox_poll_seconds, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        for listing_id, result in zip(batches.pop(future), future.result()):
+                            self.record(result, listing_id)
+                    continue
+                # Rows waiting on a backoff are left for a later run
+                if self._closing.is_set():
+                    break
+                self._wake.wait(timeout=Config.outbox_poll_seconds)
+                self._wake.clear()
+        with self._room:
+            self._room.notify_all()
+
+    def record(self, result, listing_id=None):
+        """Count a delivery result (see deliver_row) for the throughput report and back-pressure."""
+        elapsed = time.monotonic() - self.started if self.started else 0
+        with self._room:
+            if listing_id in self._pending:
+                self._pending.discard(listing_id)
+                self._room.notify_all()
+        with self.stats_lock:
+            if result:
+                self.stats['sent'] += 1
+                if self.stats['first'] is None:
+                    self.stats['first'] = elapsed
+                    print(f'{get_datetime()} First message of the run sent {elapsed:.1f}s after it started')
+                self.stats['last'] = elapsed
+            elif result is False:
+                self.stats['rejected'] += 1
+            else:
+                self.stats['errors'] += 1
+
+    def report(self):
+        """Print how many listings were messaged, how fast, and how often the API pushed back."""
+        stats = self.stats
+        elapsed = time.monotonic() - self.started
+        rate = stats['sent'] / elapsed * 60 if elapsed else 0
+        attempted = stats['sent'] + stats['rejected'] + stats['errors']
+        if not attempted:
+            return
+        print(f'{get_datetime()} Messaged {stats["sent"]}/{attempted} listings in {elapsed:.1f}s '
+              f'({rate:.1f}/min; {stats["rejected"]} rejected, {stats["errors"]} failed, '
+              f'{stats["throttled"]} rate-limited responses)')
+        if stats['first'] is not None:
+            print(f'  Time to first message {stats["first"]:.1f}s, last after {stats["last"]:.1f}s '
+                  f'({Messager.bucket.waited:.1f}s of sender time spent waiting for the rate limiter)')
+        counts = self.db.get_outbox_counts()
+        print(f'  Outbox: {counts.get("queued", 0) + counts.get("pageflow_started", 0)} pending, '
+              f'{counts.get("failed", 0)} failed, {counts.get("sent", 0)} sent\n')
+
+    def post(self, payload, tokens=1):
+        """POST to the API under the shared rate limit, waiting out 429s as the server asks.
+
+        A batched request takes one token per operation it carries.
+        """
+        for attempt in range(Config.message_max_retries + 1):
+            Messager.bucket.acquire(tokens)
+            r = self.session.post(self.api_url, json=payload, timeout=30)
+            if r.status_code != 429 or attempt == Config.message_max_retries:
+                return r
+            delay = retry_after(r, default=5 * 2 ** attempt)
+            with self.stats_lock:
+                self.stats['throttled'] += 1
+            print(f'  Rate limited, pausing all messages for {delay:.0f}s')
+            Messager.bucket.pause(delay)
+        return r
+
+    @classmethod
+    def document(cls, operation, count=1):
+        """Return the prebuilt (query, sha256 hash) for a single operation or an aliased batch of `count`."""
+        key = (operation, count)
+        if key not in cls.documents:
+            if count == 1 and operation == 'start':
+                query = cls.pageflow_query
+            elif count == 1:
+                query = cls.message_query
+            else:
+                if operation == 'start':
+                    name, field, request_type, selection = 'StartPageflows', 'startPageflow', 'KoiosStartPageflowRequest!', cls.start_selection
+                else:
+                    name, field, request_type, selection = 'FinishPageflows', 'finishPageflow', 'KoiosFinishPageflowRequest', cls.finish_selection
+                params = ', '.join(f'$r{i}: {request_type}' for i in range(count))
+                fields = ''.join(f'\n        m{i}: {field}(request: $r{i}) {{{selection}\n        }}' for i in range(count))
+                query = f'mutation {name}({params}) {{{fields}\n    }}'
+            cls.documents[key] = (query, hashlib.sha256(query.encode()).hexdigest())
+        return cls.documents[key]
+
+    def request(self, operation, variables, count=1):
+        """POST a prebuilt operation, sending only its persisted-query hash where the API accepts that.
+
+        Follows the automatic persisted query protocol: the hash is sent alone first, and the full
+        query is sent (and registered by the server) when the server doesn't know it yet.
+        """
+        query, sha = Messager.document(operation, count)
+        if not getattr(Config, 'message_persisted_queries', False) or Messager.persisted is False:
+            return self.post({'query': query, 'variables': variables}, tokens=count)
 
         payload = {
-            'query': Messager.message_query,
-            'variables': message_variables,
+            'variables': variables,
+            'extensions': {'persistedQuery': {'version': 1, 'sha256Hash': sha}},
         }
-
-        r = self.session.post(Messager.api_url, json=payload)
+        hash_only = sha in Messager.registered
+        if not hash_only:
+            payload['query'] = query
+        r = self.post(payload, tokens=count)
+        if hash_only and (r.status_code != 200 or persisted_query_error(r) or not response_data(r)):
+            # The server forgot the query (e.g. it restarted), or it ignores the hash altogether
+            # (some servers answer a bare hash with a 200 and a generic error instead of data)
+            forgotten = persisted_query_error(r) == 'PersistedQueryNotFound'
+            Messager.registered.discard(sha)
+            payload['query'] = query
+            r = self.post(payload, tokens=count)
+            if not forgotten and r.status_code == 200 and response_data(r):
+                if Messager.persisted is not False:
+                    print('  Persisted queries not supported by the API; sending full queries')
+                Messager.persisted = False
+                return r
+        if persisted_query_error(r) == 'PersistedQueryNotSupported':
+            if Messager.persisted is not False:
+                print('  Persisted queries not supported by the API; sending full queries')
+            Messager.persisted = False
+            return self.post({'query': query, 'variables': variables}, tokens=count)
         if r.status_code == 200:
+            Messager.persisted = True
+            Messager.registered.add(sha)
+        return r
+
+    def announce(self, listing):
+        print(f'{get_datetime()}\nNew listing: {listing["address"]}')
+        print(f'  Neighborhood: {listing["neighborhood"]}')
+        print(f'  Price: ${listing["price"]}')
+        print(f'  URL: {listing["url"]}')
+
+    def deliver_row(self, row):
+        """Deliver one claimed outbox row, recording each step so a crash or failure can resume.
+
+        Returns True if sent, False if the submission was rejected, or None if a request failed.
+        Failures are retried with exponential backoff until outbox_max_attempts is reached.
+        """
+        listing = json.loads(row['listing'])
+        listing_id = row['listing_id']
+
+        # Sent before a crash, but the outbox row wasn't updated
+        if listing_id in self.db.contacted:
+            self.db.update_outbox(listing_id, state='sent')
             return True
-        return False
 
-    def get_pageflow_id(self, listing_id):
-        Messager.pageflow_variables['request']['context']['rental_id'] = listing_id
-        payload = {
-            'query': Messager.pageflow_query,
-            'variables': Messager.pageflow_variables,
-        }
+        try:
+            print(f'  Sending message to {listing["address"]}...')
+            pageflow_id, reply_token = row['pageflow_id'], row['reply_token']
+            if row['state'] != 'pageflow_started' or not pageflow_id:
+                pageflow_id, reply_token = self.get_pageflow_id(listing_id)
+                self.db.update_outbox(listing_id, state='pageflow_started', pageflow_id=pageflow_id, reply_token=reply_token)
+
+            if self.submit_message(pageflow_id, reply_token):
+                return self._sent(row, listing)
+            return self._failed(row, listing, False, 'Failed to submit message')
+        except Exception as e:
+            return self._failed(row, listing, None, str(e))
+
+    def _sent(self, row, listing):
+        print(f'  Message sent successfully: {listing["address"]}\n')
+        self.db.insert_new_listing(listing)
+        self.db.update_outbox(row['listing_id'], state='sent', attempts=row['attempts'] + 1, last_error=None)
+        return True
+
+    def _failed(self, row, listing, result, error):
+        attempts = row['attempts'] + 1
+        print(f'  Error sending message to {listing["address"]}: {error}\n')
+        if attempts >= Config.outbox_max_attempts:
+            self.db.update_outbox(row['listing_id'], state='failed', attempts=attempts, last_error=error)
+            print(f'  Giving up on {listing["address"]} after {attempts} attempts\n')
+        else:
+            # A rejected submission may mean the pageflow expired; start a fresh one next time
+            delay = min(Config.outbox_backoff_seconds * 2 ** (attempts - 1), Config.outbox_backoff_max_seconds)
+            self.db.update_outbox(row['listing_id'], retry_in=delay, state='queued', attempts=attempts, last_error=error)
+        return result
+
+    def batch_size(self):
+        """Listings per aliased request (1 when batching is off or the API has rejected it)."""
+        if Messager.batching is False:
+            return 1
+        return max(1, min(getattr(Config, 'message_batch_size', 1), Config.message_burst))
+
+    def deliver_batch(self, rows):
+        """Deliver several claimed outbox rows with one aliased request per pageflow step.
+
+        Pageflows are started for every row that needs one in a single request, then all of
+        them are finished in a second one. Returns a deliver_row-style result per row. If the API
+        rejects aliased batches, batching is switched off and the rows are delivered one by one.
+        """
+        if len(rows) == 1:
+            return [self.deliver_row(rows[0])]
+
+        results = {}
+        listings = {row['listing_id']: json.loads(row['listing']) for row in rows}
+        pending = []
+        for row in rows:
+            if row['listing_id'] in self.db.contacted:
+                self.db.update_outbox(row['listing_id'], state='sent')
+                results[row['listing_id']] = True
+            else:
+                pending.append(row)
+
+        try:
+            to_start = [row for row in pending if row['state'] != 'pageflow_started' or not row['pageflow_id']]
+            for row in pending:
+                print(f'  Sending message to {listings[row["listing_id"]]["address"]}...')
+            if to_start:
+                started = self._batch('start', [self.pageflow_request(row['listing_id']) for row in to_start])
+                for row, (data, error) in zip(to_start, started):
+                    if data and data.get('pageflowId'):
+                        row.update(state='pageflow_started', pageflow_id=data['pageflowId'], reply_token=data['replyToken'])
+                        self.db.update_outbox(row['listing_id'], state='pageflow_started',
+                                              pageflow_id=row['pageflow_id'], reply_token=row['reply_token'])
+                    else:
+                        results[row['listing_id']] = self._failed(row, listings[row['listing_id']], None, error)
+
+            to_finish = [row for row in pending if row['listing_id'] not in results]
+            if to_finish:
+                finished = self._batch('finish', [self.finish_request(row['pageflow_id'], row['reply_token']) for row in to_finish])
+                for row, (data, error) in zip(to_finish, finished):
+                    listing = listings[row['listing_id']]
+                    if data is not None and 'returnConfig' in data:
+                        results[row['listing_id']] = self._sent(row, listing)
+                    else:
+                        results[row['listing_id']] = self._failed(row, listing, False, error or 'Failed to submit message')
+        except BatchRejected as e:
+            if Messager.batching is not False:
+                print(f'  Batched requests rejected by the API ({e}); sending one listing per request')
+            Messager.batching = False
+            for row in pending:
+                if row['listing_id'] not in results:
+                    results[row['listing_id']] = self.deliver_row(row)
+        except Exception as e:
+            for row in pending:
+                if row['listing_id'] not in results:
+                    results[row['listing_id']] = self._failed(row, listings[row['listing_id']], None, str(e))
+
+        return [results[row['listing_id']] for row in rows]
 
-        r = self.session.post(Messager.api_url, json=payload)
+    def _batch(self, operation, requests):
+        """Send one aliased request and return a (data, error message) pair per operation."""
+        variables = {f'r{i}': request for i, request in enumerate(requests)}
+        r = self.request(operation, variables, count=len(requests))
+        if r.status_code in (400, 422):
+            raise BatchRejected(f'HTTP {r.status_code}')
+        r.raise_for_status()
+        body = r.json()
+        data = body.get('data')
+        if not data:
+            # Nothing executed at all: the document itself was refused
+            messages = '; '.join(e.get('message', '') for e in body.get('errors', []))
+            raise BatchRejected(messages or 'no data')
+        Messager.batching = True
+
+        errors = {}
+        for error in body.get('errors', []):
+            path = error.get('path') or []
+            if path:
+                errors[path[0]] = error.get('message', 'Request failed')
+        results = []
+        for i in range(len(requests)):
+            value = data.get(f'm{i}')
+            error = errors.get(f'm{i}')
+            if value and value.get('message'):
+                error = value['message']
+            results.append((value, error or (None if value else 'No response for this listing')))
+        return results
+
+    def pageflow_request(self, listing_id):
+        """Variables for starting a listing's contact pageflow."""
+        request = Messager.pageflow_variables['request']
+        return {**request, 'context': {**request['context'], 'rental_id': listing_id}}
+
+    def finish_request(self, pageflow_id, reply_token):
+        return {'pageflowId': pageflow_id, 'replyToken': reply_token, 'fieldValues': self.field_values}
+
+    def export(self):
+        csv_path = export_to_csv(self.listings)
+        if csv_path:
+            print(f'{get_datetime()} Exported {len(self.listings)} listings to {csv_path}\n')
+
+    def submit_message(self, pageflow_id, reply_token):
+        r = self.request('finish', {'request': self.finish_request(pageflow_id, reply_token)})
+        if r.status_code != 200:
+            return False
+        # A refused submission still comes back as a 200, with a KoiosErrorResponse instead of returnConfig
+        data = (response_data(r) or {}).get('data')
+        return data is not None and 'returnConfig' in data
+
+    def get_pageflow_id(self, listing_id):
+        # Build per-request variables so concurrent senders don't share state
+        r = self.request('start', {'request': self.pageflow_request(listing_id)})
 
         pageflow_id = r.json()['data']['data']['pageflowId']
         reply_token = r.json()['data']['data']['replyToken']
 
         return pageflow_id, reply_token
+
+
+class BatchRejected(Exception):
+    """The API refused an aliased multi-listing request."""
+
+
+def response_data(response):
+    """Return a GraphQL response's `data` object, or None if it has none (or isn't JSON)."""
+    try:
+        return response.json().get('data')
+    except (ValueError, AttributeError):
+        return None
+
+
+def persisted_query_error(response):
+    """Return 'PersistedQueryNotFound' or 'PersistedQueryNotSupported' if the response is one, else None."""
+    if response.status_code not in (200, 400):
+        return None
+    try:
+        errors = response.json().get('errors') or []
+    except ValueError:
+        return None
+    for error in errors:
+        code = (error.get('extensions') or {}).get('code', '')
+        message = error.get('message', '')
+        if 'PersistedQueryNotFound' in message or code == 'PERSISTED_QUERY_NOT_FOUND':
+            return 'PersistedQueryNotFound'
+        if 'PersistedQueryNotSupported' in message or code == 'PERSISTED_QUERY_NOT_SUPPORTED':
+            return 'PersistedQueryNotSupported'
+    return None
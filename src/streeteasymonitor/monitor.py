@@ -1,17 +1,34 @@
+import json
 import os
 import random
 import time
 import requests
 from patchright.sync_api import sync_playwright
 
+from src.streeteasymonitor.api import RentalsAPI
+from src.streeteasymonitor.challenge import ChallengeDetector
+from src.streeteasymonitor.daemon import daemon_endpoint, session_is_warm, write_state
 from src.streeteasymonitor.search import Search
 from src.streeteasymonitor.database import Database
 from src.streeteasymonitor.messager import Messager
+from src.streeteasymonitor.network import ResourceBlocker
+from src.streeteasymonitor.server import MemoryMonitor, server_launch_options
+from src.streeteasymonitor.shards import ShardPlanner
 from src.streeteasymonitor.config import Config
 
 # Persistent browser profile directory
 PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data', 'browser_profile')
 
+# Cookies exported from the browser profile for browserless API requests
+COOKIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data', 'cookies.json')
+COOKIE_URLS = ['https://streeteasy.com', 'https://api-v6.streeteasy.com']
+
+
+def write_cookies(cookies, user_agent):
+    """Save browser cookies and the user agent that earned them to COOKIES_PATH."""
+    with open(os.path.abspath(COOKIES_PATH), 'w') as f:
+        json.dump({'cookies': cookies, 'user_agent': user_agent}, f)
+
 
 class Monitor:
     def __init__(self, **kwargs):
@@ -22,30 +39,97 @@ class Monitor:
         self.session = requests.Session()
         self.session.headers.update(self.config.get_headers())
 
+        # Browserless search client sharing the session's connection pool
+        self.api = RentalsAPI(self.session, os.path.abspath(COOKIES_PATH))
+
         # Playwright for fetching pages
         self.playwright = None
+        self.browser = None  # Set when attached to the browser daemon over CDP
         self.context = None
         self.page = None
+        self.blocker = ResourceBlocker() if getattr(Config, 'block_resources', False) else None
+        self.memory = MemoryMonitor(PROFILE_DIR)
 
         self.kwargs = kwargs
 
+        # Shared by every search profile run in this session (see Search.__init__)
+        self.rental_id_map = {}
+        self.listing_details = {}
+        self.descriptions = {}
+        self.description_rows = {}
+        self.fetched_now = set()
+        self.claimed_ids = set()  # Listing IDs already accepted by a profile this run
+
     def __enter__(self):
+        # In http mode the browser is only launched if the API path hits a challenge
+        if getattr(Config, 'search_mode', 'browser') != 'http':
+            self.start_browser()
+        return self
+
+    def start_browser(self):
+        """Launch the persistent Chromium context and warm up the session (no-op if already running)."""
+        if self.context:
+            return
         self.playwright = sync_playwright().start()
-        self.context = self.playwright.chromium.launch_persistent_context(
-            user_data_dir=os.path.abspath(PROFILE_DIR),
-            channel='chromium',
-            headless=False,
-            no_viewport=True,
-            ignore_default_args=['--enable-automation'],
-            args=[
+        endpoint = daemon_endpoint() if getattr(Config, 'browser_daemon', False) else None
+        if endpoint:
+            # The daemon owns the context; this run only opens (and later closes) its own tab
+            self.browser = self.playwright.chromium.connect_over_cdp(endpoint)
+            self.context = self.browser.contexts[0]
+            self.page = self.context.new_page()
+            print(f'Attached to browser daemon at {endpoint}')
+        else:
+            if getattr(Config, 'browser_daemon', False):
+                print('Browser daemon not running, launching a browser for this run.')
+            self.context = self.playwright.chromium.launch_persistent_context(**self.launch_options())
+            self.page = self.context.pages[0] if self.context.pages else self.context.new_page()
+        if self.blocker:
+            self.blocker.attach(self.context)
+        ChallengeDetector.for_page(self.page)
+        self.memory.start()
+
+        if self.browser and session_is_warm(self.context.cookies(COOKIE_URLS)):
+            print('Session clearance still valid, skipping warm-up.')
+        else:
+            self._warmup()
+            if self.browser:
+                write_state(warmed_at=time.time())
+
+    def launch_options(self):
+        """Keyword arguments for launching the persistent Chromium context."""
+        options = {
+            'user_data_dir': os.path.abspath(PROFILE_DIR),
+            'channel': 'chromium',
+            'headless': False,
+            'no_viewport': True,
+            'ignore_default_args': ['--enable-automation'],
+            'args': [
                 '--disable-blink-features=AutomationControlled',
                 '--no-sandbox',
                 '--start-maximized',
             ],
-        )
+        }
+        if getattr(Config, 'server_mode', False):
+            options = server_launch_options(options)
+        return options
+
+    def recycle_context(self):
+        """Close and relaunch the browser context to hand its memory back (not when attached to the daemon)."""
+        if self.browser or not self.context:
+            return False
+        before = self.memory.current_mb
+        self._save_cookies()
+        self.context.close()
+        self.context = self.playwright.chromium.launch_persistent_context(**self.launch_options())
+        if self.blocker:
+            self.blocker.attach(self.context)
         self.page = self.context.pages[0] if self.context.pages else self.context.new_page()
-        self._warmup()
-        return self
+        ChallengeDetector.for_page(self.page)
+        print(f'  Recycled browser context ({before:.0f} MB -> {self.memory.sample():.0f} MB)')
+        # The profile keeps its cookies, so a warm-up is only needed once clearance has expired
+        if not session_is_warm(self.context.cookies(COOKIE_URLS)):
+            self._warmup()
+        return True
 
     def _warmup(self):
         """Visit StreetEasy homepage first to establish cookies and session."""
@@ -56,24 +140,81 @@ class Monitor:
         # Handle bot detection during warmup
         dummy = type('obj', (object,), {'page': self.page, 'db': None, 'kwargs': {}})()
         search = Search.__new__(Search)
+        search.monitor = self
         search.page = self.page
         if search._is_bot_check():
             print('  Bot check on homepage — solving...')
             search._wait_for_bot_check()
             time.sleep(random.uniform(1, 2))
 
+    def _save_cookies(self):
+        """Export the browser's cookies and user agent so later runs can use the API directly."""
+        try:
+            write_cookies(
+                self.context.cookies(COOKIE_URLS),
+                self.page.evaluate('navigator.userAgent'),
+            )
+        except Exception as e:
+            print(f'  Could not save browser cookies: {e}')
+
     def __exit__(self, *args, **kwargs):
         try:
             if self.context:
+                self._save_cookies()
+            if self.browser:
+                # Leave the daemon's context running; just drop this run's hooks and tab
+                if self.blocker:
+                    self.context.unroute('**/*', self.blocker.handle)
+                self.page.close()
+            elif self.context:
                 self.context.close()
         except Exception:
             pass
+        if self.context and self.blocker:
+            self.blocker.report()
+        if self.context:
+            ChallengeDetector.report()
+            self.memory.stop()
+            self.memory.report()
         if self.playwright:
             self.playwright.stop()
         self.session.close()
+        self.db.close()
+
+    def run(self, profiles=None):
+        """Run each search profile back to back in this browser session, messaging listings as they are found.
+
+        Each page's accepted listings go to the outbox as soon as the page is filtered, and the
+        background sender starts on them while later pages are still loading.
+
+        Args:
+            profiles (list[tuple[str, dict]]): (name, search parameters) pairs (defaults to the monitor's kwargs).
+        """
+        profiles = profiles or [(None, self.kwargs)]
+        self.listings = []
+        planner = ShardPlanner(self.db)
+
+        self.messager = Messager(self, [])
+        self.messager.start()
+        completed = False
+        try:
+            for name, kwargs in profiles:
+                if name:
+                    print(f'\n=== Profile: {name} ===')
+                shards = planner.plan(kwargs)
+                for i, shard in enumerate(shards, start=1):
+                    if len(shards) > 1:
+                        print(f'\n--- Shard {i}/{len(shards)}: {shard.describe()} ---')
+                    self.search = Search(self, shard.kwargs(kwargs))
+                    for page_listings in self.search.stream():
+                        self.listings.extend(page_listings)
+                        self.messager.submit(page_listings)
+                    shard.count = self.search.result_count
+                planner.record(shards)
 
-    def run(self):
-        self.search = Search(self)
-        self.listings = self.search.fetch()
-        self.messager = Messager(self, self.listings)
-        self.messager.send_messages()
+            if len(profiles) > 1:
+                print(f'\n{len(self.listings)} new listings across {len(profiles)} profiles')
+            completed = True
+        finally:
+            # On an error or Ctrl-C, finish the messages in flight and leave the rest queued
+            self.messager.finish(drain=completed)
@@ -0,0 +1,127 @@
+from collections import Counter
+from urllib.parse import urlparse
+
+from .config import Config
+
+
+class ResourceBlocker:
+    """Route-interception profile that aborts requests the monitor doesn't need.
+
+    Only HTML documents, first-party scripts/XHR (including api-v6 GraphQL) and anything on an
+    allowlisted challenge host are let through. Everything else (images, fonts, media, map tiles,
+    ads, analytics) is aborted before it leaves the browser.
+
+    Note that Playwright disables the HTTP cache for a context while routing is enabled, so this
+    trades cache hits on allowed resources for never downloading the blocked ones.
+
+    Attributes:
+        typical_sizes (dict[str, int]): Fallback size (bytes) per resource type, used to estimate savings
+            for types that no allowed response in this run has measured.
+    """
+
+    typical_sizes = {
+        'image': 60_000,
+        'media': 500_000,
+        'font': 40_000,
+        'stylesheet': 30_000,
+        'script': 80_000,
+        'xhr': 5_000,
+        'fetch': 5_000,
+        'other': 10_000,
+    }
+
+    def __init__(self) -> None:
+        self.blocked_types = set(Config.blocked_resource_types)
+        self.first_party = tuple(Config.first_party_hosts)
+        self.allowlist = tuple(Config.allowed_hosts)
+
+        self.blocked = Counter()  # resource type -> requests aborted
+        self.blocked_hosts = Counter()  # host -> requests aborted
+        self.allowed = Counter()  # resource type -> responses received
+        self.allowed_bytes = Counter()  # resource type -> bytes received
+
+    @staticmethod
+    def _host_matches(host: str, domains: tuple[str]) -> bool:
+        return any(host == domain or host.endswith('.' + domain) for domain in domains)
+
+    def _frame_allowlisted(self, request) -> bool:
+        """Whether the request comes from a challenge iframe (which must load everything it asks for)."""
+        try:
+            frame_host = urlparse(request.frame.url).hostname or ''
+        except Exception:
+            return False
+        return self._host_matches(frame_host, self.allowlist)
+
+    def should_block(self, request) -> bool:
+        """Decide whether to abort a request."""
+        host = urlparse(request.url).hostname or ''
+        if self._host_matches(host, self.allowlist) or self._frame_allowlisted(request):
+            return False
+        if request.resource_type == 'document' and request.is_navigation_request():
+            return False
+        if request.resource_type in self.blocked_types:
+            return True
+        return not self._host_matches(host, self.first_party)
+
+    def _record_block(self, request) -> None:
+        self.blocked[request.resource_type] += 1
+        self.blocked_hosts[urlparse(request.url).hostname or ''] += 1
+
+    def handle(self, route) -> None:
+        """Route handler for the sync API."""
+        if self.should_block(route.request):
+            self._record_block(route.request)
+            route.abort()
+        else:
+            route.continue_()
+
+    async def handle_async(self, route) -> None:
+        """Route handler for the async API."""
+        if self.should_block(route.request):
+            self._record_block(route.request)
+            await route.abort()
+        else:
+            await route.continue_()
+
+    def record_response(self, response) -> None:
+        """Measure allowed traffic (by Content-Length) to estimate what blocked requests would have cost."""
+        try:
+            size = int(response.headers.get('content-length', 0))
+        except (TypeError, ValueError):
+            size = 0
+        resource_type = response.request.resource_type
+        self.allowed[resource_type] += 1
+        self.allowed_bytes[resource_type] += size
+
+    def attach(self, context) -> None:
+        """Install the route and response hooks on a sync browser context."""
+        context.route('**/*', self.handle)
+        context.on('response', self.record_response)
+
+    async def attach_async(self, context) -> None:
+        """Install the route and response hooks on an async browser context."""
+        await context.route('**/*', self.handle_async)
+        context.on('response', self.record_response)
+
+    def estimated_bytes_saved(self) -> int:
+        total = 0
+        for resource_type, count in self.blocked.items():
+            if self.allowed_bytes[resource_type]:
+                average = self.allowed_bytes[resource_type] / self.allowed[resource_type]
+            else:
+                average = ResourceBlocker.typical_sizes.get(resource_type, ResourceBlocker.typical_sizes['other'])
+            total += count * average
+        return int(total)
+
+    def report(self) -> None:
+        """Print requests and (estimated) bytes saved during this run."""
+        blocked = sum(self.blocked.values())
+        allowed = sum(self.allowed.values())
+        print(f'Resource blocking: {blocked} requests aborted, {allowed} allowed '
+              f'({sum(self.allowed_bytes.values()) / 1e6:.1f} MB received, '
+              f'~{self.estimated_bytes_saved() / 1e6:.1f} MB saved)')
+        if blocked:
+            by_type = ', '.join(f'{t}: {n}' for t, n in self.blocked.most_common())
+            by_host = ', '.join(f'{h}: {n}' for h, n in self.blocked_hosts.most_common(5))
+            print(f'  Blocked by type: {by_type}')
+            print(f'  Top blocked hosts: {by_host}')
@@ -0,0 +1,160 @@
+from bs4 import BeautifulSoup
+
+from .config import Config
+
+try:
+    import lxml.html
+except ImportError:  # lxml is optional; BeautifulSoup is always available
+    lxml = None
+
+
+CARD_SELECTOR = '[data-testid="listing-card"]'
+LINK_SELECTOR = 'a[href*="streeteasy.com/building"]'
+PRICE_SELECTOR = '[class*="PriceInfo"]'
+TITLE_SELECTOR = '[class*="ListingDescription-module__title"]'
+DESCRIPTION_SELECTORS = [
+    '[data-testid="listing-details-description"]',
+    '[class*="Description"]',
+    '.listing-description',
+]
+
+# Text under an element, leaving out what BeautifulSoup's get_text() skips (script, style and template contents)
+TEXT_XPATH = './/text()[not(ancestor::script or ancestor::style or ancestor::template)]'
+ASCII_SPACES = ' \n\t\x0c\r'
+
+
+class SoupBackend:
+    """Reference HTML backend built on BeautifulSoup's html.parser.
+
+    Each backend turns a results page into raw card fields (url, address, price_text, title_text)
+    and a detail page into description text; Parser does the rest.
+    """
+
+    name = 'bs4'
+
+    def cards(self, content) -> list[dict[str, str]]:
+        soup = BeautifulSoup(content, 'html.parser')
+        cards = []
+        for card in soup.select(CARD_SELECTOR):
+            link = card.select_one(LINK_SELECTOR)
+            price_elem = card.select_one(PRICE_SELECTOR)
+            title_elem = card.select_one(TITLE_SELECTOR)
+            cards.append({
+                'url': link['href'] if link else '',
+                'address': link.text.strip() if link else '',
+                'price_text': price_elem.get_text() if price_elem else '',
+                'title_text': title_elem.text.strip() if title_elem else '',
+            })
+        return cards
+
+    def description(self, content) -> str:
+        soup = BeautifulSoup(content, 'html.parser')
+        for selector in DESCRIPTION_SELECTORS:
+            desc_elem = soup.select_one(selector)
+            if desc_elem:
+                return desc_elem.get_text(separator=' ', strip=True)
+        return ''
+
+
+class LxmlBackend:
+    """Fast HTML backend built on lxml.
+
+    The document is parsed once in C, the cards are located with one XPath query, and each card's
+    fields are collected in a single walk over that card's subtree instead of one query per field.
+    """
+
+    name = 'lxml'
+
+    @staticmethod
+    def _document(content):
+        # lxml refuses str input that carries an encoding declaration
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        return lxml.html.fromstring(content)
+
+    @staticmethod
+    def _has_class(el, fragment: str) -> bool:
+        return fragment in (el.get('class') or '')
+
+    @staticmethod
+    def _strings(el) -> list[str]:
+        # Text nodes only (no comments, no script/style/template contents), matching BeautifulSoup's
+        # get_text(), which also collapses whitespace-only strings to a newline or a space
+        strings = []
+        for text in el.xpath(TEXT_XPATH):
+            if not text.strip(ASCII_SPACES):
+                text = '\n' if '\n' in text else ' '
+            strings.append(text)
+        return strings
+
+    @staticmethod
+    def _text(el) -> str:
+        return ''.join(LxmlBackend._strings(el))
+
+    def cards(self, content) -> list[dict[str, str]]:
+        if not content:
+            return []
+        doc = LxmlBackend._document(content)
+        cards = []
+        for card in doc.xpath('//*[@data-testid="listing-card"]'):
+            link = price_elem = title_elem = None
+            for el in card.iter():
+                if not isinstance(el.tag, str):
+                    continue
+                if link is None and el.tag == 'a' and 'streeteasy.com/building' in (el.get('href') or ''):
+                    link = el
+                if price_elem is None and LxmlBackend._has_class(el, 'PriceInfo'):
+                    price_elem = el
+                if title_elem is None and LxmlBackend._has_class(el, 'ListingDescription-module__title'):
+                    title_elem = el
+                if link is not None and price_elem is not None and title_elem is not None:
+                    break
+            cards.append({
+                'url': link.get('href') if link is not None else '',
+                'address': LxmlBackend._text(link).strip() if link is not None else '',
+                'price_text': LxmlBackend._text(price_elem) if price_elem is not None else '',
+                'title_text': LxmlBackend._text(title_elem).strip() if title_elem is not None else '',
+            })
+        return cards
+
+    def description(self, content) -> str:
+        if not content:
+            return ''
+        doc = LxmlBackend._document(content)
+        for xpath in (
+            '//*[@data-testid="listing-details-description"]',
+            '//*[contains(@class, "Description")]',
+            '//*[contains(concat(" ", normalize-space(@class), " "), " listing-description ")]',
+        ):
+            found = doc.xpath(xpath)
+            if found:
+                strings = (text.strip() for text in LxmlBackend._strings(found[0]))
+                return ' '.join(text for text in strings if text)
+        return ''
+
+
+backends = {
+    SoupBackend.name: SoupBackend,
+    LxmlBackend.name: LxmlBackend,
+}
+
+_backend = None
+
+
+def get_backend():
+    """Return the configured HTML backend, falling back to BeautifulSoup if lxml isn't installed."""
+    global _backend
+    name = getattr(Config, 'parser_backend', SoupBackend.name)
+    if _backend is None or _backend.name != name:
+        if name == LxmlBackend.name and lxml is None:
+            print('lxml is not installed, using the BeautifulSoup parser backend.')
+            name = SoupBackend.name
+            Config.parser_backend = name
+        _backend = backends[name]()
+    return _backend
+
+
+def check_parity(kind: str, fast, reference) -> None:
+    """Print any difference between the configured backend's output and the BeautifulSoup reference."""
+    if fast != reference:
+        print(f'  PARSER MISMATCH ({kind}):\n    {get_backend().name}: {fast}\n    bs4: {reference}')
@@ -0,0 +1,70 @@
+import threading
+import time
+from datetime import datetime, UTC
+from email.utils import parsedate_to_datetime
+
+
+class TokenBucket:
+    """Thread-safe token bucket shared by every request to one API.
+
+    Tokens refill at `rate` per second up to `burst`; each request takes one (a batched request takes one per operation). A rate-limit response
+    pauses the whole bucket (every sender waits) until the server's Retry-After has passed.
+
+    Attributes:
+        rate (float): Tokens added per second.
+        burst (int): Most tokens the bucket can hold, i.e. how many requests may go out back to back.
+        waited (float): Total seconds senders have spent waiting for tokens.
+    """
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waited = 0.0
+        self.lock = threading.Lock()
+
+    def _reserve(self, tokens: int = 1) -> float:
+        """Take tokens if enough are available; otherwise return how long to wait before trying again."""
+        tokens = min(tokens, self.burst)
+        with self.lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0.0
+            return (tokens - self.tokens) / self.rate
+
+    def acquire(self, tokens: int = 1) -> float:
+        """Block until `tokens` tokens (at most the burst) are available. Returns the seconds spent waiting."""
+        waited = 0.0
+        while (delay := self._reserve(tokens)) > 0:
+            time.sleep(delay)
+            waited += delay
+        with self.lock:
+            self.waited += waited
+        return waited
+
+    def pause(self, seconds: float) -> None:
+        """Stop handing out tokens for a while (e.g. after a 429), and drop any saved-up burst."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+            self.updated = self.paused_until
+
+
+def retry_after(response, default: float) -> float:
+    """Seconds to wait according to a response's Retry-After header (delay or HTTP date)."""
+    value = response.headers.get('retry-after', '').strip()
+    if not value:
+        return default
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(UTC)).total_seconds())
+    except (TypeError, ValueError):
+        return default
@@ -2,11 +2,28 @@ import json
 import random
 import re
 import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, UTC
 
-from bs4 import BeautifulSoup
-
+from .api import APIError, ChallengeError, RentalsAPI, parse_rental_node
+from .challenge import ChallengeDetector
 from .config import Config
-from .utils import build_url, get_datetime, get_area_map
+from .history import SeenHistory
+from .matcher import KeywordMatcher
+from .parsers import SoupBackend, check_parity, get_backend
+from .server import solve_headed
+from .utils import build_url, content_hash, get_datetime, get_area_map
+
+# Status of the document a tab loaded, and whether it is a rentals results page (not an error or block page)
+RESULTS_PAGE_JS = """
+    () => {
+        const nav = performance.getEntriesByType('navigation')[0];
+        return {
+            status: nav && nav.responseStatus ? nav.responseStatus : 0,
+            results: location.hostname.endsWith('streeteasy.com') && location.pathname.startsWith('/for-rent/'),
+        };
+    }
+"""
 
 
 class Search:
@@ -18,14 +35,17 @@ class Search:
 
     area_map: dict[str, str] = get_area_map()
 
-    def __init__(self, monitor) -> None:
+    def __init__(self, monitor, kwargs=None) -> None:
         """Initializes the search.
 
         Args:
             monitor (Monitor): A Monitor instance encapsulating a session, a database connection, and keyword arguments for constructing a search URL.
+            kwargs (dict): Search parameters overriding the monitor's keyword arguments.
 
         Attributes:
-            page (SeleniumPageWrapper): The page wrapper instance for fetching.
+            monitor (Monitor): The owning monitor, used to launch the browser on demand.
+            page (SeleniumPageWrapper): The page wrapper instance for fetching (None until the browser is launched).
+            api (RentalsAPI): Browserless client for the searchRentals API.
             db (Database): The database instance.
             kwargs (dict[str, str]): The search parameter components.
             codes (list[str, str]): The StreetEasy neighborhood codes corresponding to selected neighborhood names.
@@ -37,11 +57,14 @@ class Search:
             parameters (dict[str, str]): Dictionary mapping query components for URL construction.
             url (str): Search URL for the current query.
             listings (list[dict[str, str]]): Listings corresponding to the current search - initially empty.
+            result_count (int): Total results StreetEasy reported for the search (None if unknown).
         """
 
+        self.monitor = monitor
         self.page = monitor.page
+        self.api = monitor.api
         self.db = monitor.db
-        self.kwargs = monitor.kwargs
+        self.kwargs = kwargs or monitor.kwargs
 
         self.codes = [Search.area_map[area] for area in self.kwargs['areas']]
 
@@ -65,27 +88,31 @@ class Search:
 
         self.url = build_url(**self.parameters)
         self.listings = []
-
-    def _is_bot_check(self) -> bool:
-        """Check if the current page is a bot detection challenge."""
-        title = self.page.title().lower()
-        content = self.page.content().lower()
-        return (
-            'captcha' in content
-            or 'press & hold' in content
-            or 'verify you are human' in content
-            or 'just a moment' in title
-            or 'attention required' in title
-        )
-
-    def _try_solve_press_and_hold(self) -> bool:
+        self.result_count = None
+        self.history = SeenHistory(self.db, self.kwargs)
+
+        # Run-scoped state owned by the monitor, shared by every page and every search profile
+        self._rental_id_map = monitor.rental_id_map  # URL -> numeric rental ID from API
+        self._listing_details = monitor.listing_details  # URL -> {beds, baths, status, ...} from API
+        self._descriptions = monitor.descriptions  # URL -> description text
+        self._cached = monitor.description_rows  # URL -> description cache row loaded from the database
+        self._fetched_now = monitor.fetched_now  # URLs whose description was (re)fetched during this run
+        self._last_nav = {}  # Tab key -> time of the tab's last navigation
+
+    def _is_bot_check(self, page=None) -> bool:
+        """Check if the current page (or the given tab) is a bot detection challenge."""
+        page = page or self.page
+        return ChallengeDetector.for_page(page).is_challenged()
+
+    def _try_solve_press_and_hold(self, page=None) -> bool:
         """Attempt to solve a press-and-hold CAPTCHA automatically."""
+        page = page or self.page
         try:
             target = None
             box = None
 
             # Strategy 1: Find Cloudflare Turnstile iframe and click inside it
-            for frame in self.page.frames:
+            for frame in page.frames:
                 if 'challenges.cloudflare.com' in frame.url or 'turnstile' in frame.url:
                     for sel in ['body', '#challenge-stage', 'input', 'button', 'div']:
                         try:
@@ -104,7 +131,7 @@ class Search:
             # Strategy 2: Find any visible iframe that could be the challenge
             # PerimeterX injects iframes with no src attribute
             if not target:
-                iframes = self.page.query_selector_all('iframe')
+                iframes = page.query_selector_all('iframe')
                 for iframe in iframes:
                     try:
                         iframe_box = iframe.bounding_box()
@@ -122,7 +149,7 @@ class Search:
             if not target:
                 for sel in ['[class*="challenge"]', '[id*="challenge"]', 'button:visible', '[role="button"]:visible']:
                     try:
-                        el = self.page.query_selector(sel)
+                        el = page.query_selector(sel)
                         if el and el.is_visible():
                             box = el.bounding_box()
                             if box and box['width'] > 20:
@@ -140,38 +167,42 @@ class Search:
             y = box['y'] + box['height'] / 2
 
             # Human-like mouse movement
-            self.page.mouse.move(random.uniform(100, 400), random.uniform(100, 400))
+            page.mouse.move(random.uniform(100, 400), random.uniform(100, 400))
             time.sleep(random.uniform(0.3, 0.7))
-            self.page.mouse.move(x + random.uniform(-5, 5), y + random.uniform(-5, 5))
+            page.mouse.move(x + random.uniform(-5, 5), y + random.uniform(-5, 5))
             time.sleep(random.uniform(0.1, 0.3))
 
             # Press and hold
             print(f'  Pressing and holding at ({x:.0f}, {y:.0f})...')
-            self.page.mouse.down()
+            page.mouse.down()
             time.sleep(random.uniform(8, 13))
-            self.page.mouse.up()
-            time.sleep(3)
+            page.mouse.up()
             return True
 
         except Exception as e:
             print(f'  Auto-solve error: {e}')
         return False
 
-    def _wait_for_bot_check(self, timeout=90) -> bool:
+    def _wait_for_bot_check(self, timeout=90, page=None) -> bool:
         """If a bot check is present, try to solve it automatically, then fall back to manual.
         Returns True if page is ready."""
-        if not self._is_bot_check():
+        page = page or self.page
+        detector = ChallengeDetector.for_page(page)
+        if not detector.is_challenged():
             return True
 
+        # Challenges need the tab in the foreground when several tabs are open
+        page.bring_to_front()
+
         print('  Bot check detected — attempting automatic solve...')
 
         # Debug: log what's on the page
         try:
-            print(f'  Page title: {self.page.title()}')
-            print(f'  Frames: {len(self.page.frames)}')
-            for i, frame in enumerate(self.page.frames):
+            print(f'  Page title: {page.title()}')
+            print(f'  Frames: {len(page.frames)}')
+            for i, frame in enumerate(page.frames):
                 print(f'    Frame {i}: {frame.url[:100]}')
-            iframes = self.page.query_selector_all('iframe')
+            iframes = page.query_selector_all('iframe')
             for i, iframe in enumerate(iframes):
                 src = iframe.get_attribute('src') or ''
                 box = iframe.bounding_box()
@@ -184,22 +215,23 @@ class Search:
 
         # Try automated press-and-hold up to 3 times
         for attempt in range(3):
-            self._try_solve_press_and_hold()
-            time.sleep(3)
-            if not self._is_bot_check():
+            self._try_solve_press_and_hold(page)
+            if detector.wait_until_cleared(timeout=5):
                 print('  Bot check passed automatically!')
-                time.sleep(2)
                 return True
             print(f'  Auto-solve attempt {attempt + 1} failed.')
 
-        # Fall back to manual solving
-        print('  Please solve the challenge manually in the browser window.')
-        start = time.time()
-        while time.time() - start < timeout:
-            time.sleep(3)
-            if not self._is_bot_check():
+        monitor = getattr(self, 'monitor', None)
+        if getattr(Config, 'server_mode', False) and monitor and monitor.playwright:
+            # Nobody can see a headless tab; hand the challenge to a headed window if allowed
+            if getattr(Config, 'headed_fallback', False) and solve_headed(monitor.playwright, page, timeout):
+                print('  Bot check passed!')
+                return True
+        else:
+            # Fall back to manual solving
+            print('  Please solve the challenge manually in the browser window.')
+            if detector.wait_until_cleared(timeout=timeout):
                 print('  Bot check passed!')
-                time.sleep(2)
                 return True
 
         print(f'  Bot check not resolved within {timeout}s.')
@@ -210,104 +242,540 @@ class Search:
         if 'api-v6.streeteasy.com' not in response.url:
             return
         try:
-            body = response.json()
-            edges = body.get('data', {}).get('searchRentals', {}).get('edges', [])
-            for edge in edges:
-                node = edge.get('node', {})
-                rental_id = node.get('id')
-                url_path = node.get('urlPath', '')
-                if rental_id and url_path:
-                    full_url = f'https://streeteasy.com{url_path}'
-                    self._rental_id_map[full_url] = rental_id
-                    self._listing_details[full_url] = {
-                        'beds': node.get('bedroomCount'),
-                        'baths': (node.get('fullBathroomCount', 0) or 0) + (node.get('halfBathroomCount', 0) or 0) * 0.5,
-                        'status': (node.get('status') or '').capitalize(),
-                        'building_type': (node.get('buildingType') or '').replace('_', ' ').capitalize(),
-                        'source': node.get('sourceGroupLabel', ''),
-                    }
+            self._record_search_results(response.json())
         except Exception:
             pass
 
+    def _record_search_results(self, body: dict) -> None:
+        """Store rental IDs and listing details from a searchRentals response body."""
+        results = body.get('data', {}).get('searchRentals', {})
+        if results.get('totalCount') is not None:
+            self.result_count = results['totalCount']
+        edges = results.get('edges', [])
+        for edge in edges:
+            node = edge.get('node', {})
+            rental_id = node.get('id')
+            url_path = node.get('urlPath', '')
+            if rental_id and url_path:
+                full_url = f'https://streeteasy.com{url_path}'
+                self._rental_id_map[full_url] = rental_id
+                self._listing_details[full_url] = parse_rental_node(node)
+
+    def _load_watermark(self) -> None:
+        """Load the previous run's watermark, unless watermarks are off or a full sweep is due."""
+        self.watermark = None
+        self._full_sweep = True
+        self._completed = False
+
+        if not getattr(Config, 'watermark_stop', False) or getattr(Config, 'force_full_sweep', False):
+            return
+        state = self.db.get_search_state(self.url)
+        if not state or not state['last_full_sweep']:
+            return
+        last_full_sweep = datetime.fromisoformat(state['last_full_sweep'])
+        if datetime.now(UTC) - last_full_sweep >= timedelta(minutes=Config.full_sweep_minutes):
+            print('Full sweep due, ignoring pagination watermark.')
+            return
+
+        self.watermark = state
+        self._full_sweep = False
+
+    def _listed_at(self, listing) -> str:
+        return self._listing_details.get(listing['url'], {}).get('listed_at', '')
+
+    def _below_watermark(self, parsed_all) -> bool:
+        """Whether every listing on a page was already seen (or listed no later than) last run's newest."""
+        if not self.watermark or not parsed_all:
+            return False
+        for listing in parsed_all:
+            if listing['listing_id'] in self.watermark['newest_ids']:
+                continue
+            listed_at = self._listed_at(listing)
+            if listed_at and self.watermark['listed_at'] and listed_at <= self.watermark['listed_at']:
+                continue
+            return False
+        return True
+
+    def _save_watermark(self, seen_ids, seen_listings) -> None:
+        """Store this run's listings, plus the previous watermark's, as the next run's watermark.
+
+        Keeping the previous IDs means a run that stopped early still leaves the listings below
+        where it stopped in the watermark. This run's IDs come first when the set is capped.
+        """
+        if not getattr(Config, 'watermark_stop', False) or not seen_ids:
+            return
+        ids = [listing['listing_id'] for listing in seen_listings if listing['listing_id']]
+        listed_at = max((self._listed_at(listing) for listing in seen_listings), default='')
+        if self.watermark:
+            ids.extend(sorted(self.watermark['newest_ids']))
+            listed_at = max(listed_at, self.watermark['listed_at'] or '')
+        ids = list(dict.fromkeys(ids))[:Config.watermark_max_ids]
+        if self._full_sweep and self._completed:
+            last_full_sweep = datetime.now(UTC).isoformat()
+        else:
+            last_full_sweep = self.watermark['last_full_sweep'] if self.watermark else None
+        self.db.save_search_state(self.url, ids, listed_at, last_full_sweep)
+
+    def _unclaimed(self, parsed_all) -> list[dict[str, str]]:
+        """Drop listings another search profile already accepted during this run, before any filtering."""
+        claimed = self.monitor.claimed_ids
+        unclaimed = [listing for listing in parsed_all if listing['listing_id'] not in claimed]
+        if len(unclaimed) < len(parsed_all):
+            print(f'  Skipping {len(parsed_all) - len(unclaimed)} listings already found by another profile')
+        return unclaimed
+
+    def _claim(self, listings) -> list[dict[str, str]]:
+        """Mark accepted listings so later profiles in this run skip them."""
+        self.monitor.claimed_ids.update(listing['listing_id'] for listing in listings)
+        return listings
+
+    def _prefilter(self, listings, parser, known) -> list[dict[str, str]]:
+        """Apply the cheap filters, skipping unchanged listings an earlier run rejected under the same filters."""
+        candidates = []
+        skipped = 0
+        for listing in listings:
+            if self.history.rejected_before(listing, known):
+                skipped += 1
+            elif parser.prefilter(listing):
+                candidates.append(listing)
+        if skipped:
+            self.history.skipped += skipped
+            print(f'  Skipping {skipped} unchanged listings already rejected on an earlier run')
+        return candidates
+
+    @staticmethod
+    def _ids(listings) -> set[str]:
+        return {listing['listing_id'] for listing in listings}
+
     def fetch(self) -> list[dict[str, str]]:
-        """Check the search URL for new listings, paginating through all results."""
+        """Check the search URL for new listings, paginating through all results.
+
+        Collects everything stream() yields; use stream() directly to act on listings while
+        later pages are still loading.
+        """
+        return [listing for page_listings in self.stream() for listing in page_listings]
+
+    def stream(self):
+        """Yield the new listings from each results page (or browser batch) as soon as they pass the filters.
+
+        In 'http' search mode the searchRentals API is queried directly, and the browser is
+        only launched if the API answers with a challenge (or otherwise fails). Listings already
+        yielded before such a failure are claimed, so the browser pass doesn't yield them again.
+
+        Yields:
+            list[dict[str, str]]: The listings accepted from one page or batch of pages.
+        """
 
         print(f'Running script with parameters:\n{json.dumps(self.parameters, indent=2)}\n')
         print(f'Base URL: {self.url}')
 
+        if getattr(Config, 'search_mode', 'browser') == 'http':
+            try:
+                yield from self._stream_http()
+                return
+            except APIError as e:
+                print(f'{get_datetime()} API search failed ({e}), falling back to browser.\n')
+                self.monitor.start_browser()
+                self.page = self.monitor.page
+
+        yield from self._stream_browser()
+
+    def _stream_http(self):
+        """Paginate through the searchRentals API, yielding each page's new listings built from the JSON."""
         all_listings = []
+        seen_ids = set()
+        seen_listings = []
         page_num = 1
-        seen_ids = set()  # Track listing IDs to detect when we've seen all listings
-        self._rental_id_map = {}  # URL -> numeric rental ID from API
-        self._listing_details = {}  # URL -> {beds, baths, status, ...} from API
+        parser = Parser(None, self.db, kwargs=self.kwargs, api=self.api)
+        self._load_watermark()
+
+        while True:
+            print(f'\n--- API page {page_num} ---')
+            nodes, total = self.api.search(self.kwargs, self.codes, page_num)
+            self.result_count = total
+
+            parsed_all = [RentalsAPI.to_listing(node) for node in nodes]
+            for node, listing in zip(nodes, parsed_all):
+                self._listing_details[listing['url']] = parse_rental_node(node)
+            new_card_ids = [p['listing_id'] for p in parsed_all if p['listing_id'] not in seen_ids]
+            seen_ids.update(p['listing_id'] for p in parsed_all)
+            seen_listings.extend(parsed_all)
+            known = self.history.lookup(parsed_all)
+
+            if not new_card_ids:
+                print(f'No new unique results on page {page_num}, stopping pagination.')
+                self._completed = True
+                break
+
+            if self._below_watermark(parsed_all):
+                print(f'Page {page_num} is entirely below last run\'s watermark, stopping pagination.')
+                self.history.record(parsed_all, set(), set(), known)
+                break
+
+            unclaimed = self._unclaimed(parsed_all)
+            candidates = self._prefilter(unclaimed, parser, known)
+            page_listings = self._claim(self._filter_descriptions(candidates, parser))
+            self.history.record(parsed_all, self._ids(unclaimed), self._ids(page_listings), known)
+            print(f'Found {len(page_listings)} new listings on page {page_num}')
+            all_listings.extend(page_listings)
+            if page_listings:
+                yield page_listings
+
+            if page_num * RentalsAPI.per_page >= total:
+                self._completed = True
+                break
+
+            time.sleep(random.uniform(*Config.api_page_delay))
+            page_num += 1
+
+        self._save_watermark(seen_ids, seen_listings)
+        self.listings = all_listings
+        self.history.report()
+
+        if not self.listings:
+            print(f'{get_datetime()} No new listings.\n')
+        else:
+            print(f'\nTotal: {len(self.listings)} listings across {page_num} API page(s)')
+
+    def _page_url(self, page_num: int) -> str:
+        """StreetEasy uses &page=N for pagination."""
+        return f"{self.url}&page={page_num}" if page_num > 1 else self.url
+
+    def _open_tabs(self) -> list:
+        """Open the pool of tabs used for pagination, reusing the main page as the first tab."""
+        concurrency = max(1, getattr(Config, 'page_concurrency', 1))
+        tabs = [self.page] + [self.page.context.new_page() for _ in range(concurrency - 1)]
+        # Attach challenge detectors before navigating so no frame or response events are missed
+        for tab in tabs:
+            ChallengeDetector.for_page(tab)
+        return tabs
+
+    def _recycle_tabs(self, tabs) -> list:
+        """Replace the pagination tabs to free their renderers' memory, relaunching the context if that isn't enough."""
+        before = self.monitor.memory.current_mb
+        for tab in tabs[1:]:
+            try:
+                tab.close()
+            except Exception:
+                pass
+        self.page.goto('about:blank')
+        print(f'  Recycled tabs ({before:.0f} MB -> {self.monitor.memory.sample():.0f} MB)')
+
+        if self.monitor.memory.over_limit():
+            self.page.context.remove_listener('response', self._capture_rental_ids)
+            if self.monitor.recycle_context():
+                self.page = self.monitor.page
+            self.page.context.on('response', self._capture_rental_ids)
+        return self._open_tabs()
+
+    def _pace(self, tab_key, delay_range) -> None:
+        """Wait until the tab's randomized per-tab delay since its last navigation has passed."""
+        last = self._last_nav.get(tab_key)
+        if last is not None:
+            remaining = last + random.uniform(*delay_range) - time.time()
+            if remaining > 0:
+                time.sleep(remaining)
+        self._last_nav[tab_key] = time.time()
+
+    @staticmethod
+    def _is_empty_results(page_state: dict, challenged: bool) -> bool:
+        """Whether a page without cards is a real, empty results page (the search was swept to its end).
+
+        Blocked, challenged or failed loads also time out waiting for cards; those must not
+        count as a completed sweep.
+        """
+        return not challenged and page_state['results'] and 200 <= page_state['status'] < 300
+
+    def _collect_page(self, tab, page_num: int) -> str | None:
+        """Wait for a navigation started on a tab to finish and return its HTML, or None to stop."""
+        tab.wait_for_load_state('domcontentloaded', timeout=60000)
 
-        # Listen for API responses to capture rental IDs
-        self.page.on('response', self._capture_rental_ids)
+        # Check for bot detection
+        if not self._wait_for_bot_check(page=tab):
+            print('Stopping due to bot detection.')
+            return None
 
+        # Wait for listing cards to appear
+        try:
+            tab.wait_for_selector('[data-testid="listing-card"]', timeout=15000)
+        except Exception:
+            try:
+                empty = Search._is_empty_results(tab.evaluate(RESULTS_PAGE_JS), ChallengeDetector.for_page(tab).is_challenged())
+            except Exception:
+                empty = False
+            if empty:
+                print(f'No listings found on page {page_num}, stopping pagination.')
+                self._completed = True
+            else:
+                print(f'Page {page_num} did not load as a results page, stopping pagination.')
+            return None
+
+        return tab.content()
+
+    def _filter_descriptions(self, candidates, parser) -> list[dict[str, str]]:
+        """Prefetch every candidate's description in one batch, then apply the keyword filter."""
+        if not candidates or not getattr(Config, 'description_filters', []):
+            return candidates
+
+        urls = self._load_cached_descriptions(candidates)
+        if self.page:
+            self._fetch_descriptions(urls)
+        else:
+            self._fetch_descriptions_http(urls)
+
+        return self._judge_descriptions(candidates, parser)
+
+    @staticmethod
+    def _now() -> str:
+        """Current UTC time in SQLite's CURRENT_TIMESTAMP format."""
+        return datetime.now(UTC).strftime('%Y-%m-%d %H:%M:%S')
+
+    def _load_cached_descriptions(self, candidates) -> list[str]:
+        """Fill in descriptions from the on-disk cache and return the URLs that still need fetching."""
+        urls = [url for url in dict.fromkeys(card.get('url', '') for card in candidates) if url and url not in self._descriptions]
+        if not getattr(Config, 'description_cache', False):
+            self._fetched_now.update(urls)
+            return urls
+
+        rows = self.db.get_cached_descriptions(urls)
+        cutoff = (datetime.now(UTC) - timedelta(hours=Config.description_cache_ttl_hours)).strftime('%Y-%m-%d %H:%M:%S')
+        missing = []
+        for url in urls:
+            row = rows.get(url)
+            if row:
+                self._cached[url] = row
+            if row and row['fetched_at'] >= cutoff:
+                self._descriptions[url] = row['description']
+            else:
+                missing.append(url)
+
+        if rows:
+            print(f'  {len(urls) - len(missing)} of {len(urls)} descriptions served from cache')
+        self._fetched_now.update(missing)
+        return missing
+
+    def _judge_descriptions(self, candidates, parser) -> list[dict[str, str]]:
+        """Apply the description keyword filter, reusing cached verdicts for unchanged descriptions."""
+        rules_hash = content_hash('\n'.join(sorted(k.lower() for k in Config.description_filters)))
+        now = Search._now()
+        passed = []
+        rows = []
+
+        for card in candidates:
+            url = card.get('url', '')
+            description = self._descriptions.get(url, '')
+            digest = content_hash(description)
+            cached = self._cached.get(url)
+
+            if cached and cached['content_hash'] == digest and cached['rules_hash'] == rules_hash and cached['verdict'] is not None:
+                ok = bool(cached['verdict'])
+            else:
+                rule = parser.description_rule(description)
+                ok = rule is None
+                if not ok:
+                    print(f"  FILTERED: {card.get('address', '')} - description contains '{rule}'")
+            if ok:
+                if description:
+                    card['description'] = description  # Stored with the listing once contacted
+                passed.append(card)
+
+            # Empty descriptions are usually failed fetches; don't let them stick
+            if description:
+                rows.append({
+                    'url': url,
+                    'listing_id': card.get('listing_id', ''),
+                    'description': description,
+                    'content_hash': digest,
+                    'verdict': int(ok),
+                    'rules_hash': rules_hash,
+                    'fetched_at': now if url in self._fetched_now or not cached else cached['fetched_at'],
+                    'last_used_at': now,
+                })
+                self._cached[url] = rows[-1]
+
+        if rows and getattr(Config, 'description_cache', False):
+            self.db.save_cached_descriptions(rows, Config.description_cache_idle_days, Config.description_cache_size)
+
+        return passed
+
+    def _collect_description(self, tab) -> str:
+        """Wait for a detail page navigation started on a tab to finish and extract its description."""
         try:
-            while True:
-                # StreetEasy uses &page=N for pagination
-                page_url = f"{self.url}&page={page_num}" if page_num > 1 else self.url
-                print(f'\n--- Page {page_num} ---')
-                print(f'URL: {page_url}')
+            tab.wait_for_load_state('domcontentloaded', timeout=30000)
+            self._wait_for_bot_check(page=tab)
+            tab.wait_for_selector('[data-testid="listing-details-description"], [class*="Description"]', timeout=10000)
+            return Parser.extract_description(tab.content())
+        except Exception:
+            return ''
 
-                self.page.goto(page_url, wait_until='domcontentloaded', timeout=60000)
+    def _fetch_descriptions(self, urls) -> None:
+        """Fetch listing descriptions through a pool of separate tabs, leaving the results tab alone."""
+        urls = [url for url in dict.fromkeys(urls) if url and url not in self._descriptions]
+        if not urls:
+            return
 
-                # Check for bot detection
-                if not self._wait_for_bot_check():
-                    print('Stopping due to bot detection.')
-                    break
+        concurrency = max(1, getattr(Config, 'description_concurrency', 1))
+        tabs = [self.page.context.new_page() for _ in range(min(concurrency, len(urls)))]
+        for tab in tabs:
+            ChallengeDetector.for_page(tab)
+        print(f'  Fetching {len(urls)} descriptions in {len(tabs)} tab(s)...')
 
-                # Wait for listing cards to appear
+        try:
+            for start in range(0, len(urls), len(tabs)):
+                batch = list(zip(tabs, urls[start:start + len(tabs)]))
+                started = []
+                for i, (tab, url) in enumerate(batch):
+                    if i:
+                        time.sleep(random.uniform(*Config.tab_stagger))
+                    self._pace(('description', i), Config.description_pacing)
+                    try:
+                        tab.goto(url, wait_until='commit', timeout=30000)
+                        started.append((tab, url))
+                    except Exception:
+                        self._descriptions[url] = ''
+                for tab, url in started:
+                    self._descriptions[url] = self._collect_description(tab)
+        finally:
+            for tab in tabs:
                 try:
-                    self.page.wait_for_selector('[data-testid="listing-card"]', timeout=15000)
+                    tab.close()
                 except Exception:
-                    print(f'No listings found on page {page_num}, stopping pagination.')
-                    break
+                    pass
 
-                content = self.page.content()
-                parser = Parser(content.encode(), self.db, self.page, self.kwargs, self._rental_id_map, self._listing_details)
+    def _fetch_descriptions_http(self, urls) -> None:
+        """Fetch listing descriptions over HTTP with a small thread pool.
+
+        A ChallengeError from any request propagates so the search can fall back to the browser.
+        """
+        urls = [url for url in dict.fromkeys(urls) if url and url not in self._descriptions]
+        if not urls:
+            return
+
+        def fetch_one(url):
+            time.sleep(random.uniform(*Config.api_page_delay))
+            try:
+                return Parser.extract_description(self.api.get_html(url))
+            except ChallengeError:
+                raise
+            except Exception:
+                return ''
+
+        concurrency = max(1, getattr(Config, 'description_concurrency', 1))
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for url, description in zip(urls, executor.map(fetch_one, urls)):
+                self._descriptions[url] = description
+
+    def _stream_browser(self):
+        """Render results pages in a pool of tabs, yielding each batch's new listings.
+
+        Each batch starts navigations on every tab (so Chromium loads them concurrently), then
+        collects and parses the pages in order. Pagination stops at the first page without new
+        unique cards; later pages from the same batch are discarded.
+        """
+        all_listings = []
+        page_num = 1
+        seen_ids = set()  # Track listing IDs to detect when we've seen all listings
+        seen_listings = []
+        self._load_watermark()
 
-                # Parse all cards (before filtering) to check for pagination end
-                all_cards = parser.soup.select('[data-testid="listing-card"]')
-                parsed_all = [parser.parse(card) for card in all_cards]
-                new_card_ids = [p['listing_id'] for p in parsed_all if p['listing_id'] not in seen_ids]
-                seen_ids.update(p['listing_id'] for p in parsed_all)
+        # Listen for API responses on every tab to capture rental IDs
+        context = self.page.context
+        context.on('response', self._capture_rental_ids)
+        tabs = self._open_tabs()
 
-                # Get filtered listings for messaging
-                page_listings = [card for card in parsed_all if parser.filter(card)]
+        try:
+            done = False
+            while not done:
+                if page_num > 1 and self.monitor.memory.over_limit():
+                    tabs = self._recycle_tabs(tabs)
+                    context = self.page.context
+
+                batch = list(enumerate(tabs, start=page_num))
+
+                # Start all navigations, pacing each tab and staggering between tabs
+                for i, (num, tab) in enumerate(batch):
+                    if i:
+                        time.sleep(random.uniform(*Config.tab_stagger))
+                    self._pace(('results', i), Config.tab_pacing)
+                    print(f'\n--- Page {num} ---')
+                    print(f'URL: {self._page_url(num)}')
+                    tab.goto(self._page_url(num), wait_until='commit', timeout=60000)
+
+                # Collect every page of the batch before parsing it
+                contents = []
+                for num, tab in batch:
+                    content = self._collect_page(tab, num)
+                    if content is None:
+                        done = True
+                        break
+                    contents.append((num, content))
+
+                candidates = []
+                observed, known, judged = [], {}, set()
+                for num, content in contents:
+                    page_num = num
+                    parser = Parser(content.encode(), self.db, None, self.kwargs, self._rental_id_map, self._listing_details)
+
+                    # Parse all cards (before filtering) to check for pagination end
+                    parsed_all = [parser.parse(card) for card in parser.cards()]
+                    new_card_ids = [p['listing_id'] for p in parsed_all if p['listing_id'] not in seen_ids]
+                    seen_ids.update(p['listing_id'] for p in parsed_all)
+                    seen_listings.extend(parsed_all)
+                    observed.extend(parsed_all)
+                    known.update(self.history.lookup(parsed_all))
+
+                    if not new_card_ids:
+                        print(f'No new unique cards on page {num}, stopping pagination.')
+                        self._completed = True
+                        done = True
+                        break
 
-                print(f'Found {len(page_listings)} new listings on page {page_num}')
+                    if self._below_watermark(parsed_all):
+                        print(f'Page {num} is entirely below last run\'s watermark, stopping pagination.')
+                        done = True
+                        break
 
-                if not new_card_ids:
-                    print(f'No new unique cards on page {page_num}, stopping pagination.')
-                    break
+                    # Cheap filters first; descriptions are fetched for the whole batch at once
+                    unclaimed = self._unclaimed(parsed_all)
+                    judged.update(self._ids(unclaimed))
+                    page_candidates = self._prefilter(unclaimed, parser, known)
+                    print(f'Found {len(page_candidates)} candidate listings on page {num}')
+                    candidates.extend(page_candidates)
 
-                all_listings.extend(page_listings)
+                batch_listings = self._claim(self._filter_descriptions(candidates, parser)) if candidates else []
+                self.history.record(observed, judged, self._ids(batch_listings), known)
+                all_listings.extend(batch_listings)
+                if batch_listings:
+                    yield batch_listings
 
-                # Randomized delay between pages to appear more human
-                delay = random.uniform(3, 7)
-                print(f'  Waiting {delay:.1f}s before next page...')
-                time.sleep(delay)
-                page_num += 1
+                if not done:
+                    page_num += 1
 
         except Exception as e:
             print(f'{get_datetime()} Error fetching page: {e}\n')
             import traceback
             traceback.print_exc()
 
-        # Stop listening for API responses
-        self.page.remove_listener('response', self._capture_rental_ids)
+        finally:
+            # Stop listening for API responses and close the extra tabs (also when the consumer stops early)
+            context.remove_listener('response', self._capture_rental_ids)
+            for tab in tabs[1:]:
+                try:
+                    tab.close()
+                except Exception:
+                    pass
 
+        if self.result_count is None and self._completed:
+            self.result_count = len(seen_ids)
+        self._save_watermark(seen_ids, seen_listings)
         self.listings = all_listings
+        self.history.report()
 
         if not self.listings:
             print(f'{get_datetime()} No new listings.\n')
         else:
             print(f'\nTotal: {len(self.listings)} listings across {page_num} page(s)')
 
-        return self.listings
-
 
 class Parser:
     """Separates parsing functionality from search.
@@ -318,36 +786,47 @@ class Parser:
 
     price_pattern = re.compile(r'[$,]')
 
-    def __init__(self, content: bytes, db, page=None, kwargs=None, rental_id_map=None, listing_details=None) -> None:
+    def __init__(self, content: bytes, db, page=None, kwargs=None, rental_id_map=None, listing_details=None, api=None) -> None:
         """Initialize the parse object.
 
         Args:
-            content (bytes): HTML content of a successful GET request to the search URL.
-            db (Database): Database instance used for fetching listing IDs that already exist in the database.
+            content (bytes): HTML content of a successful GET request to the search URL (None for API results).
+            db (Database): Database instance whose run-scoped index holds the listing IDs already contacted.
             page: Page wrapper instance for fetching listing details.
+            api (RentalsAPI): Browserless client used to fetch listing details when there is no page.
             kwargs: Search parameters from the form (min_price, max_price, areas, etc.)
             rental_id_map: URL -> numeric rental ID mapping from intercepted API responses.
             listing_details: URL -> {beds, baths, status, ...} from intercepted API responses.
 
         Attributes:
-            soup (bs4.BeautifulSoup): Beautiful Soup object for parsing HTML contents.
-            existing_ids (list[str]): Listing IDs that have already been stored in the database.
+            content (bytes): The page HTML, parsed lazily by the configured backend (see parsers.py).
+            existing_ids (ContactedIndex): Listing IDs that have already been stored in the database.
         """
 
-        self.soup = BeautifulSoup(content, 'html.parser')
-        self.existing_ids = db.get_existing_ids()
+        self.content = content
+        self._cards = None
+        self.existing_ids = db.contacted
         self.page = page
+        self.api = api
         self.kwargs = kwargs or {}
         self.rental_id_map = rental_id_map or {}
         self.listing_details = listing_details or {}
         self._description_cache = {}
 
+    def cards(self) -> list[dict[str, str]]:
+        """Extract the raw fields of every listing card on the page."""
+        if self._cards is None:
+            backend = get_backend()
+            self._cards = backend.cards(self.content) if self.content else []
+            if getattr(Config, 'parser_parity_check', False) and backend.name != SoupBackend.name:
+                check_parity('cards', self._cards, SoupBackend().cards(self.content) if self.content else [])
+        return self._cards
+
     def parse(self, card) -> dict[str, str]:
-        """Parse the contents of one listing."""
-        # Find URL and address from the listing link
-        link = card.select_one('a[href*="streeteasy.com/building"]')
-        url = link['href'] if link else ''
-        address = link.text.strip() if link else ''
+        """Parse the contents of one listing from its raw card fields."""
+        # URL and address from the listing link
+        url = card['url']
+        address = card['address']
 
         # Get numeric rental ID from intercepted API response
         listing_id = self.rental_id_map.get(url, '')
@@ -357,23 +836,18 @@ class Parser:
             if match:
                 listing_id = match.group(1)
 
-        # Find price - look for element with PriceInfo in class
-        price_elem = card.select_one('[class*="PriceInfo"]')
+        # Price from the element with PriceInfo in class
         price = ''
-        if price_elem:
-            price_text = price_elem.get_text()
-            # Extract first price (e.g., "$3,600" from "$3,600base rent...")
-            price_match = re.search(r'\$[\d,]+', price_text)
-            if price_match:
-                price = Parser.price_pattern.sub('', price_match.group())
-
-        # Find neighborhood from title (e.g., "Rental unit in Bushwick")
-        title_elem = card.select_one('[class*="ListingDescription-module__title"]')
+        # Extract first price (e.g., "$3,600" from "$3,600base rent...")
+        price_match = re.search(r'\$[\d,]+', card['price_text'])
+        if price_match:
+            price = Parser.price_pattern.sub('', price_match.group())
+
+        # Neighborhood from title (e.g., "Rental unit in Bushwick")
         neighborhood = ''
-        if title_elem:
-            title_text = title_elem.text.strip()
-            if ' in ' in title_text:
-                neighborhood = title_text.split(' in ')[-1].strip()
+        title_text = card['title_text']
+        if ' in ' in title_text:
+            neighborhood = title_text.split(' in ')[-1].strip()
 
         # Get extra details from API response
         details = self.listing_details.get(url, {})
@@ -395,45 +869,63 @@ class Parser:
 
     def get_description(self, url: str) -> str:
         """Fetch the description from a listing's detail page."""
-        if not self.page or not url:
+        if not (self.page or self.api) or not url:
             return ''
 
         if url in self._description_cache:
             return self._description_cache[url]
 
         try:
-            # Random delay before fetching each listing detail
-            time.sleep(random.uniform(1.5, 3))
-            self.page.goto(url, wait_until='domcontentloaded', timeout=30000)
-            # Wait for description to load
-            self.page.wait_for_selector('[data-testid="listing-details-description"], [class*="Description"]', timeout=10000)
-            content = self.page.content()
-            soup = BeautifulSoup(content, 'html.parser')
-
-            # Try multiple selectors for description
-            desc_elem = soup.select_one('[data-testid="listing-details-description"]')
-            if not desc_elem:
-                desc_elem = soup.select_one('[class*="Description"]')
-            if not desc_elem:
-                desc_elem = soup.select_one('.listing-description')
-
-            description = desc_elem.get_text(separator=' ', strip=True) if desc_elem else ''
+            if self.page:
+                # Random delay before fetching each listing detail
+                time.sleep(random.uniform(1.5, 3))
+                self.page.goto(url, wait_until='domcontentloaded', timeout=30000)
+                # Wait for description to load
+                self.page.wait_for_selector('[data-testid="listing-details-description"], [class*="Description"]', timeout=10000)
+                content = self.page.content()
+            else:
+                content = self.api.get_html(url)
+            description = Parser.extract_description(content)
             self._description_cache[url] = description
             return description
+        except ChallengeError:
+            # Let the search fall back to the browser rather than skipping the check
+            raise
         except Exception:
             self._description_cache[url] = ''
             return ''
 
+    @staticmethod
+    def extract_description(content: str) -> str:
+        """Extract the description text from a listing detail page's HTML."""
+        backend = get_backend()
+        description = backend.description(content)
+        if getattr(Config, 'parser_parity_check', False) and backend.name != SoupBackend.name:
+            check_parity('description', description, SoupBackend().description(content))
+        return description
+
     def filter(self, target) -> bool:
         """Filter a listing based on attributes not captured by StreetEasy's interface natively."""
+        if not self.prefilter(target):
+            return False
+
+        # Filter out listings with restricted housing keywords in description
+        description_filters = getattr(Config, 'description_filters', [])
+        if description_filters and (self.page or self.api):
+            return self.description_ok(self.get_description(target.get('url', '')))
+
+        return True
+
+    def prefilter(self, target) -> bool:
+        """Apply every filter that doesn't require fetching the listing's detail page."""
         if target['listing_id'] in self.existing_ids:
             print(f"  FILTERED: {target['address']} - already in database")
             return False
 
         for key, substrings in Config.filters.items():
-            target_value = target.get(key, '')
-            if any(substring in target_value for substring in substrings):
-                print(f"  FILTERED: {target['address']} - {key} contains blocked substring")
+            rule = KeywordMatcher.compile(substrings, ignore_case=False).find(target.get(key, ''))
+            if rule is not None:
+                print(f"  FILTERED: {target['address']} - {key} contains blocked substring '{rule}'")
                 return False
 
         # Note: We search with status:open so inactive listings shouldn't appear
@@ -457,9 +949,9 @@ class Parser:
         configured_areas = self.kwargs.get('areas') or Config.defaults.get('areas', [])
         if configured_areas:
             neighborhood = target.get('neighborhood', '')
-            # Check if neighborhood matches any configured area (case-insensitive partial match)
-            if not any(area.lower() in neighborhood.lower() or neighborhood.lower() in area.lower()
-                       for area in configured_areas):
+            # Check if neighborhood matches any configured area (case-insensitive partial match, both ways)
+            areas = KeywordMatcher.compile(configured_areas)
+            if areas.find(neighborhood) is None and areas.find_container(neighborhood) is None:
                 print(f"  FILTERED: {target['address']} - neighborhood '{neighborhood}' not in configured areas")
                 return False
 
@@ -477,20 +969,20 @@ class Parser:
         else:
             print(f"  DEBUG: max_street not set")
 
-        # Filter out listings with restricted housing keywords in description
-        description_filters = getattr(Config, 'description_filters', [])
-        if description_filters and self.page:
-            url = target.get('url', '')
-            description = self.get_description(url).lower()
-            if any(keyword.lower() in description for keyword in description_filters):
-                return False
-
         return True
 
+    def description_rule(self, description: str) -> str | None:
+        """Return the restricted housing keyword found in a listing description, or None."""
+        return KeywordMatcher.compile(getattr(Config, 'description_filters', [])).find(description)
+
+    def description_ok(self, description: str) -> bool:
+        """Check a listing description against the restricted housing keywords."""
+        return self.description_rule(description) is None
+
     @property
     def listings(self) -> dict[str, str]:
         """Return all parsed and filtered listings."""
-        cards = self.soup.select('[data-testid="listing-card"]')
+        cards = self.cards()
         print(f'DEBUG: Found {len(cards)} listing cards on page')
         parsed = [self.parse(card) for card in cards]
         print(f'DEBUG: Parsed {len(parsed)} listings')
@@ -0,0 +1,196 @@
+"""Helpers for running the browser on small headless servers.
+
+Covers the headless launch profile, measuring the browser's memory from /proc (Linux) so tabs
+and contexts can be recycled before the VM runs out, and handing a challenge that needs a human
+to a temporary headed window.
+"""
+
+import os
+import threading
+
+try:
+    import resource
+except ImportError:  # Windows; memory is only measured where /proc exists anyway
+    resource = None
+
+from .challenge import ChallengeDetector
+from .config import Config
+
+
+def server_launch_options(options: dict) -> dict:
+    """Turn the default (headed, maximized) launch options into the headless low-memory profile."""
+    options = dict(options)
+    options['headless'] = True
+    options['no_viewport'] = False
+    options['viewport'] = dict(Config.server_viewport)
+    options['args'] = [arg for arg in options['args'] if arg != '--start-maximized'] + list(Config.server_browser_args)
+    return options
+
+
+def can_open_window() -> bool:
+    """Whether a headed window can be shown (a display on Linux; always on macOS/Windows)."""
+    if not os.path.exists('/proc'):
+        return True
+    return bool(os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'))
+
+
+class MemoryMonitor:
+    """Samples the memory of the browser's process tree in a background thread.
+
+    The browser is found by its --user-data-dir argument; its renderer, GPU and utility
+    processes are included as descendants. Proportional set size (PSS) is used where the kernel
+    provides it, so memory shared between Chromium processes is not counted once per process.
+
+    Attributes:
+        current_mb (float): Browser memory at the last sample.
+        peak_mb (float): Highest browser memory seen since the monitor started.
+        peak_processes (int): Number of browser processes at the peak.
+    """
+
+    def __init__(self, profile_dir: str) -> None:
+        self.marker = f'--user-data-dir={os.path.abspath(profile_dir)}'
+        self.available = os.path.exists('/proc/self/status')
+        self.current_mb = 0.0
+        self.peak_mb = 0.0
+        self.peak_processes = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _read(path: str) -> str:
+        try:
+            with open(path, 'rb') as f:
+                return f.read().decode(errors='replace')
+        except OSError:
+            return ''
+
+    def _browser_pids(self) -> list[int]:
+        parents = {}
+        roots = []
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            stat = self._read(f'/proc/{entry}/stat')
+            if not stat:
+                continue
+            # The command name may contain spaces; fields resume after its closing parenthesis
+            fields = stat[stat.rfind(')') + 2:].split()
+            parents[int(entry)] = int(fields[1])
+            if self.marker in self._read(f'/proc/{entry}/cmdline').split('\0'):
+                roots.append(int(entry))
+
+        pids = set(roots)
+        frontier = list(roots)
+        while frontier:
+            parent = frontier.pop()
+            for pid, ppid in parents.items():
+                if ppid == parent and pid not in pids:
+                    pids.add(pid)
+                    frontier.append(pid)
+        return sorted(pids)
+
+    def _process_kb(self, pid: int) -> int:
+        for line in self._read(f'/proc/{pid}/smaps_rollup').splitlines():
+            if line.startswith('Pss:'):
+                return int(line.split()[1])
+        for line in self._read(f'/proc/{pid}/status').splitlines():
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+        return 0
+
+    def sample(self) -> float:
+        """Measure the browser's memory now (MB) and update the peak."""
+        if not self.available:
+            return 0.0
+        pids = self._browser_pids()
+        self.current_mb = sum(self._process_kb(pid) for pid in pids) / 1024
+        if self.current_mb > self.peak_mb:
+            self.peak_mb = self.current_mb
+            self.peak_processes = len(pids)
+        return self.current_mb
+
+    def over_limit(self) -> bool:
+        limit = getattr(Config, 'browser_memory_limit_mb', None)
+        return bool(limit) and self.sample() > limit
+
+    def _run(self) -> None:
+        while not self._stop.wait(Config.memory_sample_interval):
+            try:
+                self.sample()
+            except Exception:
+                pass
+
+    def start(self) -> None:
+        if self.available and self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def report(self) -> None:
+        """Print the run's peak browser memory and the monitor process's own peak RSS."""
+        if not self.available or resource is None:
+            return
+        own_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f'Peak memory: browser {self.peak_mb:.0f} MB ({self.peak_processes} processes), '
+              f'monitor process {own_mb:.0f} MB')
+
+
+def _headed_context_options(user_agent: str) -> dict:
+    # Clearance cookies are tied to the user agent that earned them
+    return {
+        'user_agent': user_agent.replace('HeadlessChrome', 'Chrome'),
+        'viewport': dict(Config.server_viewport),
+    }
+
+
+def solve_headed(playwright, page, timeout: float) -> bool:
+    """Show a challenge from a headless tab in a temporary headed window for a human to solve.
+
+    The headless context's cookies are copied into the window, and the clearance cookies it
+    earns are copied back before the headless tab reloads.
+    """
+    if not can_open_window():
+        print('  No display available for a headed window; leaving the challenge unsolved.')
+        return False
+    print('  Opening a headed window — please solve the challenge there.')
+    browser = playwright.chromium.launch(channel='chromium', headless=False)
+    try:
+        context = browser.new_context(**_headed_context_options(page.evaluate('navigator.userAgent')))
+        context.add_cookies(page.context.cookies())
+        window = context.new_page()
+        detector = ChallengeDetector.for_page(window)
+        window.goto(page.url, wait_until='domcontentloaded', timeout=60000)
+        if not detector.is_challenged() or detector.wait_until_cleared(timeout=timeout):
+            page.context.add_cookies(context.cookies())
+            page.reload(wait_until='domcontentloaded', timeout=60000)
+            return not ChallengeDetector.for_page(page).is_challenged()
+        return False
+    finally:
+        browser.close()
+
+
+async def solve_headed_async(playwright, page, timeout: float) -> bool:
+    """Async counterpart of solve_headed."""
+    if not can_open_window():
+        print('  No display available for a headed window; leaving the challenge unsolved.')
+        return False
+    print('  Opening a headed window — please solve the challenge there.')
+    browser = await playwright.chromium.launch(channel='chromium', headless=False)
+    try:
+        context = await browser.new_context(**_headed_context_options(await page.evaluate('navigator.userAgent')))
+        await context.add_cookies(await page.context.cookies())
+        window = await context.new_page()
+        detector = ChallengeDetector.for_page(window)
+        await window.goto(page.url, wait_until='domcontentloaded', timeout=60000)
+        if not await detector.is_challenged_async() or await detector.wait_until_cleared_async(timeout=timeout):
+            await page.context.add_cookies(await context.cookies())
+            await page.reload(wait_until='domcontentloaded', timeout=60000)
+            return not await ChallengeDetector.for_page(page).is_challenged_async()
+        return False
+    finally:
+        await browser.close()
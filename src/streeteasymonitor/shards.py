@@ -0,0 +1,126 @@
+from .config import Config
+from .utils import get_areas
+
+
+class Shard:
+    """One independently run slice of a search: a subset of its areas and a price band.
+
+    Attributes:
+        areas (list[str]): Area names covered by the shard.
+        min_price (int): Lower bound of the shard's price band.
+        max_price (int): Upper bound of the shard's price band.
+        parent (Shard): The shard this one was split from (None for the whole search).
+        children (list[Shard]): Shards this one was split into for the current run.
+        count (int): Result count observed when the shard ran (None until then, or if unknown).
+    """
+
+    def __init__(self, areas, min_price, max_price, parent=None) -> None:
+        self.areas = sorted(areas)
+        self.min_price = min_price
+        self.max_price = max_price
+        self.parent = parent
+        self.children = []
+        self.count = None
+
+    @property
+    def key(self) -> str:
+        return f"{','.join(self.areas)}|{self.min_price}-{self.max_price}"
+
+    def kwargs(self, base: dict) -> dict:
+        """Search parameters for this shard, on top of the search it came from."""
+        return {**base, 'areas': self.areas, 'min_price': self.min_price, 'max_price': self.max_price}
+
+    def describe(self) -> str:
+        areas = ', '.join(self.areas) if len(self.areas) <= 3 else f'{len(self.areas)} areas'
+        return f'{areas}, ${self.min_price}-${self.max_price}'
+
+
+class ShardPlanner:
+    """Split wide searches into shards sized from the result counts of previous runs.
+
+    A search starts as one shard. A shard is split only when its last observed result count
+    exceeds Config.shard_target_results: first into its area groups (areas sharing a parent in
+    areas.json, e.g. the neighborhoods of one borough, with groups smaller than
+    Config.shard_min_group_areas merged into a neighbouring group), then into halves of its
+    areas, and finally, for a single area, into two price bands. After a run each shard's count is stored
+    together with the sums for the shards it was split from, so a split that has become small
+    again is run as one query next time.
+
+    Attributes:
+        parents (dict[str, int]): Area name -> parent area ID from areas.json.
+    """
+
+    parents: dict[str, int] = {area['name']: area.get('parent_id') for area in get_areas()}
+
+    def __init__(self, db) -> None:
+        self.db = db
+        self.target = Config.shard_target_results
+
+    def plan(self, kwargs: dict) -> list[Shard]:
+        """Return the shards to run for a search (just the whole search if it doesn't need splitting)."""
+        root = Shard(kwargs['areas'], kwargs['min_price'], kwargs['max_price'])
+        if not getattr(Config, 'shard_searches', False) or not root.areas:
+            return [root]
+        self.counts = self.db.get_shard_counts()
+        return self._expand(root)
+
+    def _expand(self, shard: Shard) -> list[Shard]:
+        # Without an observed count (first run, or a run that stopped at the watermark) the shard
+        # runs whole: splitting on a guess can only add page loads
+        estimate = self.counts.get(shard.key)
+        if estimate is None or estimate <= self.target:
+            return [shard]
+
+        shard.children = self._split(shard)
+        if not shard.children:
+            return [shard]
+        return [leaf for child in shard.children for leaf in self._expand(child)]
+
+    def _split(self, shard: Shard) -> list[Shard]:
+        groups = {}
+        for area in shard.areas:
+            groups.setdefault(ShardPlanner.parents.get(area), []).append(area)
+        # Fold groups too small to be worth their own page loads into the group before them
+        merged = []
+        for parent in sorted(groups, key=lambda parent_id: (parent_id is None, parent_id or 0)):
+            areas = groups[parent]
+            if merged and (len(areas) < Config.shard_min_group_areas or len(merged[-1]) < Config.shard_min_group_areas):
+                merged[-1] = merged[-1] + areas
+            else:
+                merged.append(list(areas))
+        if len(merged) > 1:
+            return [Shard(areas, shard.min_price, shard.max_price, shard) for areas in merged]
+
+        if len(shard.areas) > 1:
+            middle = len(shard.areas) // 2
+            return [
+                Shard(shard.areas[:middle], shard.min_price, shard.max_price, shard),
+                Shard(shard.areas[middle:], shard.min_price, shard.max_price, shard),
+            ]
+
+        if shard.max_price - shard.min_price >= 2 * Config.shard_min_price_band:
+            middle = (shard.min_price + shard.max_price) // 2
+            return [
+                Shard(shard.areas, shard.min_price, middle, shard),
+                Shard(shard.areas, middle + 1, shard.max_price, shard),
+            ]
+        return []
+
+    def record(self, shards: list[Shard]) -> None:
+        """Store the observed counts of the shards that ran and of every shard they were split from."""
+        counts = {}
+        for shard in shards:
+            if shard.count is None:
+                continue
+            counts[shard.key] = shard.count
+        # Parents are fully covered by their children, so their count is the children's sum
+        pending = {shard.parent for shard in shards if shard.parent}
+        while pending:
+            parent = pending.pop()
+            children = [counts.get(child.key) for child in parent.children]
+            if None not in children:
+                counts[parent.key] = sum(children)
+                if parent.parent:
+                    pending.add(parent.parent)
+        if counts:
+            self.db.save_shard_counts(counts)
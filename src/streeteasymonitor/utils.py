@@ -2,6 +2,7 @@ from datetime import datetime
 from dateutil.tz import gettz
 
 import csv
+import hashlib
 import json
 import os
 
@@ -18,11 +19,28 @@ def get_datetime() -> str:
     return f'[{date_now} - {time_now}]'
 
 
+def get_areas() -> list[dict]:
+    """Load StreetEasy's area list (id, name, level, parent_id)."""
+    with open(os.path.join(dir, 'data/areas.json'), 'r') as f:
+        return json.load(f)
+
+
 def get_area_map() -> dict[str, str]:
     """Load StreetEasy's area name and ID mapping."""
-    with open(os.path.join(dir, 'data/areas.json'), 'r') as f:
-        areas = json.load(f)
-    return {area['name']: area['id'] for area in areas}
+    return {area['name']: area['id'] for area in get_areas()}
+
+
+def to_number(value) -> float | None:
+    """Parse a numeric listing field ('3450', 2, '') as a float, or None if it's blank or not a number."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def content_hash(text: str) -> str:
+    """Short, stable hash of a piece of text (used to detect unchanged content)."""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
 
 
 def build_url(**kwargs) -> str:
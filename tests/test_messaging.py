@@ -0,0 +1,169 @@
+import argparse
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+import requests
+
+from graphql_standin import StandIn, make_handler
+from src.streeteasymonitor.config import Config
+from src.streeteasymonitor.database import Database
+from src.streeteasymonitor.messager import Messager
+
+
+class TempDatabase(Database):
+    """Database in a temporary directory instead of data/."""
+
+    def __init__(self, path):
+        self.db_path = str(path)
+        self._local = threading.local()
+        self._statements = {}
+        self._contacted = None
+        self.migrate()
+
+
+class FakeMonitor:
+    def __init__(self, db):
+        self.db = db
+        self.session = requests.Session()
+        self.config = self
+
+    @staticmethod
+    def get_field_values():
+        return {'message': 'Is this apartment still available?'}
+
+
+@pytest.fixture
+def standin_factory():
+    """Start a stand-in API with the given options; every server is shut down after the test."""
+    servers = []
+
+    def start(no_batching=False, no_persisted=False, reject_rate=0.0, standin_class=StandIn):
+        args = argparse.Namespace(no_batching=no_batching, no_persisted=no_persisted, latency=0, reject_rate=reject_rate)
+        standin = standin_class(args)
+        server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(standin))
+        server.RequestHandlerClass.log_message = lambda *args: None
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        Config.message_api_url = f'http://127.0.0.1:{server.server_address[1]}/'
+        return standin
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def messager(tmp_path, monkeypatch):
+    """Build a Messager against a temporary database, with the API's capabilities not yet known."""
+    monkeypatch.setattr(Config, 'dry_run', False)
+    monkeypatch.setattr(Config, 'export_csv', False)
+    monkeypatch.setattr(Config, 'message_api_url', Config.message_api_url)
+    monkeypatch.setattr(Config, 'message_rate_per_minute', 60000)
+    monkeypatch.setattr(Config, 'message_burst', 50)
+    monkeypatch.setattr(Config, 'message_persisted_queries', True)
+    monkeypatch.setattr(Config, 'outbox_poll_seconds', 0.05)
+    monkeypatch.setattr(Messager, 'bucket', None)
+    monkeypatch.setattr(Messager, 'persisted', None)
+    monkeypatch.setattr(Messager, 'batching', None)
+    monkeypatch.setattr(Messager, 'registered', set())
+    monkeypatch.setattr(Messager, 'announce', lambda self, listing: None)
+
+    monitor = FakeMonitor(TempDatabase(tmp_path / 'db.sqlite3'))
+    yield lambda: Messager(monitor, [])
+    monitor.db.close()
+
+
+def listings(count):
+    return [
+        {'listing_id': f'{4000000 + i}', 'url': f'https://streeteasy.com/rental/{4000000 + i}',
+         'address': f'{i} Test Street', 'neighborhood': 'Astoria', 'price': '2500'}
+        for i in range(count)
+    ]
+
+
+def deliver(make_messager, found):
+    sender = make_messager()
+    sender.start()
+    sender.submit(found)
+    sender.finish()
+    return sender
+
+
+def test_batched_delivery_uses_aliased_requests(messager, standin_factory, monkeypatch):
+    monkeypatch.setattr(Config, 'message_batch_size', 4)
+    standin = standin_factory()
+
+    sender = deliver(messager, listings(8))
+
+    assert sender.stats['sent'] == 8
+    assert standin.stats['sent'] == 8
+    assert standin.stats['operations'] == 16
+    # One startPageflow and one finishPageflow request per batch of four
+    assert standin.stats['requests'] == 4
+    assert Messager.batching is True
+    assert sender.db.get_outbox_counts() == {'sent': 8}
+
+
+def test_batches_fall_back_to_single_sends(messager, standin_factory, monkeypatch):
+    monkeypatch.setattr(Config, 'message_batch_size', 4)
+    standin = standin_factory(no_batching=True)
+
+    sender = deliver(messager, listings(6))
+
+    assert Messager.batching is False
+    assert sender.stats['sent'] == 6
+    assert standin.stats['sent'] == 6
+
+
+def test_persisted_query_miss_resends_full_query(messager, standin_factory, monkeypatch):
+    monkeypatch.setattr(Config, 'message_batch_size', 1)
+    standin = standin_factory()
+    sender = messager()
+
+    sender.get_pageflow_id('4000001')
+    assert Messager.persisted is True
+    # The server forgets registered queries (e.g. it restarted)
+    standin.queries.clear()
+
+    pageflow_id, reply_token = sender.get_pageflow_id('4000002')
+    assert pageflow_id and reply_token
+    assert standin.stats['hash_only'] == 1
+    assert Messager.persisted is True
+    assert sender.submit_message(pageflow_id, reply_token)
+
+
+def test_server_without_persisted_queries_gets_full_queries(messager, standin_factory, monkeypatch):
+    class NoPersistedQueries(StandIn):
+        # Ignores the extension and answers a bare hash with a generic error, not an APQ code
+        def handle(self, body):
+            if body.get('query') is None:
+                return 200, {'errors': [{'message': 'Must provide query string.'}]}
+            body.pop('extensions', None)
+            return super().handle(body)
+
+    monkeypatch.setattr(Config, 'message_batch_size', 1)
+    standin = standin_factory(standin_class=NoPersistedQueries)
+    sender = messager()
+
+    sender.get_pageflow_id('4000001')
+    pageflow_id, reply_token = sender.get_pageflow_id('4000002')
+
+    assert pageflow_id and reply_token
+    assert Messager.persisted is False
+    assert sender.submit_message(pageflow_id, reply_token)
+    assert standin.stats['sent'] == 1
+
+
+@pytest.mark.parametrize('batch_size', [1, 3])
+def test_rejected_submissions_are_not_recorded_as_sent(messager, standin_factory, monkeypatch, batch_size):
+    monkeypatch.setattr(Config, 'message_batch_size', batch_size)
+    standin_factory(reject_rate=1.0)
+
+    sender = deliver(messager, listings(3))
+
+    assert sender.stats['sent'] == 0
+    assert sender.stats['rejected'] == 3
+    assert sender.db.count_listings() == 0
+    assert 'sent' not in sender.db.get_outbox_counts()
@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+from src.streeteasymonitor.parsers import LxmlBackend, SoupBackend
+
+pytest.importorskip('lxml')
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def test_cards_match_bs4():
+    content = fixture('results_page.html')
+    cards = LxmlBackend().cards(content)
+    assert cards == SoupBackend().cards(content)
+    assert len(cards) == 4
+    assert cards[0]['url'] == 'https://streeteasy.com/building/the-astor/4b?featured=1'
+    assert cards[1]['title_text'] == 'Rental unit in Bushwick & Ridgewood'
+    assert '$9,999' not in cards[2]['price_text']
+    assert cards[3] == {'url': '', 'address': '', 'price_text': '', 'title_text': 'Sponsored'}
+
+
+def test_description_matches_bs4():
+    content = fixture('detail_page.html')
+    description = LxmlBackend().description(content)
+    assert description == SoupBackend().description(content)
+    assert description.startswith('Sun-drenched one bedroom with in-unit laundry & a renovated kitchen.')
+    assert description.endswith('Dishwasher Elevator')
+
+
+@pytest.mark.parametrize('text', ['lottery', 'margin', 'section 8', 'no fee'])
+def test_description_skips_script_style_template_and_comments(text):
+    assert text not in LxmlBackend().description(fixture('detail_page.html'))
+
+
+@pytest.mark.parametrize('content', [
+    '',
+    '<html><body><p>No description here</p></body></html>',
+    '<div class="listing-description">  Only   the fallback selector  </div>',
+    '<div class="PropertyDescription"><p>Partial</p><p>class match</p></div>',
+    '<div data-testid="listing-details-description"><script>var x="lottery";</script> Nice place <style>.a{}</style> text <template>tpl</template></div>',
+])
+def test_description_edge_cases_match_bs4(content):
+    assert LxmlBackend().description(content) == SoupBackend().description(content)
+
+
+def test_cards_without_results_match_bs4():
+    content = '<html><body><div class="NoResults">No listings match</div></body></html>'
+    assert LxmlBackend().cards(content) == SoupBackend().cards(content) == []